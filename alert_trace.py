@@ -0,0 +1,197 @@
+#alert latency tracing: stage timestamps from the first abnormal sample to Twilio's 201, with percentile summaries
+
+from clock import ticks_ms, ticks_diff
+
+# in path order; call_* and sms_* come from TwilioClient._post
+STAGES = ("detect", "cooldown", "enqueue",
+          "call_connect", "call_send", "call_response",
+          "sms_connect", "sms_send", "sms_response")
+
+
+class AlertTrace:
+    """Stage marks for one alert, as ms since its origin (the first abnormal sample)"""
+
+    def __init__(self, origin=None, kind="health"):
+        self.origin = ticks_ms() if origin is None else origin
+        self.kind = kind
+        self.marks = {}
+        self.ok = True
+
+    def mark(self, stage):
+        if stage not in self.marks:
+            self.marks[stage] = ticks_diff(ticks_ms(), self.origin)
+
+    def at(self, stage):
+        return self.marks.get(stage)
+
+    @property
+    def total(self):
+        """ms until the first Twilio 201 (call, else SMS), or None if neither succeeded"""
+        t = self.marks.get("call_response")
+        return t if t is not None else self.marks.get("sms_response")
+
+    def describe(self):
+        return " > ".join(f"{s} {self.marks[s]}" for s in STAGES if s in self.marks) + " ms"
+
+
+class TraceBuffer:
+    """The last `size` completed traces, with per-stage percentiles"""
+
+    def __init__(self, size=32, target_ms=10000):
+        self.traces = [None] * size
+        self.pos = 0
+        self.count = 0
+        self.size = size
+        self.target_ms = target_ms
+        self.suppressed = 0     # stopped by the cooldown
+        self.failed = 0         # no 201 from Twilio
+
+    def add(self, trace):
+        if trace.total is None:
+            trace.ok = False
+            self.failed += 1
+        self.traces[self.pos] = trace
+        self.pos = (self.pos + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def recent(self):
+        for k in range(self.count):
+            yield self.traces[(self.pos - self.count + k) % self.size]
+
+    def values(self, stage=None):
+        out = []
+        for t in self.recent():
+            v = t.total if stage is None else t.at(stage)
+            if v is not None:
+                out.append(v)
+        out.sort()
+        return out
+
+    @staticmethod
+    def percentile(sorted_values, p):
+        if not sorted_values:
+            return None
+        k = (len(sorted_values) - 1) * p / 100
+        lo = int(k)
+        hi = min(lo + 1, len(sorted_values) - 1)
+        return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+    def summary(self, stage=None):
+        v = self.values(stage)
+        if not v:
+            return None
+        pct = self.percentile
+        return {"n": len(v), "p50": round(pct(v, 50)), "p90": round(pct(v, 90)),
+                "p99": round(pct(v, 99)), "max": v[-1]}
+
+    def within_target(self):
+        """Fraction of recent alerts whose phone call (or SMS) was accepted within target_ms"""
+        n = ok = 0
+        for t in self.recent():
+            n += 1
+            if t.total is not None and t.total <= self.target_ms:
+                ok += 1
+        return ok / n if n else None
+
+    def report(self):
+        s = self.summary()
+        if s is None:
+            return f"no completed alerts ({self.failed} failed)"
+        frac = self.within_target()
+        return (f"alert to Twilio 201: p50 {s['p50']} ms, p90 {s['p90']} ms, max {s['max']} ms over "
+                f"{s['n']}; {frac * 100:.0f}% within {self.target_ms} ms")
+
+    def as_dict(self):
+        return {"total": self.summary(), "stages": {s: self.summary(s) for s in STAGES},
+                "within_target": self.within_target(), "target_ms": self.target_ms,
+                "suppressed": self.suppressed, "failed": self.failed}
+
+
+if __name__ == '__main__':
+    # The collar's delivery path against a local Twilio stand-in that injects
+    # connect and processing delays, driven through TwilioClient over http.
+    import contextlib
+    import io
+    import json
+    import random
+    import socket
+    import threading
+    import time
+
+    from twilio_client import TwilioClient
+
+    random.seed(11)
+
+    class TwilioStandIn:
+        """Answers POSTs with 201 after a delay; some connects are held back too"""
+
+        def __init__(self, accept_delay=(0.0, 0.05), process_delay=(0.15, 0.6), slow=0.1, slow_s=2.5):
+            self.sock = socket.socket()
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.sock.bind(("127.0.0.1", 0))
+            self.sock.listen(8)
+            self.port = self.sock.getsockname()[1]
+            self.accept_delay = accept_delay
+            self.process_delay = process_delay
+            self.slow = slow
+            self.slow_s = slow_s
+            self.requests = 0
+            threading.Thread(target=self.serve, daemon=True).start()
+
+        def serve(self):
+            while True:
+                conn, _ = self.sock.accept()
+                threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+        def handle(self, conn):
+            f = conn.makefile("rwb")
+            # server-side handshake/queueing time before the request is read
+            time.sleep(random.uniform(*self.accept_delay))
+            length = 0
+            f.readline()
+            while True:
+                line = f.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            f.read(length)
+            delay = random.uniform(*self.process_delay)
+            if random.random() < self.slow:
+                delay += self.slow_s
+            time.sleep(delay)
+            self.requests += 1
+            body = json.dumps({"sid": f"CA{self.requests:032d}", "status": "queued"}).encode()
+            f.write(b"HTTP/1.1 201 Created\r\nContent-Type: application/json\r\nContent-Length: "
+                    + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            f.flush()
+            conn.close()
+
+    standin = TwilioStandIn()
+    base = f"http://127.0.0.1:{standin.port}"
+    client = TwilioClient("ACxxxx", "token", "+15550001111", api_url=base + "/Calls.json",
+                          sms_api_url=base + "/Messages.json")
+    traces = TraceBuffer(size=64, target_ms=3000)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(60):
+            # abnormal sample, then the 15 s window rule and a retry cadence of readings
+            trace = AlertTrace(origin=ticks_ms() - random.choice((0, 0, 3000, 9000)))
+            trace.mark("detect")
+            time.sleep(random.uniform(0, 0.002))
+            trace.mark("cooldown")
+            trace.mark("enqueue")
+            client.make_call("+15552223333", "http://twimlets.com/message?Message=Alert", trace=trace)
+            client.send_sms("+15552223333", "PET HEALTH ALERT! Low SpO2", trace=trace)
+            traces.add(trace)
+
+    print(f"Stand-in answered {standin.requests} requests; {traces.report()}")
+    print(f"{'stage':15} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7}   (ms since the abnormal sample)")
+    for stage in STAGES:
+        s = traces.summary(stage)
+        if s:
+            print(f"{stage:15} {s['p50']:7} {s['p90']:7} {s['p99']:7} {s['max']:7}")
+    last = list(traces.recent())[-1]
+    print(f"Last trace: {last.describe()}")
@@ -0,0 +1,263 @@
+#adaptive per-pet baselines, EWMA mean/variance for every metric split by activity state
+
+import json
+import math
+
+from clock import ticks_ms, ticks_diff
+
+try:
+    import os
+except ImportError:
+    import uos as os
+
+
+class AdaptiveBaseline:
+    """Incremental EWMA mean/variance per (metric, activity state).
+
+    Memory is fixed at len(metrics) * states slots and every update is O(1),
+    so the model can run on the collar for the whole life of the pet. With a
+    path, changes are written at most once every save_interval seconds to
+    spare the flash; call save() on shutdown for the rest.
+    """
+
+    def __init__(self, metrics, states, alpha=0.05, warmup=30, min_std=None,
+                 path=None, save_interval=3600, ticks=ticks_ms):
+        self.metrics = tuple(metrics)
+        self.states = states
+        self.alpha = alpha
+        self.warmup = warmup
+        self.min_std = min_std or {}
+        self.path = path
+        self.save_interval = save_interval
+        self.ticks = ticks
+
+        size = len(self.metrics) * states
+        self.mean = [0.0] * size
+        self.var = [0.0] * size
+        self.count = [0] * size
+        self._index = {}
+        for i, name in enumerate(self.metrics):
+            self._index[name] = i * states
+        self._dirty = 0
+        self._saved = ticks()
+
+        if path:
+            self.load()
+
+    def _slot(self, metric, state):
+        if state < 0 or state >= self.states:
+            state = 0
+        return self._index[metric] + state
+
+    def ready(self, metric, state):
+        return self.count[self._slot(metric, state)] >= self.warmup
+
+    def expected(self, metric, state):
+        return self.mean[self._slot(metric, state)]
+
+    def score(self, metric, state, value):
+        """Signed deviation from the baseline in standard deviations"""
+        slot = self._slot(metric, state)
+        floor = self.min_std.get(metric, 0.0)
+        std = math.sqrt(self.var[slot] + floor * floor)
+        if std <= 0:
+            return 0.0
+        return (value - self.mean[slot]) / std
+
+    def update(self, metric, state, value):
+        slot = self._slot(metric, state)
+        n = self.count[slot] + 1
+        alpha = self.alpha
+        if n * alpha < 1:
+            alpha = 1.0 / n
+        diff = value - self.mean[slot]
+        incr = alpha * diff
+        self.mean[slot] += incr
+        self.var[slot] = (1 - alpha) * (self.var[slot] + diff * incr)
+        if n < 65535:
+            self.count[slot] = n
+        self._changed()
+
+    def nudge(self, metric, state, value, alpha, limit_z):
+        """Move the mean slightly towards an anomaly.
+
+        The value is clamped to limit_z standard deviations and the variance
+        is left alone, so a brief incident hardly shifts the baseline but a
+        lasting change is learned in the end.
+        """
+        slot = self._slot(metric, state)
+        floor = self.min_std.get(metric, 0.0)
+        limit = limit_z * math.sqrt(self.var[slot] + floor * floor)
+        diff = value - self.mean[slot]
+        if diff > limit:
+            diff = limit
+        elif diff < -limit:
+            diff = -limit
+        self.mean[slot] += alpha * diff
+        self._changed()
+
+    def _changed(self):
+        self._dirty += 1
+        if self.path and ticks_diff(self.ticks(), self._saved) >= self.save_interval * 1000:
+            self.save()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        try:
+            if data.get('metrics') != list(self.metrics) or data.get('states') != self.states:
+                print(" Baseline file does not match current metrics, starting fresh")
+                return False
+
+            size = len(self.mean)
+            if len(data['mean']) != size or len(data['var']) != size or len(data['count']) != size:
+                return False
+
+            mean = [float(v) for v in data['mean']]
+            var = [float(v) for v in data['var']]
+            count = [int(v) for v in data['count']]
+        except (KeyError, AttributeError, TypeError, ValueError):
+            print(" Baseline file is malformed, starting fresh")
+            return False
+        self.mean = mean
+        self.var = var
+        self.count = count
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        # a failed write is retried after the next interval, not on every update
+        self._saved = self.ticks()
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({
+                    'metrics': list(self.metrics),
+                    'states': self.states,
+                    'mean': self.mean,
+                    'var': self.var,
+                    'count': self.count,
+                }, f)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(tmp, self.path)
+            self._dirty = 0
+        except OSError as e:
+            print(f" Baseline save failed: {e}")
+
+
+if __name__ == '__main__':
+    # Replay synthetic traces through analyze_health, with and without a
+    # baseline, and compare false alerts. None of these traces contain an
+    # incident, so every alert counted here is a false one.
+    import random
+    import config
+    from health_rules import analyze_health, baseline_deviation
+
+    random.seed(1)
+
+    def cat_trace(n):
+        # resting cat: heart rate 160-200 BPM is normal
+        for _ in range(n):
+            yield 0, round(random.gauss(97, 1)), round(random.gauss(185, 8)), random.gauss(0.05, 0.02)
+
+    def greyhound_trace(n):
+        # greyhound: rest at 70 BPM, sprints at 200+ BPM
+        for i in range(n):
+            if (i // 200) % 2:
+                yield 1, round(random.gauss(96, 1.5)), round(random.gauss(215, 10)), random.gauss(8.0, 2.0)
+            else:
+                yield 0, round(random.gauss(97, 1)), round(random.gauss(70, 5)), random.gauss(0.1, 0.05)
+
+    for name, trace in (("resting cat", cat_trace), ("greyhound", greyhound_trace)):
+        model = AdaptiveBaseline(("spo2", "heart_rate", "motion"), 2,
+                                 alpha=config.BASELINE_ALPHA,
+                                 warmup=config.BASELINE_WARMUP_SAMPLES,
+                                 min_std=config.BASELINE_MIN_STD)
+        static_alerts = 0
+        adaptive_alerts = 0
+        readings = 0
+        for state, spo2, hr, motion in trace(5000):
+            readings += 1
+            if analyze_health(spo2, hr, motion, None, state)[0] >= config.ABNORMAL_COUNT_THRESHOLD:
+                static_alerts += 1
+            if analyze_health(spo2, hr, motion, None, state, model)[0] >= config.ABNORMAL_COUNT_THRESHOLD:
+                adaptive_alerts += 1
+
+        print(f"{name}: {readings} readings")
+        print(f"   static thresholds: {static_alerts} false alerts ({100.0 * static_alerts / readings:.2f}%)")
+        print(f"   adaptive baseline: {adaptive_alerts} false alerts ({100.0 * adaptive_alerts / readings:.2f}%)")
+        assert adaptive_alerts * 10 < static_alerts, (name, static_alerts, adaptive_alerts)
+
+    # A lasting step in resting heart rate (new medication) and a two-minute
+    # incident: how long each stays flagged, and how far the incident moves
+    # the baseline. baseline_deviation nudges on anomalies; the reference
+    # leaves them out, as before.
+    def flagged_span(shipped, trace):
+        model = AdaptiveBaseline(("heart_rate",), 1, alpha=config.BASELINE_ALPHA,
+                                 warmup=config.BASELINE_WARMUP_SAMPLES, min_std=config.BASELINE_MIN_STD)
+        last = None
+        for i, hr in enumerate(trace):
+            if shipped:
+                z = baseline_deviation(model, "heart_rate", 0, hr)
+                if z is not None and abs(z) > config.BASELINE_Z_THRESHOLD:
+                    last = i
+            elif model.ready("heart_rate", 0) and abs(model.score("heart_rate", 0, hr)) > config.BASELINE_Z_THRESHOLD:
+                last = i
+            else:
+                model.update("heart_rate", 0, hr)
+        return last, model.expected("heart_rate", 0)
+
+    random.seed(2)
+    step = [random.gauss(80, 2) for _ in range(2000)] + [random.gauss(125, 2) for _ in range(4000)]
+    incident = [random.gauss(80, 2) for _ in range(2000)] + [170.0] * 40
+    for label, shipped in (("anomalies left out", False), ("baseline_deviation", True)):
+        last, _ = flagged_span(shipped, step)
+        _, after = flagged_span(shipped, incident)
+        learned = "forever" if last == len(step) - 1 else f"for {(last - 1999) * 3 / 60:.0f} min"
+        print(f"{label}: 80 -> 125 BPM step flagged {learned}; "
+              f"2 min at 170 BPM moves the baseline to {after:.1f} BPM")
+    assert last < len(step) - 1 and after < 85, (last, after)
+
+    # Flash writes over a day of readings every 3 s (4 metrics each)
+    class FakeTicks:
+        ms = 0
+
+        def __call__(self):
+            return self.ms
+
+    ticks = FakeTicks()
+    path = "/tmp/baseline_demo.json"
+    model = AdaptiveBaseline(("spo2", "heart_rate", "motion", "rmssd"), 1, path=path,
+                             save_interval=config.BASELINE_SAVE_INTERVAL, ticks=ticks)
+    saves = 0
+    save = model.save
+
+    def counted_save():
+        global saves
+        saves += 1
+        save()
+
+    model.save = counted_save
+    for _ in range(86400 // 3):
+        ticks.ms += 3000
+        for metric in model.metrics:
+            model.update(metric, 0, random.gauss(50, 5))
+    print(f"Baseline saves in a day: {saves} (one per {config.BASELINE_SAVE_INTERVAL} s)")
+    assert saves == 86400 // config.BASELINE_SAVE_INTERVAL, saves
+
+    for text in ('[1, 2]', '{"metrics": ["heart_rate"], "states": 1}', '{"metrics": ["heart_rate"], "states": 1, '
+                 '"mean": [80], "var": [16], "count": ["x"]}', '{"metrics": 5}'):
+        with open(path, "w") as f:
+            f.write(text)
+        model = AdaptiveBaseline(("heart_rate",), 1, path=path)
+        assert model.count == [0], text
+    os.remove(path)
+    print("Malformed baseline files: all ignored, starting fresh")
@@ -0,0 +1,84 @@
+#precompile the collar modules to .mpy with mpy-cross (host tool), or write a manifest to freeze them into firmware
+#
+#   python build_mpy.py --arch xtensawin            # build/*.mpy, copy with: mpremote cp -r build/ :
+#   python build_mpy.py --manifest manifest.py      # for FROZEN_MANIFEST in a MicroPython port build
+#
+# Precompiled modules skip parsing and compiling on the device at boot; frozen
+# ones also run their bytecode straight from flash. main entry (pet_health_monitoring.py)
+# stays a .py so it can be edited in place; config.py stays a .py so settings can be changed.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+DEVICE_MODULES = (
+    "activity", "alert_trace", "baseline", "bus_health", "calibration", "clock", "device_registry", "gps_module", "health_rules", "health_window",
+    "history", "hrv", "impact", "max30102_1", "mpu6050_1", "orientation",
+    "power", "ppg_control", "recorder", "sampler", "screen", "status_server", "telemetry", "twilio_client", "wifi_manager",
+)
+
+KEEP_SOURCE = ("config", "pet_health_monitoring", "sensor_monitor")
+
+
+def _compiler():
+    """mpy-cross on PATH, or the mpy_cross pip package"""
+    exe = shutil.which("mpy-cross")
+    if exe:
+        return [exe]
+    try:
+        import mpy_cross  # noqa: F401
+    except ImportError:
+        return None
+    return [sys.executable, "-m", "mpy_cross"]
+
+
+def build(src_dir, out_dir, arch=None, opt=2):
+    cmd = _compiler()
+    if cmd is None:
+        raise SystemExit("mpy-cross not found: install it (pip install mpy-cross) or build it from micropython/mpy-cross")
+    os.makedirs(out_dir, exist_ok=True)
+    total_py = total_mpy = 0
+    start = time.perf_counter()
+    for name in DEVICE_MODULES:
+        src = os.path.join(src_dir, name + ".py")
+        dst = os.path.join(out_dir, name + ".mpy")
+        args = cmd + ["-O%d" % opt, "-o", dst]
+        if arch:
+            args.append("-march=" + arch)
+        subprocess.run(args + [src], check=True)
+        total_py += os.path.getsize(src)
+        total_mpy += os.path.getsize(dst)
+        print(f"   {name + '.py':22} {os.path.getsize(src):7,} -> {os.path.getsize(dst):7,} bytes")
+    for name in KEEP_SOURCE:
+        shutil.copy(os.path.join(src_dir, name + ".py"), out_dir)
+    print(f" Built {len(DEVICE_MODULES)} modules in {time.perf_counter() - start:.1f}s: "
+          f"{total_py:,} bytes of source -> {total_mpy:,} bytes of .mpy")
+    print(f" Copy {out_dir}/ to the device root; remove the matching .py files there, "
+          f"they take precedence over .mpy")
+
+
+def write_manifest(path, src_dir):
+    src_dir = os.path.abspath(src_dir)
+    with open(path, "w") as f:
+        f.write("# freeze the collar modules; use with FROZEN_MANIFEST=" + os.path.abspath(path) + "\n")
+        f.write('include("$(PORT_DIR)/boards/manifest.py")\n')
+        for name in DEVICE_MODULES:
+            f.write(f'module("{name}.py", base_path="{src_dir}", opt=2)\n')
+    print(f" Wrote {path} ({len(DEVICE_MODULES)} modules)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Precompile or freeze the collar modules")
+    parser.add_argument("--src", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--out", default="build")
+    parser.add_argument("--arch", help="native arch for @native code, e.g. xtensawin (ESP32), armv6m (RP2040)")
+    parser.add_argument("-O", dest="opt", type=int, default=2, help="mpy-cross optimisation level")
+    parser.add_argument("--manifest", help="write a freeze manifest instead of building .mpy files")
+    args = parser.parse_args()
+    if args.manifest:
+        write_manifest(args.manifest, args.src)
+    else:
+        build(args.src, args.out, args.arch, args.opt)
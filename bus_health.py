@@ -0,0 +1,442 @@
+#I2C bus health: per-device circuit breakers, bounded retries, slow-call timeouts and SCL-toggle bus recovery
+
+try:
+    import errno
+except ImportError:
+    import uerrno as errno
+
+from clock import ticks_ms, ticks_us, ticks_diff, ticks_add, sleep_us
+
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+STATE_NAMES = ("closed", "open", "half-open")
+
+ENODEV = getattr(errno, "ENODEV", 19)
+ETIMEDOUT = getattr(errno, "ETIMEDOUT", 110)
+
+
+class Breaker:
+    """Consecutive-failure circuit breaker for one device.
+
+    After `threshold` failed calls in a row the breaker opens and calls are
+    refused without touching the bus for the backoff, which doubles each time
+    it trips again (up to max_backoff_ms). When the backoff runs out one call
+    is let through: success closes the breaker, failure reopens it.
+    """
+
+    def __init__(self, name, timeout_us, threshold=3, backoff_ms=2000, max_backoff_ms=60000):
+        self.name = name
+        self.timeout_us = timeout_us
+        self.threshold = threshold
+        self.base_ms = backoff_ms
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.state = CLOSED
+        self.failures = 0
+        self.until = 0
+
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.skipped = 0
+        self.trips = 0
+
+    def allow(self, now):
+        if self.state == OPEN:
+            if ticks_diff(now, self.until) < 0:
+                return False
+            self.state = HALF_OPEN
+        return True
+
+    def success(self):
+        if self.state != CLOSED:
+            print(f" I2C {self.name} responding again")
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff_ms = self.base_ms
+
+    def failure(self, now):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.threshold:
+            self.state = OPEN
+            self.until = ticks_add(now, self.backoff_ms)
+            self.trips += 1
+            print(f" I2C {self.name} failing: skipped for {self.backoff_ms} ms")
+            self.backoff_ms = min(self.backoff_ms * 2, self.max_backoff_ms)
+
+    def as_dict(self):
+        return {"state": STATE_NAMES[self.state], "calls": self.calls, "errors": self.errors,
+                "timeouts": self.timeouts, "retries": self.retries, "skipped": self.skipped,
+                "trips": self.trips}
+
+
+class BusGuard:
+    """Drop-in wrapper for machine.I2C that keeps a failing device from stalling the loop.
+
+    Drivers get the guard in place of the bus. Each device, keyed by mux
+    channel (tracked from writes to the mux address) and address, has its
+    own Breaker and timeout. A call that raises is retried up to `retries`
+    times; a call that completes but takes longer than the device timeout
+    (clock stretching, a slow FIFO) returns its data but counts as a
+    failure. An ETIMEDOUT means a slave may be holding SDA, so the bus is
+    recovered before the retry. Retries and recoveries stop once this
+    cycle's failed calls have used `budget_ms`; begin_cycle() resets it.
+    """
+
+    def __init__(self, i2c, make_bus=None, scl_pin=None, sda_pin=None, mux_address=None,
+                 retries=1, timeout_us=5000, threshold=3, backoff_ms=2000, max_backoff_ms=60000,
+                 budget_ms=100, pin_class=None):
+        self.i2c = i2c
+        self.make_bus = make_bus
+        self.scl_pin = scl_pin
+        self.sda_pin = sda_pin
+        self.mux_address = mux_address
+        self.retries = retries
+        self.timeout_us = timeout_us
+        self.threshold = threshold
+        self.backoff_ms = backoff_ms
+        self.max_backoff_ms = max_backoff_ms
+        self.budget_us = budget_ms * 1000
+        self.pin_class = pin_class
+        self.timeouts = {}      # address -> us, overriding timeout_us
+        self.breakers = {}      # (channel + 1) << 8 | address -> Breaker
+        self.on_recover = []    # callables run after a bus recovery
+        self._prefix = 0
+        self.spent_us = 0
+
+        self.recoveries = 0
+        self.recovery_failed = 0
+        self.budget_exhausted = 0
+
+    def set_timeout(self, address, timeout_us):
+        self.timeouts[address] = timeout_us
+        for key, br in self.breakers.items():
+            if key & 0xFF == address:
+                br.timeout_us = timeout_us
+
+    def _key(self, address, channel=None):
+        if address == self.mux_address or channel is None:
+            return address
+        return (channel + 1) << 8 | address
+
+    def breaker(self, address, channel=None):
+        key = self._key(address, channel)
+        br = self.breakers.get(key)
+        if br is None:
+            where = "" if key < 256 else f"ch{(key >> 8) - 1}/"
+            br = Breaker(f"{where}0x{address:02X}", self.timeouts.get(address, self.timeout_us),
+                         self.threshold, self.backoff_ms, self.max_backoff_ms)
+            self.breakers[key] = br
+        return br
+
+    def is_open(self, address, channel=None):
+        br = self.breakers.get(self._key(address, channel))
+        return br is not None and br.state == OPEN
+
+    def begin_cycle(self):
+        self.spent_us = 0
+
+    def _call(self, addr, name, *args):
+        key = addr if addr == self.mux_address else self._prefix | addr
+        br = self.breakers.get(key)
+        if br is None:
+            br = self.breaker(addr, (key >> 8) - 1 if key > 255 else None)
+        br.calls += 1
+        if br.state == OPEN and not br.allow(ticks_ms()):
+            br.skipped += 1
+            raise OSError(ENODEV)
+        tries = 0
+        while True:
+            start = ticks_us()
+            try:
+                result = getattr(self.i2c, name)(*args)
+            except OSError as e:
+                self.spent_us += ticks_diff(ticks_us(), start)
+                br.errors += 1
+                hung = e.args and e.args[0] == ETIMEDOUT
+                if hung:
+                    br.timeouts += 1
+                if self.spent_us >= self.budget_us:
+                    self.budget_exhausted += 1
+                    br.failure(ticks_ms())
+                    raise
+                if hung:
+                    self.recover()
+                if tries < self.retries:
+                    tries += 1
+                    br.retries += 1
+                    continue
+                br.failure(ticks_ms())
+                raise
+            took = ticks_diff(ticks_us(), start)
+            if took > br.timeout_us:
+                self.spent_us += took
+                br.timeouts += 1
+                br.failure(ticks_ms())
+            elif br.failures:
+                br.success()
+            return result
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._call(addr, "readfrom_mem", addr, memaddr, nbytes)
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        return self._call(addr, "readfrom_mem_into", addr, memaddr, buf)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        return self._call(addr, "writeto_mem", addr, memaddr, buf)
+
+    def readfrom(self, addr, nbytes):
+        return self._call(addr, "readfrom", addr, nbytes)
+
+    def readfrom_into(self, addr, buf):
+        return self._call(addr, "readfrom_into", addr, buf)
+
+    def writeto(self, addr, buf):
+        n = self._call(addr, "writeto", addr, buf)
+        if addr == self.mux_address:
+            mask = buf[0]
+            prefix = 0
+            if mask and not mask & (mask - 1):
+                channel = 0
+                while mask > 1:
+                    mask >>= 1
+                    channel += 1
+                prefix = (channel + 1) << 8
+            self._prefix = prefix
+        return n
+
+    def scan(self):
+        return self.i2c.scan()
+
+    def recover(self):
+        """Clock out a slave holding SDA (up to 9 SCL pulses, then a STOP) and rebuild the bus"""
+        self.recoveries += 1
+        freed = True
+        if self.scl_pin is not None and self.sda_pin is not None:
+            Pin = self.pin_class
+            if Pin is None:
+                from machine import Pin
+            scl = Pin(self.scl_pin, Pin.OPEN_DRAIN, value=1)
+            sda = Pin(self.sda_pin, Pin.IN, Pin.PULL_UP)
+            for _ in range(9):
+                if sda.value():
+                    break
+                scl.value(0)
+                sleep_us(5)
+                scl.value(1)
+                sleep_us(5)
+            freed = sda.value() == 1
+            # STOP: SDA rises while SCL is high
+            sda.init(Pin.OPEN_DRAIN, value=0)
+            sleep_us(5)
+            sda.value(1)
+        if self.make_bus:
+            self.i2c = self.make_bus()
+        self._prefix = 0
+        if not freed:
+            self.recovery_failed += 1
+            print(" I2C recovery failed: SDA still held low")
+        for fn in self.on_recover:
+            fn()
+        return freed
+
+    def stats(self):
+        out = {"recoveries": self.recoveries, "recovery_failed": self.recovery_failed,
+               "budget_exhausted": self.budget_exhausted, "devices": {}}
+        for br in self.breakers.values():
+            out["devices"][br.name] = br.as_dict()
+        return out
+
+
+if __name__ == '__main__':
+    # The collar's sensors (MPU6050 on channels 0 and 3, MAX30102 on 1) on a
+    # fake bus that injects faults: an unplugged IMU that NACKs, a PPG that
+    # hangs the bus until SCL is clocked, and an IMU that stretches the
+    # clock. Each cycle reads every sensor once, first straight on the bus
+    # (errors caught, as read_sensors does) and then through the guard.
+    import contextlib
+    import io
+    import time
+
+    from device_registry import Mux
+    from mpu6050_1 import MPU6050
+    from max30102_1 import MAX30102
+
+    HW_TIMEOUT_S = 0.005     # the I2C peripheral's own timeout on a stuck bus
+    CYCLES = 240
+
+    class FaultyBus:
+        def __init__(self, faults):
+            self.faults = faults      # (channel, address) -> (mode, first cycle, last cycle)
+            self.cycle = 0
+            self.enabled = 0
+            self.stuck = False
+            self.calls = 0
+
+        def _check(self, addr):
+            self.calls += 1
+            if self.stuck:
+                time.sleep(HW_TIMEOUT_S)
+                raise OSError(ETIMEDOUT)
+            if addr == 0x70:
+                return
+            channel = None
+            for ch in range(8):
+                if self.enabled & (1 << ch):
+                    channel = ch
+            fault = self.faults.get((channel, addr))
+            if fault is None or not fault[1] <= self.cycle <= fault[2]:
+                return
+            mode = fault[0]
+            if mode == "nack":
+                raise OSError(5)       # EIO, no ACK
+            if mode == "hang":
+                self.stuck = True
+                time.sleep(HW_TIMEOUT_S)
+                raise OSError(ETIMEDOUT)
+            if mode == "slow":
+                time.sleep(0.008)
+
+        def writeto(self, addr, buf):
+            self._check(addr)
+            if addr == 0x70:
+                self.enabled = buf[0]
+            return len(buf)
+
+        def writeto_mem(self, addr, reg, buf):
+            self._check(addr)
+
+        def readfrom_mem(self, addr, reg, n):
+            self._check(addr)
+            return bytes([5]) if reg == 4 else bytes(n)
+
+        def readfrom_mem_into(self, addr, reg, buf):
+            self._check(addr)
+
+        def scan(self):
+            return []
+
+    class FakePin:
+        OPEN_DRAIN = 2
+        IN = 0
+        PULL_UP = 1
+        bus = None
+        clocks = 0
+
+        def __init__(self, pin, mode=0, pull=None, value=None):
+            self.pin = pin
+
+        def init(self, mode=0, value=None):
+            pass
+
+        def value(self, v=None):
+            if v is None:
+                # SDA reads high once the stuck slave has been clocked out
+                return 0 if self.pin == 4 and FakePin.bus.stuck else 1
+            if self.pin == 5 and v == 1:
+                FakePin.clocks += 1
+                if FakePin.clocks % 3 == 0:
+                    FakePin.bus.stuck = False
+
+    # log every breaker state change; BusGuard builds its breakers from this name
+    transitions = {}
+
+    class LoggedBreaker(Breaker):
+        @property
+        def state(self):
+            return self._state
+
+        @state.setter
+        def state(self, value):
+            log = transitions.setdefault(self.name, [])
+            if not log or log[-1] != value:
+                log.append(value)
+            self._state = value
+
+    Breaker = LoggedBreaker
+
+    faults = {(3, 0x68): ("nack", 30, 90), (1, 0x57): ("hang", 110, 150), (0, 0x68): ("slow", 180, 200)}
+
+    def run(guarded):
+        bus = FaultyBus(faults)
+        FakePin.bus = bus
+        FakePin.clocks = 0
+        i2c = bus
+        guard = None
+        if guarded:
+            guard = BusGuard(bus, make_bus=lambda: bus, scl_pin=5, sda_pin=4, mux_address=0x70,
+                             retries=1, timeout_us=3000, threshold=3, backoff_ms=40,
+                             max_backoff_ms=400, budget_ms=20, pin_class=FakePin)
+            guard.set_timeout(0x57, 6000)
+            i2c = guard
+        mux = Mux(i2c)
+        sensors = []
+        for ch, cls in ((0, MPU6050), (1, MAX30102), (3, MPU6050)):
+            mux.select(ch)
+            sensors.append((ch, cls(i2c, 0x57 if cls is MAX30102 else 0x68)))
+        if guard:
+            guard.on_recover.append(mux.invalidate)
+        buf = bytearray(14)
+        times = []
+        lost = 0
+        for cycle in range(CYCLES):
+            bus.cycle = cycle
+            if guard:
+                guard.begin_cycle()
+            start = time.perf_counter()
+            for ch, dev in sensors:
+                try:
+                    mux.select(ch)
+                    if isinstance(dev, MAX30102):
+                        dev.read_fifo()
+                    else:
+                        dev.read_imu_raw_into(buf)
+                except OSError:
+                    lost += 1
+            times.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.002)
+        return times, lost, bus, guard
+
+    def healthy_calls(guarded, n=20000):
+        bus = FaultyBus({})
+        i2c = BusGuard(bus, mux_address=0x70) if guarded else bus
+        buf = bytearray(14)
+        start = time.perf_counter()
+        for _ in range(n):
+            i2c.readfrom_mem_into(0x68, 0x3B, buf)
+        return (time.perf_counter() - start) / n * 1e6
+
+    print(f"{CYCLES} cycles of 3 sensors; NACKs on ch3/0x68 cycles 30-90, ch1/0x57 hangs the bus "
+          f"110-150, ch0/0x68 stretches 8 ms 180-200")
+    print(f"{'':9} {'p50 ms':>7} {'p99 ms':>7} {'max ms':>7} {'cycles >20 ms':>14} {'lost reads':>11} {'bus calls':>10}")
+    for guarded in (False, True):
+        transitions.clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            times, lost, bus, guard = run(guarded)
+        t = sorted(times)
+        print(f"{'guarded' if guarded else 'raw bus':9} {t[len(t) // 2]:7.2f} {t[len(t) * 99 // 100]:7.2f} "
+              f"{t[-1]:7.2f} {sum(1 for x in t if x > 20):14} {lost:11} {bus.calls:10}")
+    s = guard.stats()
+    print(f"Guard: {s['recoveries']} recoveries ({s['recovery_failed']} failed), "
+          f"budget exhausted {s['budget_exhausted']} times")
+    for name, d in sorted(s["devices"].items()):
+        print(f"   {name:9} {d['state']:9} calls {d['calls']:5}  errors {d['errors']:4}  "
+              f"timeouts {d['timeouts']:3}  retries {d['retries']:3}  skipped {d['skipped']:5}  trips {d['trips']}")
+    dev = s["devices"]
+    assert dev["ch3/0x68"]["trips"] >= 1 and dev["ch3/0x68"]["skipped"] > 0
+    assert dev["ch1/0x57"]["trips"] >= 1 and s["recoveries"] >= 1 and not bus.stuck
+    assert dev["ch0/0x68"]["timeouts"] >= 3 and dev["ch0/0x68"]["trips"] >= 1
+    assert all(d["state"] == "closed" for d in dev.values()), dev
+    # closed -> open after the threshold, open -> half-open when the backoff
+    # runs out, then one probe: half-open -> closed or straight back to open
+    legal = {(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (HALF_OPEN, CLOSED)}
+    for name, log in transitions.items():
+        print(f"   {name:9} " + " > ".join(STATE_NAMES[x] for x in log))
+        assert all(step in legal for step in zip(log, log[1:])), (name, log)
+        assert log[-1] == CLOSED and log.count(OPEN) == dev[name]["trips"], (name, log)
+    for name in ("ch3/0x68", "ch1/0x57", "ch0/0x68"):
+        assert transitions[name][:3] == [CLOSED, OPEN, HALF_OPEN] and transitions[name][-2:] == [HALF_OPEN, CLOSED]
+    print(f"Healthy read: raw {healthy_calls(False):.2f} us, guarded {healthy_calls(True):.2f} us per call (host)")
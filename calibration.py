@@ -0,0 +1,271 @@
+#MPU6050 bias calibration: average a still burst into the chip's offset registers, cached per device in flash
+
+import json
+import math
+
+try:
+    import os
+except ImportError:
+    import uos as os
+
+from clock import ticks_ms, ticks_diff, sleep_ms
+
+ACCEL_REG_LSB = 2048    # accel offset registers: LSB per g (+-16 g scale)
+GYRO_REG_LSB = 32.8     # gyro offset registers: LSB per dps (+-1000 dps scale)
+
+
+def device_key(channel, address):
+    where = "" if channel is None else f"ch{channel}/"
+    return f"{where}0x{address:02X}"
+
+
+def measure(mpu, samples=400, period_ms=2):
+    """Mean and standard deviation of raw ax, ay, az, gx, gy, gz over a burst of IMU reads.
+
+    Sums are taken relative to the first sample so they stay small ints.
+    """
+    buf = bytearray(14)
+    ref = None
+    s = [0] * 6
+    sq = [0] * 6
+    for _ in range(samples):
+        mpu.read_imu_raw_into(buf)
+        values = [(buf[i] << 8 | buf[i + 1]) - ((buf[i] & 0x80) << 9) for i in (0, 2, 4, 8, 10, 12)]
+        if ref is None:
+            ref = values
+        for k in range(6):
+            d = values[k] - ref[k]
+            s[k] += d
+            sq[k] += d * d
+        sleep_ms(period_ms)
+    mean = [ref[k] + s[k] / samples for k in range(6)]
+    std = [math.sqrt(max(0, sq[k] / samples - (s[k] / samples) ** 2)) for k in range(6)]
+    return mean, std
+
+
+def bias_summary(mpu, mean, target):
+    """Per-axis accel error in mg and gyro rate in dps, for reporting"""
+    accel = [round((mean[i] - target[i]) * 1000 / mpu.accel_lsb, 1) for i in range(3)]
+    gyro = [round(mean[3 + i] / mpu.gyro_lsb, 3) for i in range(3)]
+    return {"accel_mg": accel, "gyro_dps": gyro}
+
+
+class MPUCalibration:
+    """Offsets for every MPU6050 on the collar, keyed by mux channel and address.
+
+    The first boot averages a still burst, writes the corrections into the
+    chip's offset registers and saves the register values; later boots
+    write the saved values back, a few ms instead of a second of sampling.
+    Chips whose offset registers do not read back get a software bias
+    instead. Gyro bias is always corrected; accel only when the collar lies
+    close to level on one axis, since the reference (1 g on that axis) is
+    otherwise unknown.
+    """
+
+    def __init__(self, path="mpu_cal.json", samples=400, period_ms=2, settle_ms=100,
+                 max_gyro_std_dps=0.5, max_accel_std_mg=15, max_tilt_mg=170, probe=40):
+        self.path = path
+        self.samples = samples
+        self.probe = probe
+        self.period_ms = period_ms
+        self.settle_ms = settle_ms
+        self.max_gyro_std_dps = max_gyro_std_dps
+        self.max_accel_std_mg = max_accel_std_mg
+        self.max_tilt_mg = max_tilt_mg
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            os.rename(tmp, self.path)
+        except OSError as e:
+            print(f" Calibration save failed: {e}")
+
+    def apply(self, mpu, key):
+        """Restore saved offsets; False when this device has none"""
+        entry = self.entries.get(key)
+        if not entry:
+            return False
+        if entry["hw"]:
+            mpu.write_offsets(entry["accel"], entry["gyro"])
+        else:
+            mpu.set_software_bias(entry["accel"], entry["gyro"])
+        return True
+
+    def calibrate(self, mpu, key):
+        """Measure and correct the bias; returns the saved entry, or None if the collar was moving"""
+        recorder = mpu.recorder
+        mpu.recorder = None
+        try:
+            sleep_ms(self.settle_ms)
+            # a short probe first, so a collar being worn costs ~100 ms, not the full burst
+            for n in (self.probe, self.samples):
+                mean, std = measure(mpu, n, self.period_ms)
+                accel_std = max(std[:3]) * 1000 / mpu.accel_lsb
+                gyro_std = max(std[3:]) / mpu.gyro_lsb
+                if accel_std > self.max_accel_std_mg or gyro_std > self.max_gyro_std_dps:
+                    print(f" {key} moving during calibration (accel {accel_std:.0f} mg, "
+                          f"gyro {gyro_std:.2f} dps rms), keeping it uncorrected")
+                    return None
+
+            # gravity belongs on the axis closest to vertical
+            axis = 0
+            for i in (1, 2):
+                if abs(mean[i]) > abs(mean[axis]):
+                    axis = i
+            target = [0, 0, 0]
+            target[axis] = mpu.accel_lsb if mean[axis] > 0 else -mpu.accel_lsb
+            level = True
+            for i in range(3):
+                if i != axis and abs(mean[i]) * 1000 / mpu.accel_lsb > self.max_tilt_mg:
+                    level = False
+            before = bias_summary(mpu, mean, target)
+
+            accel_fix = [0, 0, 0]
+            if level:
+                accel_fix = [round((mean[i] - target[i]) * ACCEL_REG_LSB / mpu.accel_lsb) for i in range(3)]
+            gyro_fix = [round(mean[3 + i] * GYRO_REG_LSB / mpu.gyro_lsb) for i in range(3)]
+            old_accel, old_gyro = mpu.read_offsets()
+            # bit 0 of each accel offset register is reserved: keep it
+            accel = [((old_accel[i] - accel_fix[i]) & ~1) | (old_accel[i] & 1) for i in range(3)]
+            gyro = [old_gyro[i] - gyro_fix[i] for i in range(3)]
+            hw = mpu.write_offsets(accel, gyro)
+            if not hw:
+                mpu.write_offsets(old_accel, old_gyro)
+                accel, gyro = accel_fix, gyro_fix
+                mpu.set_software_bias(accel, gyro)
+
+            after, _ = measure(mpu, self.samples // 2, self.period_ms)
+            if not hw:
+                bias = list(mpu.accel_bias) + list(mpu.gyro_bias)
+                after = [after[k] - bias[k] for k in range(6)]
+            entry = {"hw": hw, "level": level, "accel": accel, "gyro": gyro,
+                     "before": before, "after": bias_summary(mpu, after, target)}
+            if not level:
+                # the accel error is unknown off-level; report only what was corrected
+                entry["before"]["accel_mg"] = entry["after"]["accel_mg"] = None
+            self.entries[key] = entry
+            self.save()
+            return entry
+        finally:
+            mpu.recorder = recorder
+
+    def ensure(self, mpu, key, force=False):
+        """Apply the cached offsets or calibrate; returns (entry, "cached"/"calibrated"/"moving", ms)"""
+        start = ticks_ms()
+        if not force and self.apply(mpu, key):
+            return self.entries[key], "cached", ticks_diff(ticks_ms(), start)
+        entry = self.calibrate(mpu, key)
+        return entry, "calibrated" if entry else "moving", ticks_diff(ticks_ms(), start)
+
+
+if __name__ == '__main__':
+    # Three boots of a collar against an emulated MPU6050 with offset
+    # registers, a per-chip bias and sensor noise: the first calibrates
+    # lying flat, the next loads the cache, the last recalibrates while
+    # being carried and is refused. A clone without offset registers gets
+    # the software fallback. Residual bias is measured the same way each time.
+    import random
+
+    from mpu6050_1 import MPU6050
+
+    class EmulatedMPU:
+        """Raw output = true value + chip bias + offset register trim, plus noise"""
+
+        def __init__(self, accel_bias, gyro_bias, factory=(-2100, 1500, 1204), offsets=True):
+            self.accel_bias = accel_bias      # mg at the factory trim
+            self.gyro_bias = gyro_bias        # dps
+            self.factory = list(factory)
+            self.regs = {0x06: list(factory), 0x13: [0, 0, 0]}
+            self.offsets = offsets
+            self.accel_lsb = 16384
+            self.gravity = (0.0, 0.0, 1.0)
+            self.shake = 0.0
+
+        def writeto_mem(self, addr, reg, buf):
+            if reg == 0x1C:
+                self.accel_lsb = 16384 >> ((buf[0] >> 3) & 3)
+            elif reg in self.regs and self.offsets:
+                self.regs[reg] = [(buf[i] << 8 | buf[i + 1]) - ((buf[i] & 0x80) << 9) for i in (0, 2, 4)]
+
+        def readfrom_mem(self, addr, reg, n):
+            out = bytearray(n)
+            if reg in self.regs:
+                for i, v in enumerate(self.regs[reg]):
+                    out[2 * i] = (v >> 8) & 0xFF
+                    out[2 * i + 1] = v & 0xFF
+            return bytes(out)
+
+        def readfrom_mem_into(self, addr, reg, buf):
+            lsb = self.accel_lsb
+            a = self.regs[0x06]
+            g = self.regs[0x13]
+            vals = []
+            for i in range(3):
+                trim = (a[i] - self.factory[i]) * lsb / 2048
+                v = (self.gravity[i] + self.accel_bias[i] / 1000) * lsb + trim
+                vals.append(v + random.gauss(0, 4 + self.shake * lsb))
+            vals.append(3000)
+            for i in range(3):
+                v = self.gyro_bias[i] * 131 + g[i] * 131 / 32.8
+                vals.append(v + random.gauss(0, 6 + self.shake * 4000))
+            for i, v in enumerate(vals[:len(buf) // 2]):
+                v = max(-32768, min(32767, int(round(v)))) & 0xFFFF
+                buf[2 * i] = v >> 8
+                buf[2 * i + 1] = v & 0xFF
+
+    def residual(mpu):
+        mean, _ = measure(mpu, 400, 0)
+        bias = list(mpu.accel_bias) + list(mpu.gyro_bias)
+        mean = [mean[k] - bias[k] for k in range(6)]
+        return bias_summary(mpu, mean, [0, 0, mpu.accel_lsb])
+
+    def worst(summary):
+        return max(abs(v) for v in summary["accel_mg"]), max(abs(v) for v in summary["gyro_dps"])
+
+    random.seed(7)
+    path = "/tmp/mpu_cal_demo.json"
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+    def boot(chip, label, force=False, shake=0.0):
+        chip.regs[0x06] = list(chip.factory)      # offset registers reset at power-up
+        chip.regs[0x13] = [0, 0, 0]
+        chip.shake = 0.0
+        mpu = MPU6050(chip)
+        raw = worst(residual(mpu))
+        chip.shake = shake
+        cal = MPUCalibration(path)
+        entry, source, ms = cal.ensure(mpu, device_key(0, 0x68), force)
+        chip.shake = 0.0
+        after = worst(residual(mpu))
+        print(f"{label:34} {source:10} {ms:6} ms   accel {raw[0]:6.1f} -> {after[0]:5.1f} mg   "
+              f"gyro {raw[1]:6.2f} -> {after[1]:5.3f} dps")
+
+    chip = EmulatedMPU((38.0, -52.0, 61.0), (-2.7, 1.9, 0.8))
+    print(f"{'boot':34} {'offsets':10} {'startup':>9}   {'residual bias, worst axis: uncorrected -> corrected'}")
+    boot(chip, "1st boot, lying flat")
+    boot(chip, "2nd boot")
+    boot(chip, "recalibrate while carried", force=True, shake=0.05)
+    os.remove(path)
+    clone = EmulatedMPU((-45.0, 20.0, -70.0), (1.1, -3.4, 0.5), offsets=False)
+    boot(clone, "clone, no offset registers")
+    boot(clone, "clone, 2nd boot")
+    with open(path) as f:
+        text = f.read()
+    print(f"Cache file: {len(text)} bytes, {text}")
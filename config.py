@@ -2,6 +2,10 @@
 
 WIFI_SSID = "xxxxx"
 WIFI_PASSWORD = "xxxxxx"
+WIFI_CACHE_FILE = "wifi.json"  # last good BSSID/channel for fast reconnects
+WIFI_CONNECT_TIMEOUT = 10      # seconds per attempt
+WIFI_BACKOFF_MIN = 1           # retry delay doubles from here after each failure
+WIFI_BACKOFF_MAX = 30
 
 
 TWILIO_ACCOUNT_SID = "XXXXXXXXXXXX"  
@@ -10,6 +14,15 @@ TWILIO_PHONE_NUMBER = "XXXXXXXXXXX"
 OWNER_PHONE_NUMBER = "XXXXXXXXXXXX"
 
 TWILIO_API_URL = f"https://studio.twilio.com/v2/Flows/FWd7609dee2ad07f933c4c97c8c3bf2be7"
+# Root certificate the Twilio servers are verified against, DER, in the board's
+# flash root. Boot stops if it is missing. To provision it:
+#   openssl s_client -showcerts -connect studio.twilio.com:443 </dev/null
+#     (the issuer of the last certificate printed is the root CA; download
+#      that root from its CA and check api.twilio.com chains to it too)
+#   openssl x509 -in root.pem -outform der -out twilio_ca.der
+#   mpremote cp twilio_ca.der :
+TWILIO_CA_FILE = "twilio_ca.der"
+TWILIO_TLS_INSECURE = False       # True skips server verification (the auth token goes to any peer)
 
 TWIML_URL = "http://twimlets.com/message?Message=Alert"
 
@@ -26,18 +39,110 @@ MAX30102_CHANNEL = 1
 MPU6050_ADDRESS = 0x68
 MAX30102_ADDRESS = 0x57
 
+USE_BUS_GUARD = True            # per-device circuit breakers, retries and bus recovery
+I2C_TIMEOUT_US = 20000          # the I2C peripheral gives up on a stuck bus after this
+I2C_CALL_TIMEOUT_US = 3000      # slower calls count as failures
+I2C_DEVICE_TIMEOUT_US = {0x57: 12000}   # MAX30102 FIFO reads are up to 192 bytes
+I2C_RETRIES = 1
+I2C_BREAKER_THRESHOLD = 3       # failures in a row before a device is skipped
+I2C_BREAKER_BACKOFF_MS = 2000   # doubles each time the device fails again, up to the max
+I2C_BREAKER_MAX_BACKOFF_MS = 60000
+I2C_ERROR_BUDGET_MS = 100       # retries and recoveries per reading interval
+
+MONITOR_OUTPUT = "diff"         # sensor_monitor.py: "diff", "full", "csv" or "binary"
+
 SPO2_MIN_THRESHOLD = 90      
 SPO2_MAX_THRESHOLD = 100
 
 HEART_RATE_MIN = 60          
 HEART_RATE_MAX = 180
 
-MOTION_MIN_THRESHOLD = 0.3   
-MOTION_MAX_THRESHOLD = 5.0
+# motion is the mean gravity-removed acceleration magnitude in m/s^2
+MOTION_MIN_THRESHOLD = 0.02  
+MOTION_MAX_THRESHOLD = 15.0
+
+ACTIVITY_SAMPLE_RATE = 50     
+ACTIVITY_WINDOW = 100         
+ACTIVITY_BURST_SAMPLES = 25   
+
+USE_MPU_CALIBRATION = True     # bias offsets measured once lying still, then loaded from flash
+MPU_CALIBRATION_FILE = "mpu_cal.json"
+MPU_CALIBRATION_SAMPLES = 400
+MPU_RECALIBRATE = False        # measure again on this boot (e.g. after replacing a sensor)
+
+USE_IMPACT_DETECTION = True   
+IMPACT_SAMPLE_RATE = 100      
+IMPACT_ACCEL_RANGE = 8        
+IMPACT_THRESHOLD_G = 3.0
+IMPACT_STILL_TOLERANCE_G = 0.3
+IMPACT_STILL_SECONDS = 1.0
+IMPACT_PRE_SECONDS = 0.5
+IMPACT_POST_SECONDS = 1.5
+
+USE_ORIENTATION = True        
+ORIENTATION_ALPHA = 0.98
+POSTURE_LYING_DEG = 50
+POSTURE_UPSIDE_DOWN_DEG = 135
+
+USE_HRV = True                
+HRV_SAMPLE_RATE = 25          
+HRV_WINDOW_BEATS = 30
+HRV_PNN_MS = 50
+HRV_MIN_BEATS = 10
+HRV_MOTION_REJECT = 3.0       
+HRV_RMSSD_MIN = 5             
+PPG_POLL_INTERVAL_MS = 500       # at the setup() rate of 25 Hz; the PPG controller sets its own
+USE_PPG_CONTROL = True           # adapt MAX30102 rate, averaging and LED current (needs USE_HRV)
+PPG_RATES = (12.5, 25, 50)       # FIFO rates to choose from, Hz
+PPG_ACTIVITY_LEVELS = (0, 1, 1, 1, 1)   # slowest PPG_RATES index for rest, walk, run, play, shake
+PPG_LOW_PI = 0.5                 # perfusion index (%) below which averaging and LED current go up
+PPG_HOLD_READINGS = 5            # readings in a row before dropping to a slower rate
 
 ABNORMAL_COUNT_THRESHOLD = 2  
 SENSOR_READ_INTERVAL = 3      
 ALERT_COOLDOWN = 300
+IMPACT_ALERT_COOLDOWN = 30        # impacts skip ALERT_COOLDOWN; this only stops repeats of one fall
+ALERT_TRACE_SIZE = 32             # recent alerts kept for latency percentiles
+ALERT_LATENCY_TARGET_MS = 10000   # first abnormal sample to Twilio accepting the call
+
+USE_ADAPTIVE_BASELINE = True    
+BASELINE_FILE = "baseline.json"
+BASELINE_ALPHA = 0.02           
+BASELINE_WARMUP_SAMPLES = 100   
+BASELINE_Z_THRESHOLD = 4.0      
+BASELINE_ANOMALY_ALPHA = 0.001  # anomalies still nudge the baseline, so a lasting change is learned
+BASELINE_SAVE_INTERVAL = 3600    # seconds between baseline writes to flash (and on shutdown)
+BASELINE_MIN_STD = {"spo2": 1.0, "heart_rate": 8.0, "motion": 0.3, "rmssd": 5.0}
+
+# (metric, op, threshold, seconds met, window seconds); "abnormal" is the
+# number of abnormal metrics reported by analyze_health for that reading
+ALERT_RULES = [
+    ("spo2", "<", SPO2_MIN_THRESHOLD, 15, 30),
+    ("abnormal", ">=", 1, 45, 60),
+    ("abnormal", ">=", ABNORMAL_COUNT_THRESHOLD, 9, 15),
+    ("posture", "==", 2, 20, 30),   # upside down
+]
+
+DEVICE_ID = 1                 
+USE_TELEMETRY = False         
+TELEMETRY_TRANSPORT = "http"  
+TELEMETRY_URL = "http://192.168.1.10:8080/telemetry"
+TELEMETRY_MQTT_BROKER = "192.168.1.10"
+TELEMETRY_MQTT_TOPIC = "pawnet/telemetry"
+TELEMETRY_BATCH_INTERVAL = 60 
+TELEMETRY_BUFFER_SIZE = 2048
+TELEMETRY_COMPRESS = True
+
+USE_HISTORY = True             # compressed in-RAM reading history for alert context
+HISTORY_BLOCKS = 8
+HISTORY_BLOCK_SIZE = 512       # 4 KB total, about an hour at 3 s readings
+HISTORY_CONTEXT_MINUTES = 10   # window summarised in alert SMS and sent with alert telemetry
+
+USE_RECORDER = False           # raw MPU/PPG/NMEA log on flash for incident replay
+RECORDER_DIR = "rec"
+RECORDER_PAGE_SIZE = 4096      # flash erase block
+RECORDER_CHUNK_PAGES = 16      # 64 KB per chunk file
+RECORDER_MAX_CHUNKS = 16       # oldest chunk is deleted beyond this (1 MB total)
 
 USE_GPS = True                
 GPS_UART_ID = 1              
@@ -50,5 +155,23 @@ GPS_TIMEOUT = 2000
 SEND_LOCATION_VIA_SMS = True   
 INCLUDE_MAPS_LINK = True
 
+LOW_POWER_MODE = False         # lightsleep between readings; radio only up for queued alerts/telemetry
+MPU_INT_PIN = 6                # MPU6050 INT -> motion wake (None to disable)
+MAX_INT_PIN = 7                # MAX30102 INT -> FIFO almost-full wake (None: timer polls the FIFO)
+WAKE_MOTION_MG = 64            # motion-detect threshold
+WAKE_MOTION_MS = 5
+MPU_LP_WAKE_HZ = 5             # accel-only cycle rate while the pet is still
+
+USE_SAMPLING_THREAD = False    # IMU/PPG/GPS sampling on a second thread (core); not with LOW_POWER_MODE
+SAMPLER_IMU_SLOTS = 512        # 14-byte raw IMU slots, ~5 s at IMPACT_SAMPLE_RATE
+SAMPLER_PPG_BYTES = 2048       # raw FIFO bytes, ~13 s at 25 Hz
+SAMPLER_GPS_BYTES = 1024       # NMEA bytes, ~1 s at 9600 baud
+
+USE_STATUS_SERVER = False      # JSON status at http://<collar>:STATUS_PORT/status (keeps WiFi up)
+STATUS_PORT = 80
+STATUS_SLICE_MS = 100          # IMU sampling slice between served requests
+
+FAST_BOOT = True               # sensors and first sample before WiFi; Twilio check runs later in the loop
+
 DEBUG_MODE = True             
-SIMULATE_SENSORS = False
\ No newline at end of file
+SIMULATE_SENSORS = False
@@ -0,0 +1,328 @@
+#sensor discovery on every TCA9548A channel and a round-robin reader with one mux switch per channel
+
+from sampler import SlotRing
+from clock import ticks_ms, ticks_diff
+
+KIND_MPU = "MPU6050"
+KIND_MAX = "MAX30102"
+
+# address -> kind; an MPU6050 with AD0 high answers at 0x69
+KNOWN_DEVICES = {0x68: KIND_MPU, 0x69: KIND_MPU, 0x57: KIND_MAX}
+
+# bytes per stream slot: one raw IMU burst, or one RED/IR FIFO sample
+SLOT_SIZES = {KIND_MPU: 14, KIND_MAX: 6}
+
+
+class Mux:
+    """TCA9548A with the selected channel cached, so repeat selects cost no bus traffic"""
+
+    def __init__(self, i2c, address=0x70):
+        self.i2c = i2c
+        self.address = address
+        self.channel = None
+        self.switches = 0
+
+    def select(self, channel):
+        if channel == self.channel or channel is None:
+            return
+        if not 0 <= channel <= 7:
+            return
+        self.i2c.writeto(self.address, bytes([1 << channel]))
+        self.channel = channel
+        self.switches += 1
+
+    def disable(self):
+        self.i2c.writeto(self.address, b'\x00')
+        self.channel = None
+
+    def invalidate(self):
+        """Forget the cached channel (after something else wrote the mux)"""
+        self.channel = None
+
+
+class Device:
+    def __init__(self, kind, channel, address, index, stream_slots=64):
+        self.kind = kind
+        self.channel = channel
+        self.address = address
+        self.driver = None      # built by DeviceRegistry.open on first use
+        self.index = index
+        self.stream = SlotRing(stream_slots, SLOT_SIZES[kind])
+        self.samples = 0
+        self.errors = 0
+
+    @property
+    def name(self):
+        where = "" if self.channel is None else f"ch{self.channel}/"
+        return f"{self.kind}@{where}0x{self.address:02X}"
+
+
+class DeviceRegistry:
+    """Sensors found on the bus, keyed by kind, with their mux channel.
+
+    factories maps a kind to a callable(i2c, address) returning a driver;
+    kinds without a factory are skipped. Discovery only records what
+    answered: a driver (reset, LED and range setup) is built by open(), so
+    sensors nobody uses stay in their power-on state (MPU6050 asleep,
+    MAX30102 LEDs off).
+    """
+
+    def __init__(self, i2c, mux=None, factories=None, stream_slots=64):
+        self.i2c = i2c
+        self.mux = mux
+        self.factories = factories or {}
+        self.stream_slots = stream_slots
+        self.devices = []
+
+    def discover(self, channels=range(8)):
+        """Scan the upstream bus and every mux channel; returns the devices found"""
+        self.devices = []
+        if self.mux is None:
+            for addr in self.i2c.scan():
+                self._add(None, addr)
+            return self.devices
+        # devices on the upstream side answer on every channel; scan them once
+        self.mux.disable()
+        upstream = set(self.i2c.scan())
+        for addr in sorted(upstream):
+            if addr != self.mux.address:
+                self._add(None, addr)
+        for channel in channels:
+            self.mux.select(channel)
+            for addr in self.i2c.scan():
+                if addr not in upstream and addr != self.mux.address:
+                    self._add(channel, addr)
+        return self.devices
+
+    def _add(self, channel, addr):
+        kind = KNOWN_DEVICES.get(addr)
+        if kind not in self.factories:
+            return
+        self.devices.append(Device(kind, channel, addr, len(self.devices), self.stream_slots))
+
+    def open(self, device):
+        """The device's driver, built on first call; None if it fails to init"""
+        if device.driver is None:
+            self.select(device)
+            try:
+                device.driver = self.factories[device.kind](self.i2c, device.address)
+            except OSError as e:
+                print(f" {device.name} failed to init: {e}")
+                device.errors += 1
+        return device.driver
+
+    def of_kind(self, kind):
+        return [d for d in self.devices if d.kind == kind]
+
+    def find(self, kind, channel=None):
+        """First device of kind, preferring the given channel"""
+        found = None
+        for d in self.devices:
+            if d.kind == kind:
+                if d.channel == channel:
+                    return d
+                if found is None:
+                    found = d
+        return found
+
+    def select(self, device):
+        if self.mux is not None:
+            self.mux.select(device.channel)
+
+    def describe(self):
+        return ", ".join(d.name for d in self.devices) or "no sensors"
+
+
+class RoundRobinScheduler:
+    """Reads every registered sensor once per cycle, grouped by mux channel.
+
+    The upstream group is read first with no switch, then each channel in
+    turn with a single select for all of its sensors. Readings land in the
+    device's own stream (a SlotRing stamped with ticks_ms); MAX30102 FIFO
+    reads are split into one slot per sample.
+    """
+
+    def __init__(self, registry, kinds=None, ticks=ticks_ms):
+        self.registry = registry
+        self.ticks = ticks
+        groups = {}
+        for d in registry.devices:
+            if (kinds is None or d.kind in kinds) and registry.open(d) is not None:
+                groups.setdefault(d.channel, []).append(d)
+        order = sorted(c for c in groups if c is not None)
+        self.groups = ([groups[None]] if None in groups else []) + [groups[c] for c in order]
+        self.cycles = 0
+
+    def read_cycle(self):
+        """Read all sensors once; returns the number of samples stored"""
+        mux = self.registry.mux
+        stored = 0
+        for group in self.groups:
+            if mux is not None:
+                mux.select(group[0].channel)
+            for d in group:
+                stored += self._read(d)
+        self.cycles += 1
+        return stored
+
+    def _read(self, d):
+        stream = d.stream
+        try:
+            if d.kind == KIND_MPU:
+                slot = stream.reserve()
+                if slot is None:
+                    return 0
+                d.driver.read_imu_raw_into(slot)
+                stream.commit(self.ticks())
+                d.samples += 1
+                return 1
+            data = d.driver.read_fifo()
+        except OSError:
+            d.errors += 1
+            return 0
+        if not data:
+            return 0
+        now = self.ticks()
+        n = 0
+        mv = memoryview(data)
+        for i in range(0, len(data) - 5, 6):
+            slot = stream.reserve()
+            if slot is None:
+                break
+            slot[:] = mv[i:i + 6]
+            stream.commit(now)
+            n += 1
+        d.samples += n
+        return n
+
+    def merged(self):
+        """Drain every stream in timestamp order: yields (device, stamp, slot view).
+
+        The view is only valid until the next item is requested.
+        """
+        devices = [d for group in self.groups for d in group]
+        while True:
+            best = None
+            best_stamp = 0
+            for d in devices:
+                i = d.stream.peek()
+                if i >= 0 and (best is None or ticks_diff(d.stream.stamps[i], best_stamp) < 0):
+                    best = d
+                    best_stamp = d.stream.stamps[i]
+            if best is None:
+                return
+            stream = best.stream
+            i = stream.peek()
+            yield best, best_stamp, stream.views[i]
+            stream.release()
+
+
+if __name__ == '__main__':
+    # Aggregate throughput against an emulated TCA9548A bus as sensors are
+    # added. Bus time is modelled at 400 kHz (9 bits per byte plus start/stop
+    # and driver overhead) so the figures reflect I2C cost, not host speed.
+    from mpu6050_1 import MPU6050
+    from max30102_1 import MAX30102
+
+    FREQ = 400000
+    OVERHEAD_US = 25   # per transaction: driver call, start/stop, ACK turnaround
+
+    class EmulatedBus:
+        def __init__(self, layout, mux_address=0x70):
+            self.layout = layout          # channel -> {address: kind}
+            self.mux_address = mux_address
+            self.enabled = 0
+            self.bus_us = 0.0
+            self.transactions = 0
+            self.fifo = {}
+
+        def _cost(self, nbytes):
+            self.transactions += 1
+            self.bus_us += (nbytes + 1) * 9 * 1e6 / FREQ + OVERHEAD_US
+
+        def _visible(self):
+            seen = {}
+            for ch, devs in self.layout.items():
+                if ch is None or self.enabled & (1 << ch):
+                    for addr, kind in devs.items():
+                        if addr in seen:
+                            raise OSError("address clash on enabled channels")
+                        seen[addr] = (ch, kind)
+            return seen
+
+        def _device(self, addr):
+            dev = self._visible().get(addr)
+            if dev is None:
+                raise OSError(19)   # ENODEV, no ACK
+            return dev
+
+        def scan(self):
+            self._cost(0)
+            return sorted(self._visible()) + ([self.mux_address] if self.mux_address else [])
+
+        def writeto(self, addr, data):
+            self._cost(len(data))
+            if addr == self.mux_address:
+                self.enabled = data[0]
+
+        def writeto_mem(self, addr, reg, data):
+            self._device(addr)
+            self._cost(1 + len(data))
+
+        def readfrom_mem(self, addr, reg, n):
+            self._device(addr)
+            self._cost(1 + n)
+            if reg == 4:      # FIFO_WR_PTR: 5 samples pending per read at 25 Hz / 5 Hz cycle
+                return bytes([5])
+            return bytes(n)
+
+        def readfrom_mem_into(self, addr, reg, buf):
+            self._device(addr)
+            self._cost(1 + len(buf))
+            buf[0] = 1
+
+    factories = {KIND_MPU: lambda i2c, a: MPU6050(i2c, a), KIND_MAX: lambda i2c, a: MAX30102(i2c, a)}
+
+    def layout_for(n_mpu):
+        # one MPU6050 per channel, then a second one (AD0 high) per channel;
+        # the MAX30102 shares channel 0
+        layout = {ch: {} for ch in range(8)}
+        layout[0][0x57] = KIND_MAX
+        for i in range(n_mpu):
+            layout[i % 8][0x68 if i < 8 else 0x69] = KIND_MPU
+        return layout
+
+    import time
+    print("Aggregate samples/s include the MAX30102 FIFO samples (5 per cycle) on channel 0")
+    print("Sensors  switches/cycle  bus us/cycle  samples/s round-robin  samples/s select-per-read  host samples/s")
+    for n in (1, 2, 4, 8, 12, 16):
+        bus = EmulatedBus(layout_for(n))
+        mux = Mux(bus)
+        registry = DeviceRegistry(bus, mux, factories)
+        registry.discover()
+        assert len(registry.of_kind(KIND_MPU)) == n, registry.describe()
+        assert all(d.driver is None for d in registry.devices)   # nothing set up until read
+        sched = RoundRobinScheduler(registry)
+        cycles = 200
+        bus.bus_us = 0
+        mux.switches = 0
+        start = time.perf_counter()
+        samples = 0
+        for _ in range(cycles):
+            samples += sched.read_cycle()
+            for _d, _stamp, _view in sched.merged():
+                pass
+        host = time.perf_counter() - start
+        rr_us = bus.bus_us
+        switches = mux.switches / cycles
+
+        # baseline: select before every read, as the single-sensor loops do
+        bus.bus_us = 0
+        for _ in range(cycles):
+            for d in registry.devices:
+                bus.writeto(0x70, bytes([1 << d.channel]))
+                sched._read(d)
+            for _ in sched.merged():
+                pass
+        print(f"{n:>3} MPU {switches:>13.0f} {rr_us / cycles:>13,.0f} {samples / rr_us * 1e6:>21,.0f} "
+              f"{samples / bus.bus_us * 1e6:>25,.0f} {samples / host:>15,.0f}")
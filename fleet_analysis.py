@@ -0,0 +1,141 @@
+#vectorized fleet-wide health analysis (CPython host, NumPy): same static rules as health_rules.analyze_health
+#
+#   python fleet_analysis.py --rows 5000000
+
+import numpy as np
+
+import config
+from health_rules import (ISSUE_LOW_SPO2, ISSUE_LOW_HEART_RATE, ISSUE_HIGH_HEART_RATE,
+                          ISSUE_LOW_MOTION, ISSUE_HIGH_MOTION, ISSUE_LOW_HRV)
+
+THRESHOLD_KEYS = ("spo2_min", "heart_rate_min", "heart_rate_max",
+                  "motion_min", "motion_max", "rmssd_min")
+
+
+def default_thresholds():
+    return {
+        "spo2_min": config.SPO2_MIN_THRESHOLD,
+        "heart_rate_min": config.HEART_RATE_MIN,
+        "heart_rate_max": config.HEART_RATE_MAX,
+        "motion_min": config.MOTION_MIN_THRESHOLD,
+        "motion_max": config.MOTION_MAX_THRESHOLD,
+        "rmssd_min": config.HRV_RMSSD_MIN,
+    }
+
+
+def _per_row(pet_id, default, pet_thresholds, key):
+    """Expand per-pet overrides of one threshold into a column (or keep the scalar)"""
+    pets = [p for p, t in pet_thresholds.items() if key in t]
+    if not pets:
+        return default
+    ids = np.array(sorted(pets), dtype=np.int64)
+    values = np.array([pet_thresholds[p][key] for p in ids], dtype=np.float64)
+    idx = np.searchsorted(ids, pet_id)
+    idx[idx == len(ids)] = 0
+    return np.where(ids[idx] == pet_id, values[idx], default)
+
+
+def analyze_batch(spo2, heart_rate, motion, pet_id=None, rmssd=None,
+                  thresholds=None, pet_thresholds=None, chunk=1 << 20):
+    """Static-threshold analysis of column arrays.
+
+    Returns (abnormal_count uint8, issue_mask uint16) per row, identical to
+    health_rules.analyze_health(spo2, hr, motion, rmssd) without a baseline.
+    rmssd uses NaN for "no HRV reading". pet_thresholds maps a pet id to a
+    dict of overrides for any of THRESHOLD_KEYS.
+    """
+    spo2 = np.asarray(spo2)
+    heart_rate = np.asarray(heart_rate)
+    motion = np.asarray(motion)
+    n = len(spo2)
+    t = default_thresholds()
+    if thresholds:
+        t.update(thresholds)
+    if pet_thresholds:
+        if pet_id is None:
+            raise ValueError("pet_thresholds needs pet_id")
+        pet_id = np.asarray(pet_id)
+        t = {k: _per_row(pet_id, t[k], pet_thresholds, k) for k in THRESHOLD_KEYS}
+
+    counts = np.empty(n, dtype=np.uint8)
+    masks = np.empty(n, dtype=np.uint16)
+    for start in range(0, n, chunk):
+        end = min(n, start + chunk)
+        s = slice(start, end)
+        tt = {k: (v[s] if isinstance(v, np.ndarray) else v) for k, v in t.items()}
+
+        sp = spo2[s]
+        hr = heart_rate[s]
+        mo = motion[s]
+        low_spo2 = (sp > 0) & (sp < tt["spo2_min"])
+        has_hr = hr > 0
+        low_hr = has_hr & (hr < tt["heart_rate_min"])
+        high_hr = has_hr & ~low_hr & (hr > tt["heart_rate_max"])
+        low_mo = mo < tt["motion_min"]
+        high_mo = ~low_mo & (mo > tt["motion_max"])
+
+        m = low_spo2 * np.uint16(ISSUE_LOW_SPO2)
+        m |= low_hr * np.uint16(ISSUE_LOW_HEART_RATE)
+        m |= high_hr * np.uint16(ISSUE_HIGH_HEART_RATE)
+        m |= low_mo * np.uint16(ISSUE_LOW_MOTION)
+        m |= high_mo * np.uint16(ISSUE_HIGH_MOTION)
+        c = low_spo2.view(np.uint8) + low_hr.view(np.uint8)
+        c += high_hr.view(np.uint8)
+        c += low_mo.view(np.uint8)
+        c += high_mo.view(np.uint8)
+        if rmssd is not None:
+            rv = np.asarray(rmssd)[s]
+            low_hrv = rv < tt["rmssd_min"]  # NaN compares False
+            m |= low_hrv * np.uint16(ISSUE_LOW_HRV)
+            c += low_hrv.view(np.uint8)
+        masks[s] = m
+        counts[s] = c
+    return counts, masks
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    from health_rules import analyze_health
+
+    parser = argparse.ArgumentParser(description="Vectorized vs scalar analyze_health benchmark")
+    parser.add_argument("--rows", type=int, default=5000000)
+    parser.add_argument("--scalar-rows", type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    n = args.rows
+    pet_id = rng.integers(1, 2000, n)
+    spo2 = rng.integers(80, 101, n).astype(np.float64)
+    spo2[rng.random(n) < 0.02] = 0
+    heart_rate = rng.integers(40, 220, n).astype(np.float64)
+    heart_rate[rng.random(n) < 0.02] = 0
+    motion = rng.gamma(1.5, 1.5, n)
+    motion[rng.random(n) < 0.01] = 0.0
+    rmssd = rng.normal(30, 12, n)
+    rmssd[rng.random(n) < 0.3] = np.nan
+
+    start = time.perf_counter()
+    counts, masks = analyze_batch(spo2, heart_rate, motion, pet_id, rmssd)
+    vec = time.perf_counter() - start
+
+    m = min(args.scalar_rows, n)
+    start = time.perf_counter()
+    ref = [analyze_health(spo2[i], heart_rate[i], motion[i],
+                          None if np.isnan(rmssd[i]) else rmssd[i])
+           for i in range(m)]
+    scalar = time.perf_counter() - start
+
+    ref_counts = np.array([r[0] for r in ref], dtype=np.uint8)
+    ref_masks = np.array([r[2] for r in ref], dtype=np.uint16)
+    assert np.array_equal(ref_counts, counts[:m]), "abnormal counts differ"
+    assert np.array_equal(ref_masks, masks[:m]), "issue masks differ"
+
+    print(f"Rows: {n:,} (scalar check on {m:,}: identical counts and masks)")
+    print(f"Vectorized: {n / vec:,.0f} rows/s ({vec:.2f} s)")
+    print(f"Scalar:     {m / scalar:,.0f} rows/s")
+    print(f"Speedup:    {(n / vec) / (m / scalar):.0f}x")
+
+    overrides = {7: {"heart_rate_max": 240}, 8: {"heart_rate_min": 40, "spo2_min": 88}}
+    c2, _ = analyze_batch(spo2, heart_rate, motion, pet_id, rmssd, pet_thresholds=overrides)
+    print(f"Per-pet overrides changed {int(np.count_nonzero(c2 != counts)):,} rows")
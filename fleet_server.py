@@ -0,0 +1,366 @@
+#fleet ingestion server (CPython host): receives collar telemetry batches, runs the health rules per pet, fans out alerts
+#
+#   python fleet_server.py --port 8080 --owners owners.json
+#   python fleet_server.py --bench --collars 500 --batches 40
+
+import argparse
+import asyncio
+import base64
+import json
+import struct
+import time
+import zlib
+from urllib.parse import quote
+
+import config
+import telemetry
+from baseline import AdaptiveBaseline
+from health_rules import analyze_health
+from health_window import WindowEvaluator
+from activity import ACTIVITY_NAMES
+
+_HEADER = struct.Struct(telemetry.HEADER)
+_STRUCTS = {kind: struct.Struct(fmt) for kind, fmt in telemetry.FRAME_FORMATS.items()}
+_READING = _STRUCTS[telemetry.FRAME_READING]
+_HISTORY = _STRUCTS[telemetry.FRAME_HISTORY]
+_NO_CONTENT = b"HTTP/1.1 204 No Content\r\nContent-Length: 0\r\n\r\n"
+_BAD_REQUEST = b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+# what ingest() raises on a truncated, corrupt or foreign batch
+_MALFORMED = (ValueError, KeyError, IndexError, TypeError, struct.error, zlib.error)
+
+
+class PetState:
+    """Per-pet rule state: the same baseline and window rules the collar runs"""
+
+    __slots__ = ("baseline", "window", "last_alert", "last_seq", "readings")
+
+    def __init__(self):
+        self.baseline = AdaptiveBaseline(
+            metrics=("spo2", "heart_rate", "motion", "rmssd"),
+            states=len(ACTIVITY_NAMES),
+            alpha=config.BASELINE_ALPHA,
+            warmup=config.BASELINE_WARMUP_SAMPLES,
+            min_std=config.BASELINE_MIN_STD
+        ) if config.USE_ADAPTIVE_BASELINE else None
+        self.window = WindowEvaluator(config.ALERT_RULES, config.SENSOR_READ_INTERVAL)
+        self.last_alert = 0
+        self.last_seq = None
+        self.readings = 0
+
+
+class TwilioPool:
+    """Alert fan-out through a fixed set of keep-alive HTTPS connections.
+
+    Each worker owns one connection and runs the blocking request in the
+    default executor, so alerts never stall ingestion.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number, workers=4, dry_run=False):
+        self.path = f"/2010-04-01/Accounts/{account_sid}/Messages.json"
+        token = base64.b64encode(f"{account_sid}:{auth_token}".encode()).decode()
+        self.headers = {
+            "Authorization": f"Basic {token}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        self.from_number = from_number
+        self.workers = workers
+        self.dry_run = dry_run
+        self.queue = asyncio.Queue(maxsize=10000)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+
+    def submit(self, to_number, message):
+        try:
+            self.queue.put_nowait((to_number, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _worker(self):
+        import http.client
+        loop = asyncio.get_running_loop()
+        conn = None
+        while True:
+            to_number, message = await self.queue.get()
+            try:
+                if self.dry_run:
+                    self.sent += 1
+                    continue
+                if conn is None:
+                    conn = http.client.HTTPSConnection("api.twilio.com", timeout=15)
+                body = f"To={quote(to_number)}&From={quote(self.from_number)}&Body={quote(message)}"
+                status = await loop.run_in_executor(None, self._post, conn, body)
+                if status == 201:
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            except Exception as e:
+                print(f" Twilio send failed: {e}")
+                self.failed += 1
+                if conn is not None:
+                    conn.close()
+                conn = None
+            finally:
+                self.queue.task_done()
+
+    def _post(self, conn, body):
+        conn.request("POST", self.path, body=body, headers=self.headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+
+class IngestServer:
+
+    def __init__(self, alerts, owners=None):
+        self.alerts = alerts
+        self.owners = owners or {}
+        self.pets = {}
+        self.readings = 0
+        self.batches = 0
+        self.rejected = 0
+        self.alerts_raised = 0
+
+    def owner_for(self, pet_id):
+        return self.owners.get(str(pet_id), config.OWNER_PHONE_NUMBER)
+
+    def ingest(self, data):
+        """Decode one batch and run the rules on every reading"""
+        view = memoryview(data)
+        magic, version, flags, device_id, seq, count = _HEADER.unpack_from(view, 0)
+        if magic != telemetry.MAGIC or version != telemetry.VERSION:
+            raise ValueError("bad batch header")
+        body = view[_HEADER.size:]
+        if flags & telemetry.FLAG_COMPRESSED:
+            body = memoryview(zlib.decompress(body))
+
+        pet = self.pets.get(device_id)
+        if pet is not None and pet.last_seq == seq:
+            return 0
+
+        # decode the whole batch before touching the pet's state, so a
+        # malformed one leaves no trace and its corrected resend is not a duplicate
+        readings = []
+        pos = 0
+        for _ in range(count):
+            kind = body[pos]
+            if kind == telemetry.FRAME_READING:
+                readings.append(_READING.unpack_from(body, pos))
+                pos += _READING.size
+            elif kind == telemetry.FRAME_HISTORY:
+                pos += _HISTORY.size + _HISTORY.unpack_from(body, pos)[2]
+            else:
+                pos += _STRUCTS[kind].size
+        if pos > len(body):
+            raise ValueError("batch shorter than its frames")
+
+        if pet is None:
+            pet = self.pets[device_id] = PetState()
+        pet.last_seq = seq
+        for _, ts, spo2, hr, motion, activity, rmssd in readings:
+            self._evaluate(device_id, pet, ts, spo2, hr, motion / 100, activity,
+                           rmssd / 10 if rmssd else None)
+
+        self.readings += len(readings)
+        self.batches += 1
+        return len(readings)
+
+    def accept(self, data):
+        """ingest() for payloads off the network: a malformed batch is counted in rejected, not raised"""
+        try:
+            self.ingest(data)
+            return True
+        except _MALFORMED:
+            self.rejected += 1
+            return False
+
+    def _evaluate(self, pet_id, pet, ts, spo2, hr, motion, activity, rmssd):
+        count, issues, _ = analyze_health(spo2, hr, motion, rmssd, activity, pet.baseline)
+        fired = pet.window.update({
+            "spo2": spo2 if spo2 > 0 else None,
+            "heart_rate": hr if hr > 0 else None,
+            "motion": motion,
+            "abnormal": count,
+            "rmssd": rmssd
+        })
+        pet.readings += 1
+        if fired and ts - pet.last_alert >= config.ALERT_COOLDOWN:
+            pet.last_alert = ts
+            self.alerts_raised += 1
+            message = f"PET {pet_id} HEALTH ALERT\n" + "\n".join(issues + fired)
+            self.alerts.submit(self.owner_for(pet_id), message)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                length = 0
+                close = False
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    name = name.strip().lower()
+                    if name == b"content-length":
+                        try:
+                            length = int(value)
+                        except ValueError:
+                            length = -1
+                    elif name == b"connection" and value.strip().lower() == b"close":
+                        close = True
+                if length < 0:
+                    self.rejected += 1
+                    writer.write(_BAD_REQUEST)
+                    break
+                try:
+                    body = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    # client went away mid-body: nothing to answer
+                    break
+                if self.accept(body):
+                    writer.write(_NO_CONTENT)
+                else:
+                    writer.write(_BAD_REQUEST)
+                    close = True
+                if close:
+                    break
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        self.alerts.start()
+        return server
+
+
+def attach_mqtt(server, loop, broker, topic):
+    """Optionally also ingest batches published to an MQTT broker (needs paho-mqtt)"""
+    import paho.mqtt.client as mqtt
+
+    def on_message(client, userdata, msg):
+        loop.call_soon_threadsafe(server.accept, msg.payload)
+
+    client = mqtt.Client()
+    client.on_message = on_message
+    client.connect(broker)
+    client.subscribe(topic + "/#" if not topic.endswith("#") else topic)
+    client.loop_start()
+    return client
+
+
+def _collar_batches(device_id, batches, per_batch):
+    import random
+
+    captured = []
+
+    class Capture:
+        def send(self, payload):
+            captured.append(bytes(payload))
+            return True
+
+    buf = telemetry.TelemetryBuffer(device_id, Capture(), capacity=per_batch * telemetry.FRAME_SIZES[1])
+    ts = 1000
+    for _ in range(batches):
+        for _ in range(per_batch):
+            ts += config.SENSOR_READ_INTERVAL
+            buf.add_reading(ts, random.randint(94, 99), random.randint(70, 110),
+                            random.uniform(0.1, 2.0), 1, random.uniform(20, 40))
+        buf.flush()
+    return captured
+
+
+def _load_generator(port, collars, batches, per_batch, connections):
+    async def client(payloads):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for body in payloads:
+            writer.write(b"POST /telemetry HTTP/1.1\r\nHost: localhost\r\n"
+                         b"Content-Type: application/octet-stream\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+
+    async def main():
+        streams = [[] for _ in range(connections)]
+        for device in range(collars):
+            for i, batch in enumerate(_collar_batches(device + 1, batches, per_batch)):
+                streams[(device + i) % connections].append(batch)
+        await asyncio.gather(*(client(s) for s in streams))
+
+    asyncio.run(main())
+
+
+async def _bench(args):
+    import multiprocessing
+
+    pool = TwilioPool(config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN,
+                      config.TWILIO_PHONE_NUMBER, dry_run=True)
+    ingest = IngestServer(pool)
+    server = await ingest.serve("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    gen = multiprocessing.Process(target=_load_generator,
+                                  args=(port, args.collars, args.batches, args.per_batch, args.connections))
+    start = None
+    gen.start()
+    expected = args.collars * args.batches * args.per_batch
+    while ingest.readings < expected and gen.is_alive():
+        if start is None and ingest.readings:
+            start = time.perf_counter()
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - (start or time.perf_counter())
+    await asyncio.get_running_loop().run_in_executor(None, gen.join)
+    await pool.stop()
+    server.close()
+    await server.wait_closed()
+
+    print(f"Simulated collars: {args.collars}, batches: {ingest.batches}, readings: {ingest.readings}")
+    print(f"Throughput: {ingest.readings / elapsed:,.0f} readings/s "
+          f"({ingest.batches / elapsed:,.0f} batches/s) on one core")
+    print(f"Alerts raised: {ingest.alerts_raised}, rejected batches: {ingest.rejected}")
+
+
+async def _serve(args):
+    owners = {}
+    if args.owners:
+        with open(args.owners) as f:
+            owners = json.load(f)
+    pool = TwilioPool(config.TWILIO_ACCOUNT_SID, config.TWILIO_AUTH_TOKEN,
+                      config.TWILIO_PHONE_NUMBER, workers=args.workers, dry_run=args.dry_run)
+    ingest = IngestServer(pool, owners)
+    server = await ingest.serve(args.host, args.port)
+    if args.mqtt_broker:
+        attach_mqtt(ingest, asyncio.get_running_loop(), args.mqtt_broker, config.TELEMETRY_MQTT_TOPIC)
+    print(f" Fleet ingestion listening on {args.host}:{args.port}")
+    async with server:
+        while True:
+            await asyncio.sleep(60)
+            print(f" pets={len(ingest.pets)} readings={ingest.readings} batches={ingest.batches} "
+                  f"alerts={ingest.alerts_raised} sent={pool.sent} failed={pool.failed}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Collar telemetry ingestion server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--owners", help="JSON map of device id -> owner phone number")
+    parser.add_argument("--workers", type=int, default=4, help="Twilio connections")
+    parser.add_argument("--mqtt-broker", help="also ingest from this MQTT broker")
+    parser.add_argument("--dry-run", action="store_true", help="count alerts instead of sending them")
+    parser.add_argument("--bench", action="store_true", help="run the localhost load generator")
+    parser.add_argument("--collars", type=int, default=500)
+    parser.add_argument("--batches", type=int, default=40)
+    parser.add_argument("--per-batch", type=int, default=20)
+    parser.add_argument("--connections", type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(_bench(args) if args.bench else _serve(args))
@@ -1,13 +1,21 @@
 #the gps module code 
 
-from machine import UART, Pin
+try:
+    from machine import UART, Pin
+except ImportError:
+    UART = Pin = None
 import time
+from clock import ticks_ms, ticks_diff
+from recorder import REC_NMEA
 
 
 class GPS:
     
-    def __init__(self, uart_id=1, tx_pin=21, rx_pin=20, baudrate=9600):
-        self.uart = UART(uart_id, baudrate=baudrate, tx=Pin(tx_pin), rx=Pin(rx_pin))
+    def __init__(self, uart_id=1, tx_pin=21, rx_pin=20, baudrate=9600, uart=None, recorder=None):
+        if uart is None:
+            uart = UART(uart_id, baudrate=baudrate, tx=Pin(tx_pin), rx=Pin(rx_pin))
+        self.uart = uart
+        self.recorder = recorder
         
         self.latitude = None
         self.longitude = None
@@ -22,19 +30,22 @@ class GPS:
         
         self.has_fix = False
         self.last_update = 0
+        self._line = bytearray()
         
         print(" GPS module initialized")
         print(f"   UART{uart_id}: TX=GPIO{tx_pin}, RX=GPIO{rx_pin}, Baud={baudrate}")
     
     def update(self, timeout=1000):
-        start_time = time.ticks_ms()
+        start_time = ticks_ms()
         updated = False
         
-        while time.ticks_diff(time.ticks_ms(), start_time) < timeout:
+        while ticks_diff(ticks_ms(), start_time) < timeout:
             if self.uart.any():
                 try:
                     line = self.uart.readline()
                     if line:
+                        if self.recorder:
+                            self.recorder.record(REC_NMEA, line)
                         sentence = line.decode('ascii', 'ignore').strip()
                         if self._parse_sentence(sentence):
                             updated = True
@@ -43,6 +54,24 @@ class GPS:
                     pass
         
         return updated
+
+    def feed(self, data):
+        """Parse raw UART bytes collected elsewhere (sampling thread); returns True on new data"""
+        updated = False
+        line = self._line
+        for b in data:
+            if b != 10:
+                if len(line) < 120:
+                    line.append(b)
+                continue
+            if self.recorder:
+                self.recorder.record(REC_NMEA, line)
+            sentence = line.decode('ascii', 'ignore').strip()
+            line[:] = b''
+            if self._parse_sentence(sentence):
+                updated = True
+                self.last_update = time.time()
+        return updated
     
     def _parse_sentence(self, sentence):
         
@@ -0,0 +1,103 @@
+#health rules shared by the collar and the host tools: thresholds, baselines and issue bits
+
+import config
+
+ISSUE_LOW_SPO2 = 0x01
+ISSUE_LOW_HEART_RATE = 0x02
+ISSUE_HIGH_HEART_RATE = 0x04
+ISSUE_LOW_MOTION = 0x08
+ISSUE_HIGH_MOTION = 0x10
+ISSUE_LOW_HRV = 0x20
+ISSUE_IMPACT = 0x40
+ISSUE_POSTURE = 0x80
+
+
+def baseline_deviation(baseline, metric, state, value):
+    """Score a value against the learned baseline for an activity state.
+
+    Returns the z-score, or None while the baseline is still warming up.
+    Normal values are folded into the baseline. Anomalies only nudge it,
+    clamped to the threshold and at BASELINE_ANOMALY_ALPHA: an incident
+    barely moves it, but a lasting change in the pet's normal (diet, age,
+    medication) is learned instead of alerting forever.
+    """
+    if not baseline:
+        return None
+    z = None
+    if baseline.ready(metric, state):
+        z = baseline.score(metric, state, value)
+        if abs(z) > config.BASELINE_Z_THRESHOLD:
+            baseline.nudge(metric, state, value, config.BASELINE_ANOMALY_ALPHA, config.BASELINE_Z_THRESHOLD)
+            return z
+    baseline.update(metric, state, value)
+    return z
+
+
+def analyze_health(spo2, heart_rate, motion, rmssd=None, state=0, baseline=None):
+    """Evaluate one reading; returns (abnormal_count, issues, issue_mask)"""
+    abnormal_count = 0
+    issues = []
+    mask = 0
+    if spo2 > 0:
+        z = baseline_deviation(baseline, "spo2", state, spo2)
+        if spo2 < config.SPO2_MIN_THRESHOLD:
+            abnormal_count += 1
+            mask |= ISSUE_LOW_SPO2
+            issues.append(f"Low SpO2: {spo2}%")
+        elif z is not None and z < -config.BASELINE_Z_THRESHOLD:
+            abnormal_count += 1
+            mask |= ISSUE_LOW_SPO2
+            issues.append(f"Low SpO2: {spo2}% (usual {baseline.expected('spo2', state):.0f}%)")
+    if heart_rate > 0:
+        z = baseline_deviation(baseline, "heart_rate", state, heart_rate)
+        if z is None:
+            if heart_rate < config.HEART_RATE_MIN:
+                abnormal_count += 1
+                mask |= ISSUE_LOW_HEART_RATE
+                issues.append(f"Low heart rate: {heart_rate} BPM")
+            elif heart_rate > config.HEART_RATE_MAX:
+                abnormal_count += 1
+                mask |= ISSUE_HIGH_HEART_RATE
+                issues.append(f"High heart rate: {heart_rate} BPM")
+        elif abs(z) > config.BASELINE_Z_THRESHOLD:
+            usual = baseline.expected("heart_rate", state)
+            abnormal_count += 1
+            if z < 0:
+                mask |= ISSUE_LOW_HEART_RATE
+                issues.append(f"Low heart rate: {heart_rate} BPM (usual {usual:.0f})")
+            else:
+                mask |= ISSUE_HIGH_HEART_RATE
+                issues.append(f"High heart rate: {heart_rate} BPM (usual {usual:.0f})")
+    # None: the IMU could not be read, which is not the same as a still pet
+    if motion is not None:
+        z = baseline_deviation(baseline, "motion", state, motion)
+        if z is None:
+            if motion < config.MOTION_MIN_THRESHOLD:
+                abnormal_count += 1
+                mask |= ISSUE_LOW_MOTION
+                issues.append(f"Low motion: {motion:.2f}")
+            elif motion > config.MOTION_MAX_THRESHOLD:
+                abnormal_count += 1
+                mask |= ISSUE_HIGH_MOTION
+                issues.append(f"Excessive motion: {motion:.2f}")
+        elif z < -config.BASELINE_Z_THRESHOLD:
+            abnormal_count += 1
+            mask |= ISSUE_LOW_MOTION
+            issues.append(f"Low motion: {motion:.2f}")
+        elif z > config.BASELINE_Z_THRESHOLD:
+            abnormal_count += 1
+            mask |= ISSUE_HIGH_MOTION
+            issues.append(f"Excessive motion: {motion:.2f}")
+    if rmssd is not None:
+        z = baseline_deviation(baseline, "rmssd", state, rmssd)
+        if z is None:
+            if rmssd < config.HRV_RMSSD_MIN:
+                abnormal_count += 1
+                mask |= ISSUE_LOW_HRV
+                issues.append(f"Low HRV: RMSSD {rmssd:.0f} ms")
+        elif z < -config.BASELINE_Z_THRESHOLD:
+            abnormal_count += 1
+            mask |= ISSUE_LOW_HRV
+            issues.append(f"Low HRV: RMSSD {rmssd:.0f} ms (usual {baseline.expected('rmssd', state):.0f})")
+
+    return (abnormal_count, issues, mask)
@@ -0,0 +1,165 @@
+#windowed alert rules: "metric below X for N of the last M seconds" using fixed ring buffers
+
+_OPS = {
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "==": lambda a, b: a == b,
+}
+
+_LABELS = {
+    "spo2": "SpO2",
+    "heart_rate": "Heart rate",
+    "motion": "Motion",
+    "abnormal": "Abnormal metrics",
+    "posture": "Posture",
+    "pitch": "Pitch",
+    "roll": "Roll",
+    "rmssd": "HRV (RMSSD)",
+}
+
+_VALUE_NAMES = {
+    "posture": ("standing", "lying", "upside down"),
+}
+
+
+class WindowRule:
+    """One rule over a ring buffer of pass/fail flags.
+
+    The buffer holds one flag per sample slot of the last `window` seconds and
+    a running hit count, so each new sample costs one compare and two adds.
+    """
+
+    def __init__(self, metric, op, threshold, duration, window, interval):
+        self.metric = metric
+        self.op = op
+        self.threshold = threshold
+        self.duration = duration
+        self.window = window
+        self._test = _OPS[op]
+
+        slots = int(window / interval + 0.5)
+        self.slots = slots if slots > 0 else 1
+        need = int(duration / interval + 0.5)
+        self.need = min(max(need, 1), self.slots)
+
+        self.flags = bytearray(self.slots)
+        self.pos = 0
+        self.hits = 0
+
+    def push(self, value):
+        hit = 1 if value is not None and self._test(value, self.threshold) else 0
+        self.hits += hit - self.flags[self.pos]
+        self.flags[self.pos] = hit
+        self.pos += 1
+        if self.pos == self.slots:
+            self.pos = 0
+        return self.hits >= self.need
+
+    def first_hit(self):
+        """Samples back to the oldest flagged one still in the window (0 = newest); -1 if none"""
+        for k in range(self.slots):
+            if self.flags[(self.pos + k) % self.slots]:
+                return self.slots - 1 - k
+        return -1
+
+    def reset(self):
+        for i in range(self.slots):
+            self.flags[i] = 0
+        self.pos = 0
+        self.hits = 0
+
+    def describe(self):
+        label = _LABELS.get(self.metric, self.metric)
+        names = _VALUE_NAMES.get(self.metric)
+        if names and self.op == "==" and 0 <= self.threshold < len(names):
+            return f"{label} {names[self.threshold]} for {self.duration}s of last {self.window}s"
+        return f"{label} {self.op} {self.threshold} for {self.duration}s of last {self.window}s"
+
+
+class WindowEvaluator:
+
+    def __init__(self, rules, interval):
+        self.interval = interval
+        self.rules = [WindowRule(metric, op, threshold, duration, window, interval)
+                      for (metric, op, threshold, duration, window) in rules]
+        self.fired_mask = 0
+
+    def update(self, sample):
+        """Push one sample (dict of metric -> value, None when missing) into
+        every rule and return the descriptions of the rules that are met.
+        Bit i of `fired_mask` is set when rule i is met."""
+        fired = []
+        mask = 0
+        for i, rule in enumerate(self.rules):
+            if rule.push(sample.get(rule.metric)):
+                fired.append(rule.describe())
+                mask |= 1 << i
+        self.fired_mask = mask
+        return fired
+
+    def fired_age(self):
+        """Seconds back to the oldest flagged sample of any rule met on the last update"""
+        age = 0
+        for i, rule in enumerate(self.rules):
+            if self.fired_mask & (1 << i):
+                age = max(age, rule.first_hit())
+        return age * self.interval
+
+    def reset(self):
+        for rule in self.rules:
+            rule.reset()
+
+
+if __name__ == '__main__':
+    # Replay recorded incident shapes through the old per-reading count and
+    # the windowed rules from config.
+    import config
+
+    def per_reading(spo2, hr, motion):
+        count = 0
+        if spo2 and spo2 < config.SPO2_MIN_THRESHOLD:
+            count += 1
+        if hr and (hr < config.HEART_RATE_MIN or hr > config.HEART_RATE_MAX):
+            count += 1
+        if motion < config.MOTION_MIN_THRESHOLD or motion > config.MOTION_MAX_THRESHOLD:
+            count += 1
+        return count
+
+    normal = (97, 90, 1.0)
+    incidents = {
+        "single glitch (HR dropout + still)": [normal] * 20 + [(97, 20, 0.01)] + [normal] * 20,
+        "sustained SpO2 drop": [normal] * 20 + [(86, 95, 1.0)] * 20,
+        "collapse (HR high, no motion)": [normal] * 20 + [(93, 200, 0.01)] * 20,
+        "intermittent desaturation": [normal, (88, 90, 1.0)] * 20,
+    }
+    # (count rule fires, window rule fires, onset the window rule reports), in
+    # seconds, for the shipped ALERT_RULES: the glitch must not alert, the
+    # sustained incidents must, and each alert is timed from its first bad sample
+    expected = {
+        "single glitch (HR dropout + still)": (60, None, None),
+        "sustained SpO2 drop": (None, 72, 60),
+        "collapse (HR high, no motion)": (60, 66, 60),
+        "intermittent desaturation": (None, 27, 3),
+    }
+
+    print(f"{'incident':38} {'count rule':>12} {'window rule':>22}")
+    for name, trace in incidents.items():
+        evaluator = WindowEvaluator(config.ALERT_RULES, config.SENSOR_READ_INTERVAL)
+        old_first = None
+        new_first = None
+        onset = None
+        for i, (spo2, hr, motion) in enumerate(trace):
+            count = per_reading(spo2, hr, motion)
+            if old_first is None and count >= config.ABNORMAL_COUNT_THRESHOLD:
+                old_first = i * config.SENSOR_READ_INTERVAL
+            fired = evaluator.update({"spo2": spo2, "heart_rate": hr,
+                                      "motion": motion, "abnormal": count})
+            if new_first is None and fired:
+                new_first = i * config.SENSOR_READ_INTERVAL
+                onset = new_first - evaluator.fired_age()
+        old = "-" if old_first is None else f"t={old_first}s"
+        new = "-" if new_first is None else f"t={new_first}s (from t={onset}s)"
+        print(f"{name:38} {old:>12} {new:>22}")
+        assert (old_first, new_first, onset) == expected[name], (name, old_first, new_first, onset)
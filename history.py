@@ -0,0 +1,283 @@
+#compressed in-memory reading history (Gorilla-style): a few bytes per reading in fixed blocks
+#
+# Each reading is (ts, spo2, heart rate, motion, temperature). Values are kept
+# as fixed-point ints (motion and temperature in hundredths). A reading is one
+# control byte followed only by what changed:
+#   bit 0     timestamp delta-of-delta is non-zero -> zigzag varint follows
+#   bits 1-4  field i differs from the previous reading -> zigzag varint delta
+# A block starts from zero state, so every block decodes on its own and the
+# oldest block can be dropped whole when the ring is full.
+
+FIELDS = ("spo2", "heart_rate", "motion", "temperature")
+SCALES = (1, 1, 100, 100)
+
+MAX_SAMPLE_BYTES = 1 + 5 * (1 + len(FIELDS))
+
+
+def _put(buf, pos, value):
+    """Zigzag varint encode a signed int at pos; returns the new position"""
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7F:
+        buf[pos] = (value & 0x7F) | 0x80
+        value >>= 7
+        pos += 1
+    buf[pos] = value
+    return pos + 1
+
+
+def _get(buf, pos):
+    value = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+
+def decode_block(buf, end=None, count=None):
+    """Yield (ts, spo2, heart_rate, motion, temperature) from one encoded block"""
+    if end is None:
+        end = len(buf)
+    ts = delta = 0
+    values = [0] * len(FIELDS)
+    pos = 0
+    n = 0
+    while pos < end and (count is None or n < count):
+        ctrl = buf[pos]
+        pos += 1
+        if ctrl & 1:
+            dod, pos = _get(buf, pos)
+            delta += dod
+        ts += delta
+        bit = 2
+        for i in range(len(FIELDS)):
+            if ctrl & bit:
+                d, pos = _get(buf, pos)
+                values[i] += d
+            bit <<= 1
+        n += 1
+        yield (ts, values[0], values[1], values[2] / SCALES[2], values[3] / SCALES[3])
+
+
+class History:
+    """Ring of fixed-size encoded blocks holding the most recent readings"""
+
+    def __init__(self, blocks=8, block_size=512):
+        self.blocks = [bytearray(block_size) for _ in range(blocks)]
+        self.used = [0] * blocks
+        self.counts = [0] * blocks
+        self.first_ts = [0] * blocks
+        self.last_ts = [0] * blocks
+        self.block_size = block_size
+        self.head = 0         # block being written
+        self.filled = 0       # blocks holding data, oldest is (head - filled + 1)
+        self.evicted = 0
+        self.prev = [0] * len(FIELDS)
+        self.prev_ts = 0
+        self.prev_delta = 0
+
+    def __len__(self):
+        return sum(self.counts)
+
+    @property
+    def nbytes(self):
+        return sum(self.used)
+
+    def _next_block(self):
+        self.head = (self.head + 1) % len(self.blocks)
+        if self.filled == len(self.blocks):
+            self.evicted += self.counts[self.head]
+        else:
+            self.filled += 1
+        self.used[self.head] = 0
+        self.counts[self.head] = 0
+        prev = self.prev
+        for i in range(len(prev)):
+            prev[i] = 0
+        self.prev_ts = 0
+        self.prev_delta = 0
+
+    def append(self, ts, spo2, heart_rate, motion, temperature=0):
+        ts = int(ts)
+        if not self.filled:
+            self.filled = 1
+        elif self.used[self.head] + MAX_SAMPLE_BYTES > self.block_size:
+            self._next_block()
+        head = self.head
+        buf = self.blocks[head]
+        pos = self.used[head]
+        if not self.counts[head]:
+            self.first_ts[head] = ts
+
+        delta = ts - self.prev_ts
+        dod = delta - self.prev_delta
+        self.prev_ts = ts
+        self.prev_delta = delta
+
+        start = pos
+        pos += 1
+        ctrl = 0
+        if dod:
+            ctrl = 1
+            pos = _put(buf, pos, dod)
+        prev = self.prev
+        bit = 2
+        i = 0
+        for value in (spo2, heart_rate, motion, temperature):
+            value = int(value * SCALES[i] + 0.5) if value > 0 else int(value * SCALES[i] - 0.5)
+            if value != prev[i]:
+                ctrl |= bit
+                pos = _put(buf, pos, value - prev[i])
+                prev[i] = value
+            bit <<= 1
+            i += 1
+        buf[start] = ctrl
+
+        self.used[head] = pos
+        self.counts[head] += 1
+        self.last_ts[head] = ts
+
+    def _order(self):
+        n = len(self.blocks)
+        for k in range(self.filled):
+            yield (self.head - self.filled + 1 + k) % n
+
+    def samples(self, since=None):
+        """Lazily decode readings oldest first; blocks entirely before since are skipped"""
+        for b in self._order():
+            if not self.counts[b] or (since is not None and self.last_ts[b] < since):
+                continue
+            for sample in decode_block(self.blocks[b], self.used[b], self.counts[b]):
+                if since is None or sample[0] >= since:
+                    yield sample
+
+    def summary(self, since=None):
+        """Per-field (min, max, mean) over readings since ts, ignoring zero (missing) values"""
+        lo = [None] * len(FIELDS)
+        hi = [None] * len(FIELDS)
+        total = [0.0] * len(FIELDS)
+        n = [0] * len(FIELDS)
+        for sample in self.samples(since):
+            for i in range(len(FIELDS)):
+                v = sample[i + 1]
+                if not v:
+                    continue
+                if n[i] == 0 or v < lo[i]:
+                    lo[i] = v
+                if n[i] == 0 or v > hi[i]:
+                    hi[i] = v
+                total[i] += v
+                n[i] += 1
+        return {FIELDS[i]: (lo[i], hi[i], total[i] / n[i]) for i in range(len(FIELDS)) if n[i]}
+
+    def context(self, since):
+        """Short text of recent readings for an alert SMS"""
+        s = self.summary(since)
+        parts = []
+        if "heart_rate" in s:
+            lo, hi, mean = s["heart_rate"]
+            parts.append(f"HR {lo}-{hi} (avg {mean:.0f})")
+        if "spo2" in s:
+            lo, hi, mean = s["spo2"]
+            parts.append(f"SpO2 {lo}-{hi}%")
+        if "motion" in s:
+            parts.append(f"motion avg {s['motion'][2]:.2f}")
+        if "temperature" in s:
+            lo, hi, _ = s["temperature"]
+            parts.append(f"temp {lo:.1f}-{hi:.1f}C")
+        return ", ".join(parts)
+
+    def export(self, since=None, max_bytes=None):
+        """Encoded blocks covering readings since ts, newest kept when max_bytes is hit.
+
+        Format: repeated (count u16 LE, length u16 LE, block bytes); decode with
+        decode_export(). Blocks are copied as-is, so this costs no re-encoding.
+        """
+        picked = []
+        size = 0
+        for b in reversed(list(self._order())):
+            if not self.counts[b] or (since is not None and self.last_ts[b] < since):
+                continue
+            if max_bytes is not None and size + 4 + self.used[b] > max_bytes:
+                break
+            picked.append(b)
+            size += 4 + self.used[b]
+        out = bytearray(size)
+        pos = 0
+        for b in reversed(picked):
+            n = self.used[b]
+            c = self.counts[b]
+            out[pos] = c & 0xFF
+            out[pos + 1] = c >> 8
+            out[pos + 2] = n & 0xFF
+            out[pos + 3] = n >> 8
+            out[pos + 4:pos + 4 + n] = memoryview(self.blocks[b])[:n]
+            pos += 4 + n
+        return out
+
+
+def decode_export(data, since=None):
+    """Yield readings from History.export() output"""
+    pos = 0
+    while pos + 4 <= len(data):
+        count = data[pos] | data[pos + 1] << 8
+        n = data[pos + 2] | data[pos + 3] << 8
+        pos += 4
+        for sample in decode_block(memoryview(data)[pos:pos + n], n, count):
+            if since is None or sample[0] >= since:
+                yield sample
+        pos += n
+
+
+if __name__ == '__main__':
+    import math
+    import random
+    import time
+
+    random.seed(5)
+    readings = []
+    ts = 1_700_000_000
+    hr = 90.0
+    for i in range(20000):
+        ts += 3 if random.random() > 0.02 else random.randint(4, 9)   # mostly on time, some jitter
+        hr += random.uniform(-2, 2) + (90 - hr) * 0.05
+        spo2 = 97 if random.random() > 0.1 else random.randint(94, 99)
+        motion = round(abs(math.sin(i / 40)) * 2 + random.uniform(0, 0.05), 2)
+        temp = round(38.4 + math.sin(i / 900) * 0.3, 2)
+        readings.append((ts, spo2, int(hr), motion, temp))
+
+    h = History(blocks=1000, block_size=512)
+    start = time.perf_counter()
+    for r in readings:
+        h.append(*r)
+    enc = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = list(h.samples())
+    dec = time.perf_counter() - start
+    assert len(decoded) == len(readings)
+    for a, b in zip(decoded, readings):
+        assert a[:3] == b[:3] and abs(a[3] - b[3]) < 1e-9 and abs(a[4] - b[4]) < 1e-9, (a, b)
+
+    raw = 4 + 1 + 2 + 2 + 2   # u32 ts, u8 spo2, u16 hr, u16 motion, i16 temperature
+    print(f"Readings: {len(readings):,}, encoded {h.nbytes:,} bytes "
+          f"({h.nbytes / len(readings):.2f} B/reading vs {raw} packed, "
+          f"{raw * len(readings) / h.nbytes:.1f}x)")
+    print(f"Encode: {len(readings) / enc:,.0f} readings/s, decode: {len(readings) / dec:,.0f} readings/s")
+
+    small = History(blocks=8, block_size=512)
+    for r in readings:
+        small.append(*r)
+    span = (small.last_ts[small.head] - next(small.samples())[0]) / 60
+    print(f"4 KB ring: {len(small):,} readings, {span:.0f} min of history, {small.evicted:,} evicted")
+
+    since = readings[-1][0] - 600
+    print(f"Last 10 min: {small.context(since)}")
+    blob = small.export(since, max_bytes=1024)
+    back = list(decode_export(blob, since))
+    assert back == [s for s in small.samples(since)]
+    print(f"Export of last 10 min: {len(blob)} bytes, {len(back)} readings")
@@ -0,0 +1,200 @@
+#fall / impact detector with a pre-trigger ring buffer, runs at the raw IMU sample rate
+
+from array import array
+
+IDLE = 0
+SPIKE = 1
+SETTLE = 2
+
+
+class ImpactDetector:
+    """Detect an acceleration spike followed by stillness.
+
+    Samples are raw accelerometer counts. They are shifted down so the
+    squared magnitude stays a small int on MicroPython, which keeps update()
+    free of heap allocations. The last `pre + post` samples are kept in a
+    ring; when an event is confirmed the ring is frozen into `capture` in
+    chronological order, `pre` samples before the spike and `post` after it.
+    """
+
+    SHIFT = 4
+
+    def __init__(self, lsb_per_g, sample_rate=100, threshold_g=3.0,
+                 still_tolerance_g=0.3, still_seconds=1.0,
+                 pre_seconds=0.5, post_seconds=1.5):
+        self.sample_rate = sample_rate
+        self.pre = int(pre_seconds * sample_rate)
+        self.post = int(post_seconds * sample_rate)
+        self.still_needed = min(int(still_seconds * sample_rate), self.post)
+        self.size = self.pre + self.post
+
+        g = lsb_per_g >> self.SHIFT
+        self.g = g
+        self.spike_sq = int(threshold_g * g) ** 2
+        self.still_lo = int((1 - still_tolerance_g) * g) ** 2
+        self.still_hi = int((1 + still_tolerance_g) * g) ** 2
+
+        self.ring = array('h', bytes(6 * self.size))
+        self.capture = array('h', bytes(6 * self.size))
+        self.reset()
+
+    def reset(self):
+        self.pos = 0
+        self.state = IDLE
+        self.after = 0
+        self.still = 0
+        self.peak_sq = 0
+        self.event_ready = False
+        self.event_peak_sq = 0
+        self.events = 0
+
+    def update(self, x, y, z):
+        ring = self.ring
+        i = self.pos * 3
+        ring[i] = x
+        ring[i + 1] = y
+        ring[i + 2] = z
+        self.pos += 1
+        if self.pos == self.size:
+            self.pos = 0
+
+        if self.event_ready:
+            return False
+
+        x >>= self.SHIFT
+        y >>= self.SHIFT
+        z >>= self.SHIFT
+        mag_sq = x * x + y * y + z * z
+
+        state = self.state
+        if state == IDLE:
+            if mag_sq >= self.spike_sq:
+                self.state = SPIKE
+                self.peak_sq = mag_sq
+                self.after = 0
+                self.still = 0
+            return False
+
+        self.after += 1
+        if state == SPIKE:
+            if mag_sq > self.peak_sq:
+                self.peak_sq = mag_sq
+            if mag_sq < self.spike_sq:
+                self.state = SETTLE
+        elif self.still_lo <= mag_sq <= self.still_hi:
+            self.still += 1
+
+        if self.after >= self.post:
+            if self.still >= self.still_needed:
+                self._freeze()
+                self.state = IDLE
+                return True
+            self.state = IDLE
+        return False
+
+    def _freeze(self):
+        # ring[pos] is the oldest sample, so copying from there is chronological
+        ring = self.ring
+        capture = self.capture
+        n = self.size * 3
+        start = self.pos * 3
+        for i in range(n):
+            j = start + i
+            if j >= n:
+                j -= n
+            capture[i] = ring[j]
+        self.event_peak_sq = self.peak_sq
+        self.event_ready = True
+        self.events += 1
+
+    def peak_g(self):
+        """Peak magnitude of the last event in g (allocates, call outside the loop)"""
+        return (self.event_peak_sq ** 0.5) / self.g
+
+    def clear(self):
+        self.event_ready = False
+
+
+if __name__ == '__main__':
+    # Synthetic impact waveforms at 100 Hz, +-8 g range (4096 LSB/g).
+    import math
+    import random
+
+    random.seed(3)
+    LSB = 4096
+    RATE = 100
+
+    def sample(gx, gy, gz, noise=0.02):
+        return (int((gx + random.gauss(0, noise)) * LSB),
+                int((gy + random.gauss(0, noise)) * LSB),
+                int((gz + random.gauss(0, noise)) * LSB))
+
+    def walking(seconds):
+        for i in range(int(seconds * RATE)):
+            v = 0.4 * math.sin(2 * math.pi * 1.8 * i / RATE)
+            yield sample(0.1, 0.0, 1.0 + v, 0.1)
+
+    def still(seconds, gx=0.0, gy=0.0, gz=1.0):
+        for _ in range(int(seconds * RATE)):
+            yield sample(gx, gy, gz)
+
+    def spike(peak_g, ms):
+        n = max(1, ms * RATE // 1000)
+        for i in range(n):
+            g = peak_g * math.sin(math.pi * (i + 0.5) / n)
+            yield sample(0.3 * g, 0.2 * g, g, 0.1)
+
+    def freefall(ms):
+        for _ in range(ms * RATE // 1000):
+            yield sample(0.0, 0.0, 0.05, 0.05)
+
+    def play(seconds):
+        for _ in range(int(seconds * RATE)):
+            yield sample(random.uniform(-1.5, 1.5), random.uniform(-1.5, 1.5),
+                         1.0 + random.uniform(-1.5, 1.5), 0.2)
+
+    def chain(*parts):
+        for part in parts:
+            for s in part:
+                yield s
+
+    scenarios = [
+        ("fall then lying still", True,
+         chain(walking(3), freefall(300), spike(6.0, 40), still(3, 1.0, 0.0, 0.0))),
+        ("hit while walking, down", True,
+         chain(walking(3), spike(5.0, 30), still(3, 0.0, 1.0, 0.0))),
+        ("jump during play", False,
+         chain(play(2), spike(3.5, 60), play(3))),
+        ("walking only", False, walking(6)),
+        ("collar knock, keeps walking", False,
+         chain(walking(2), spike(4.0, 20), walking(3))),
+    ]
+
+    try:
+        import gc
+        mem_alloc = gc.mem_alloc
+    except AttributeError:
+        mem_alloc = None
+
+    failures = 0
+    for name, expected, wave in scenarios:
+        det = ImpactDetector(LSB, sample_rate=RATE)
+        samples = list(wave)
+        fired_at = None
+        if mem_alloc:
+            gc.collect()
+            before = mem_alloc()
+        for i in range(len(samples)):
+            x, y, z = samples[i]
+            if det.update(x, y, z) and fired_at is None:
+                fired_at = i
+        allocated = mem_alloc() - before if mem_alloc else None
+        ok = (fired_at is not None) == expected
+        failures += not ok
+        detail = f"fired at {fired_at * 1000 // RATE} ms, peak {det.peak_g():.1f} g" if fired_at is not None else "no event"
+        if allocated is not None:
+            detail += f", {allocated} bytes allocated"
+        print(f"{'PASS' if ok else 'FAIL'}  {name:30} {detail}")
+        if fired_at is not None:
+            assert len(det.capture) == 3 * (det.pre + det.post)
+    print(f"{len(scenarios) - failures}/{len(scenarios)} scenarios passed")
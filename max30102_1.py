@@ -1,6 +1,11 @@
 
-from machine import I2C
+try:
+    from machine import I2C
+except ImportError:
+    I2C = None
 import time
+from clock import sleep_ms
+from recorder import REC_PPG
 
 class MAX30102:
     
@@ -28,15 +33,26 @@ class MAX30102:
     REG_PROX_INT_THRESH = 0x30
     REG_REV_ID = 0xFE
     REG_PART_ID = 0xFF
+
+    SAMPLE_RATES = (50, 100, 200, 400, 800, 1000, 1600, 3200)   # SPO2_CONFIG SR codes
+    AVERAGES = (1, 2, 4, 8, 16, 32)                             # FIFO_CONFIG SMP_AVE codes
     
-    def __init__(self, i2c, address=0x57):
+    def __init__(self, i2c, address=0x57, recorder=None):
         
         self.i2c = i2c
         self.address = address
+        self.recorder = recorder
+        # written by setup(); kept so the rate and LED setters change only their own bits
+        self.fifo_config = 0x4F
+        self.spo2_config = 0x27
+        self.led_amplitude = (0x24, 0x24)
+        # samples the chip dropped while the FIFO was full, just before the last block read
+        self.fifo_lost = 0
+        self.last_fifo = None
         
         
         self.reset()
-        time.sleep_ms(100)
+        sleep_ms(100)
         
         
         self.setup()
@@ -44,45 +60,101 @@ class MAX30102:
     def reset(self):
         
         self.i2c.writeto_mem(self.address, self.REG_MODE_CONFIG, b'\x40')
-        time.sleep_ms(100)
+        sleep_ms(100)
     
     def setup(self):
         
-        self.i2c.writeto_mem(self.address, self.REG_FIFO_CONFIG, b'\x4F')
+        self.i2c.writeto_mem(self.address, self.REG_FIFO_CONFIG, bytes([self.fifo_config]))
         
         
         self.i2c.writeto_mem(self.address, self.REG_MODE_CONFIG, b'\x03')
         
         
-        self.i2c.writeto_mem(self.address, self.REG_SPO2_CONFIG, b'\x27')
+        self.i2c.writeto_mem(self.address, self.REG_SPO2_CONFIG, bytes([self.spo2_config]))
         
         
-        self.i2c.writeto_mem(self.address, self.REG_LED1_PA, b'\x24')  
-        self.i2c.writeto_mem(self.address, self.REG_LED2_PA, b'\x24')  
+        self.i2c.writeto_mem(self.address, self.REG_LED1_PA, bytes([self.led_amplitude[0]]))
+        self.i2c.writeto_mem(self.address, self.REG_LED2_PA, bytes([self.led_amplitude[1]]))
         
         
         self.i2c.writeto_mem(self.address, self.REG_PILOT_PA, b'\x7F')
     
+    @property
+    def sample_rate(self):
+        return self.SAMPLE_RATES[(self.spo2_config >> 2) & 0x07]
+
+    @property
+    def average(self):
+        return self.AVERAGES[min(self.fifo_config >> 5, 5)]
+
+    @property
+    def output_rate(self):
+        """Samples per second reaching the FIFO"""
+        return self.sample_rate / self.average
+
+    def set_sample_rate(self, sps, average):
+        """Internal sample rate and FIFO averaging; the FIFO fills at sps / average.
+
+        ADC range and pulse width are kept. The FIFO is cleared, since what
+        it holds was sampled at the old rate.
+        """
+        sr = self.SAMPLE_RATES.index(sps)
+        ave = self.AVERAGES.index(average)
+        self.spo2_config = (self.spo2_config & 0x63) | (sr << 2)
+        self.fifo_config = (self.fifo_config & 0x1F) | (ave << 5)
+        self.i2c.writeto_mem(self.address, self.REG_SPO2_CONFIG, bytes([self.spo2_config]))
+        self.i2c.writeto_mem(self.address, self.REG_FIFO_CONFIG, bytes([self.fifo_config]))
+        self.clear_fifo()
+
+    def clear_fifo(self):
+        # FIFO_WR_PTR, OVF_COUNTER, FIFO_RD_PTR in one auto-incrementing write
+        self.i2c.writeto_mem(self.address, self.REG_FIFO_WR_PTR, b'\x00\x00\x00')
+
+    def set_led_amplitude(self, red, ir):
+        """LED pulse amplitudes, 0.2 mA per step (0-255); the FIFO is kept"""
+        self.led_amplitude = (red, ir)
+        self.i2c.writeto_mem(self.address, self.REG_LED1_PA, bytes((red, ir)))
+
+    def enable_fifo_interrupt(self):
+        """Pull INT low when the FIFO is almost full (FIFO_A_FULL in FIFO_CONFIG)"""
+        self.i2c.writeto_mem(self.address, self.REG_INTR_ENABLE_1, b'\x80')
+        self.clear_interrupt()
+
+    def clear_interrupt(self):
+        """Read (and so clear) INTR_STATUS_1; returns it"""
+        return self.i2c.readfrom_mem(self.address, self.REG_INTR_STATUS_1, 1)[0]
+
     def read_fifo(self):
-        
+        """Raw FIFO bytes (6 per sample: RED[3], IR[3]) or None.
+
+        Rollover is off, so a full FIFO has equal pointers and drops new
+        samples; fifo_lost says how many were lost after this block.
+        """
         wr_ptr = self.i2c.readfrom_mem(self.address, self.REG_FIFO_WR_PTR, 1)[0]
         
         rd_ptr = self.i2c.readfrom_mem(self.address, self.REG_FIFO_RD_PTR, 1)[0]
         
         
         num_samples = (wr_ptr - rd_ptr) & 0x1F
-        
+        self.fifo_lost = 0
         if num_samples == 0:
-            return None
+            # empty, or full: only the overflow counter tells them apart
+            self.fifo_lost = self.i2c.readfrom_mem(self.address, self.REG_OVF_COUNTER, 1)[0] & 0x1F
+            if not self.fifo_lost:
+                return None
+            num_samples = 32
         
         
         fifo_data = self.i2c.readfrom_mem(self.address, self.REG_FIFO_DATA, num_samples * 6)
-        
+        if self.recorder:
+            self.recorder.record(REC_PPG, fifo_data)
+        self.last_fifo = fifo_data
         return fifo_data
     
-    def read_spo2(self):
-        
-        data = self.read_fifo()
+    def read_spo2(self, data=None):
+        """SpO2 from FIFO data already read (default: the last read_fifo block); does not touch the FIFO"""
+        if data is None:
+            data = self.last_fifo
         
         if data is None or len(data) < 6:
             
@@ -91,9 +163,10 @@ class MAX30102:
        
         return 98 
     
-    def read_heart_rate(self):
-        
-        data = self.read_fifo()
+    def read_heart_rate(self, data=None):
+        """Heart rate from FIFO data already read; does not touch the FIFO"""
+        if data is None:
+            data = self.last_fifo
         
         if data is None or len(data) < 6:
             
@@ -102,7 +175,7 @@ class MAX30102:
         return 75 
     
     def get_all_data(self):
-    
+        self.read_fifo()
         return {
             'spo2': self.read_spo2(),
             'heart_rate': self.read_heart_rate()
@@ -110,24 +183,19 @@ class MAX30102:
 
 
 
-    if __name__ == '__main__':
-        from machine import Pin
-    
-        print("MAX30102 Test")
-        print("=" * 40)
-    
-    
+if __name__ == '__main__':
+    from machine import Pin
+
+    print("MAX30102 Test")
+    print("=" * 40)
+
     i2c = I2C(0, scl=Pin(5), sda=Pin(4), freq=400000)
-    
- 
     devices = i2c.scan()
     print(f"I2C devices found: {[hex(d) for d in devices]}")
-    
+
     if 0x57 in devices:
-      
         max_sensor = MAX30102(i2c)
-        
-        
+
         print("\nReading sensor data...")
         for i in range(5):
             data = max_sensor.get_all_data()
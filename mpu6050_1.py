@@ -1,7 +1,12 @@
 
 
-from machine import I2C
+try:
+    from machine import I2C
+except ImportError:
+    I2C = None
 import time
+from clock import sleep_ms
+from recorder import REC_MPU
 
 class MPU6050:
 
@@ -9,13 +14,107 @@ class MPU6050:
     ACCEL_XOUT_H = 0x3B
     GYRO_XOUT_H = 0x43
     TEMP_OUT_H = 0x41
+    ACCEL_CONFIG = 0x1C
+    MOT_THR = 0x1F
+    MOT_DUR = 0x20
+    INT_PIN_CFG = 0x37
+    INT_ENABLE = 0x38
+    INT_STATUS = 0x3A
+    PWR_MGMT_2 = 0x6C
+    XA_OFFS_H = 0x06      # accel offset trim, +-16 g units (2048 LSB/g), bit 0 reserved
+    XG_OFFS_USRH = 0x13   # gyro offset, +-1000 dps units (32.8 LSB/dps)
+
+    ACCEL_RANGES = {2: 0x00, 4: 0x08, 8: 0x10, 16: 0x18}
+    LP_WAKE_RATES = {1: 0, 5: 1, 20: 2, 40: 3}   # Hz -> LP_WAKE_CTRL (1 = 1.25 Hz)
     
-    def __init__(self, i2c, address=0x68):
+    def __init__(self, i2c, address=0x68, recorder=None):
         self.i2c = i2c
         self.address = address
+        self.accel_lsb = 16384
+        self.accel_config = 0x00
+        self.gyro_lsb = 131
+        self.recorder = recorder
+        self._accel_buf = bytearray(6)
+        # software bias for chips without working offset registers, in raw counts
+        self.accel_bias = (0, 0, 0)
+        self.gyro_bias = (0, 0, 0)
+        self._accel_bias_16g = None
         
         self.i2c.writeto_mem(self.address, self.PWR_MGMT_1, b'\x00')
-        time.sleep_ms(100)
+        sleep_ms(100)
+
+    def set_accel_range(self, g):
+        """Set accelerometer full scale to 2, 4, 8 or 16 g"""
+        self.accel_config = (self.accel_config & 0x07) | self.ACCEL_RANGES[g]
+        self.i2c.writeto_mem(self.address, self.ACCEL_CONFIG, bytes([self.accel_config]))
+        self.accel_lsb = 32768 // g
+        if self._accel_bias_16g:
+            self.set_software_bias(self._accel_bias_16g, None)
+
+    def read_offsets(self):
+        """Offset registers as (accel, gyro) lists of signed ints"""
+        out = []
+        for reg in (self.XA_OFFS_H, self.XG_OFFS_USRH):
+            raw = self.i2c.readfrom_mem(self.address, reg, 6)
+            out.append([(raw[i] << 8 | raw[i + 1]) - ((raw[i] & 0x80) << 9) for i in (0, 2, 4)])
+        return out[0], out[1]
+
+    def write_offsets(self, accel, gyro):
+        """Write both offset banks; returns False if they do not read back (some clones)"""
+        for reg, values in ((self.XA_OFFS_H, accel), (self.XG_OFFS_USRH, gyro)):
+            buf = bytearray(6)
+            for i in range(3):
+                v = values[i] & 0xFFFF
+                buf[2 * i] = v >> 8
+                buf[2 * i + 1] = v & 0xFF
+            self.i2c.writeto_mem(self.address, reg, buf)
+        return self.read_offsets() == (list(accel), list(gyro))
+
+    def set_software_bias(self, accel_16g, gyro_1000dps):
+        """Subtract biases in the getters instead; given in offset-register units"""
+        if accel_16g is not None:
+            self._accel_bias_16g = accel_16g
+            self.accel_bias = tuple(v * self.accel_lsb // 2048 for v in accel_16g)
+        if gyro_1000dps is not None:
+            self.gyro_bias = tuple(round(v * self.gyro_lsb / 32.8) for v in gyro_1000dps)
+
+    def enable_motion_interrupt(self, threshold_mg=64, duration_ms=5):
+        """Raise INT (active high, latched until INT_STATUS is read) on motion above threshold"""
+        # the motion detector compares high-passed accel: DHPF 5 Hz
+        self.accel_config = (self.accel_config & 0x18) | 0x01
+        self.i2c.writeto_mem(self.address, self.ACCEL_CONFIG, bytes([self.accel_config]))
+        self.i2c.writeto_mem(self.address, self.MOT_THR, bytes([min(255, threshold_mg // 2)]))
+        self.i2c.writeto_mem(self.address, self.MOT_DUR, bytes([min(255, duration_ms)]))
+        self.i2c.writeto_mem(self.address, self.INT_PIN_CFG, b'\x20')   # LATCH_INT_EN
+        self.i2c.writeto_mem(self.address, self.INT_ENABLE, b'\x40')    # MOT_EN
+        self.clear_interrupt()
+
+    def clear_interrupt(self):
+        """Read (and so clear) INT_STATUS; returns it"""
+        return self.i2c.readfrom_mem(self.address, self.INT_STATUS, 1)[0]
+
+    def set_low_power(self, wake_hz=5):
+        """Accel-only cycle mode: gyro and temperature off, one accel sample per wake"""
+        lp = self.LP_WAKE_RATES[wake_hz]
+        self.i2c.writeto_mem(self.address, self.PWR_MGMT_2, bytes([(lp << 6) | 0x07]))
+        self.i2c.writeto_mem(self.address, self.PWR_MGMT_1, b'\x28')   # CYCLE | TEMP_DIS
+
+    def wake(self):
+        """Back to continuous accel + gyro sampling"""
+        self.i2c.writeto_mem(self.address, self.PWR_MGMT_1, b'\x00')
+        self.i2c.writeto_mem(self.address, self.PWR_MGMT_2, b'\x00')
+
+    def read_imu_raw_into(self, buf):
+        """Burst-read accel, temp and gyro (14 bytes, big-endian) into a preallocated buffer"""
+        self.i2c.readfrom_mem_into(self.address, self.ACCEL_XOUT_H, buf)
+        if self.recorder:
+            self.recorder.record(REC_MPU, buf)
+
+    def read_accel_raw_into(self, buf):
+        """Burst-read the 6 accel bytes (big-endian x, y, z) into a preallocated buffer"""
+        self.i2c.readfrom_mem_into(self.address, self.ACCEL_XOUT_H, buf)
+        if self.recorder:
+            self.recorder.record(REC_MPU, buf)
     
     def read_raw_data(self, register):
         high = self.i2c.readfrom_mem(self.address, register, 1)[0]
@@ -29,10 +128,13 @@ class MPU6050:
         return value
     
     def get_accel_data(self):
-        accel_x = self.read_raw_data(self.ACCEL_XOUT_H)
-        accel_y = self.read_raw_data(self.ACCEL_XOUT_H + 2)
-        accel_z = self.read_raw_data(self.ACCEL_XOUT_H + 4)
-        scale = 9.81 / 16384.0
+        buf = self._accel_buf
+        self.read_accel_raw_into(buf)
+        bias = self.accel_bias
+        accel_x = (buf[0] << 8 | buf[1]) - ((buf[0] & 0x80) << 9) - bias[0]
+        accel_y = (buf[2] << 8 | buf[3]) - ((buf[2] & 0x80) << 9) - bias[1]
+        accel_z = (buf[4] << 8 | buf[5]) - ((buf[4] & 0x80) << 9) - bias[2]
+        scale = 9.81 / self.accel_lsb
         
         return {
             'x': accel_x * scale,
@@ -41,10 +143,11 @@ class MPU6050:
         }
     
     def get_gyro_data(self):
-        gyro_x = self.read_raw_data(self.GYRO_XOUT_H)
-        gyro_y = self.read_raw_data(self.GYRO_XOUT_H + 2)
-        gyro_z = self.read_raw_data(self.GYRO_XOUT_H + 4)
-        scale = 1.0 / 131.0
+        bias = self.gyro_bias
+        gyro_x = self.read_raw_data(self.GYRO_XOUT_H) - bias[0]
+        gyro_y = self.read_raw_data(self.GYRO_XOUT_H + 2) - bias[1]
+        gyro_z = self.read_raw_data(self.GYRO_XOUT_H + 4) - bias[2]
+        scale = 1.0 / self.gyro_lsb
         
         return {
             'x': gyro_x * scale,
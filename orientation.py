@@ -0,0 +1,189 @@
+#fixed-point complementary filter: fuses raw accel + gyro into pitch/roll/posture
+
+try:
+    import micropython
+except ImportError:
+    # host stand-in; MicroPython only compiles natively when the decorator
+    # is written out as @micropython.native, so no alias for it
+    class micropython:
+        @staticmethod
+        def native(f):
+            return f
+
+STANDING = 0
+LYING = 1
+UPSIDE_DOWN = 2
+POSTURE_NAMES = ("standing", "lying", "upside down")
+
+# Angles are kept in centidegrees << 4 so the gyro integration keeps some
+# fractional precision while every intermediate stays a small int.
+_Q = 4
+_HALF_TURN = 18000 << _Q
+_FULL_TURN = 36000 << _Q
+
+
+@micropython.native
+def atan2_cd(y, x):
+    """Integer atan2 in centidegrees, max error about 0.1 degree"""
+    if x == 0 and y == 0:
+        return 0
+    ax = x if x >= 0 else -x
+    ay = y if y >= 0 else -y
+    if ay <= ax:
+        t = (y << 12) // x
+        swap = False
+    else:
+        t = (x << 12) // y
+        swap = True
+    a = t if t >= 0 else -t
+    # atan(t) ~ 45t - t(|t|-1)(14.02 + 3.80|t|) degrees, t in Q12
+    r = (4500 * t - ((t * (a - 4096)) >> 12) * (1402 + ((380 * a) >> 12))) >> 12
+    if swap:
+        r = (9000 if y > 0 else -9000) - r
+    elif x < 0:
+        r += 18000 if y >= 0 else -18000
+    return r
+
+
+class OrientationFilter:
+    """Complementary filter on raw MPU6050 counts.
+
+    All state is a handful of ints allocated in __init__; update() only does
+    integer arithmetic so it can run at the IMU sample rate on the collar.
+    """
+
+    def __init__(self, sample_rate=100, gyro_lsb=131, alpha=0.98,
+                 lying_deg=50, upside_down_deg=135):
+        self.sample_rate = sample_rate
+        # gyro counts -> (centidegrees << Q) per sample, in Q12
+        self.gyro_gain = int((100 << _Q) * 4096 / (gyro_lsb * sample_rate))
+        self.alpha = int(alpha * 1024)
+        self.lying = lying_deg * 100
+        self.upside_down = upside_down_deg * 100
+        self.reset()
+
+    def reset(self):
+        self.pitch_q = 0
+        self.roll_q = 0
+        self.primed = False
+        self.posture = STANDING
+
+    @micropython.native
+    def update(self, ax, ay, az, gx, gy):
+        # accel tilt; |(ay, az)| via alpha-max-beta-min to avoid a sqrt
+        m = ay if ay >= 0 else -ay
+        n = az if az >= 0 else -az
+        if n > m:
+            m, n = n, m
+        acc_roll = atan2_cd(ay, az) << _Q
+        acc_pitch = atan2_cd(-ax, (m * 983 + n * 407) >> 10) << _Q
+
+        if not self.primed:
+            self.roll_q = acc_roll
+            self.pitch_q = acc_pitch
+            self.primed = True
+        else:
+            gain = self.gyro_gain
+            alpha = self.alpha
+            roll = self.roll_q + ((gx * gain) >> 12)
+            pitch = self.pitch_q + ((gy * gain) >> 12)
+            # keep the accel angle on the same side of +-180 as the estimate
+            if acc_roll - roll > _HALF_TURN:
+                acc_roll -= _FULL_TURN
+            elif roll - acc_roll > _HALF_TURN:
+                acc_roll += _FULL_TURN
+            roll = (alpha * roll + (1024 - alpha) * acc_roll) >> 10
+            if roll > _HALF_TURN:
+                roll -= _FULL_TURN
+            elif roll < -_HALF_TURN:
+                roll += _FULL_TURN
+            self.roll_q = roll
+            self.pitch_q = (alpha * pitch + (1024 - alpha) * acc_pitch) >> 10
+
+        r = self.roll_q >> _Q
+        if r < 0:
+            r = -r
+        if r >= self.upside_down:
+            self.posture = UPSIDE_DOWN
+        elif r >= self.lying:
+            self.posture = LYING
+        else:
+            self.posture = STANDING
+        return self.posture
+
+    @property
+    def pitch(self):
+        """Pitch in degrees"""
+        return (self.pitch_q >> _Q) / 100
+
+    @property
+    def roll(self):
+        """Roll in degrees"""
+        return (self.roll_q >> _Q) / 100
+
+    @property
+    def posture_name(self):
+        return POSTURE_NAMES[self.posture]
+
+
+if __name__ == '__main__':
+    # Accuracy on a synthetic roll from standing onto the back, then update
+    # throughput. Runs unchanged on CPython and the MicroPython unix port:
+    #   python3 orientation.py
+    #   micropython orientation.py
+    import math
+    from clock import ticks_us, ticks_diff
+
+    RATE = 100
+    ACC_LSB = 4096
+    GYRO_LSB = 131
+
+    def frames(seconds, roll_rate_dps):
+        frames = []
+        roll = 0.0
+        for i in range(seconds * RATE):
+            wobble = 0.15 * math.sin(i * 0.9)
+            r = math.radians(roll)
+            rate = roll_rate_dps if roll < 180.0 else 0.0
+            frames.append((int(wobble * ACC_LSB),
+                           int(math.sin(r) * ACC_LSB),
+                           int(math.cos(r) * ACC_LSB),
+                           int((rate + 3.0) * GYRO_LSB),
+                           int(2.0 * GYRO_LSB),
+                           roll))
+            roll = min(180.0, roll + rate / RATE)
+        return frames
+
+    worst = 0
+    for x in range(-30000, 30001, 1500):
+        for y in range(-30000, 30001, 1500):
+            err = abs(atan2_cd(y, x) - round(math.degrees(math.atan2(y, x)) * 100))
+            if err > 18000:
+                err = 36000 - err
+            if err > worst:
+                worst = err
+    print(f"atan2_cd worst error: {worst / 100:.2f} deg")
+
+    flt = OrientationFilter(sample_rate=RATE, gyro_lsb=GYRO_LSB)
+    seen = []
+    max_err = 0.0
+    for ax, ay, az, gx, gy, truth in frames(6, 45):
+        posture = flt.update(ax, ay, az, gx, gy)
+        if not seen or seen[-1] != posture:
+            seen.append(posture)
+        err = abs(flt.roll - truth)
+        if err > 180:
+            err = 360 - err
+        if err > max_err:
+            max_err = err
+    print(f"roll tracking max error: {max_err:.1f} deg (gyro biased by 3 deg/s)")
+    print("posture sequence: " + " -> ".join(POSTURE_NAMES[p] for p in seen))
+
+    data = frames(10, 20)
+    flt.reset()
+    start = ticks_us()
+    for f in data:
+        flt.update(f[0], f[1], f[2], f[3], f[4])
+    elapsed = ticks_diff(ticks_us(), start)
+    print(f"throughput: {len(data) * 1000000 // elapsed} updates/s "
+          f"({elapsed / len(data):.1f} us/update)")
@@ -1,9 +1,28 @@
-import network
 import time
+_BOOT_TICKS = time.ticks_ms()
 from machine import I2C, Pin
 import gc
+import sys
+from array import array
 import config
-from twilio_client import TwilioClient
+from baseline import AdaptiveBaseline
+from health_window import WindowEvaluator
+from activity import ActivityClassifier, ACTIVITY_NAMES, REST
+from impact import ImpactDetector
+from orientation import OrientationFilter, POSTURE_NAMES
+from hrv import HRVMonitor
+from ppg_control import PPGController
+from health_rules import analyze_health, ISSUE_IMPACT
+from telemetry import TelemetryBuffer, HttpTransport, MqttTransport
+from recorder import Recorder
+from wifi_manager import WifiManager, IDLE
+from power import DutyCycler, WAKE_MOTION, WAKE_PPG
+from history import History
+from alert_trace import AlertTrace, TraceBuffer
+from bus_health import BusGuard
+from calibration import MPUCalibration, device_key
+from sampler import SamplingWorker, SlotRing, ByteRing
+from device_registry import DeviceRegistry, Mux, KIND_MPU, KIND_MAX
 try:
     from mpu6050_1 import MPU6050
     from max30102_1 import MAX30102
@@ -18,93 +37,631 @@ except ImportError:
     print(" GPS module not found. GPS tracking disabled.")
     GPS_AVAILABLE = False
 
+# alert kinds, each with its own cooldown
+ALERT_HEALTH = 1
+ALERT_IMPACT = 2
+
+
+def merge_issues(queued, new):
+    """Issues of a queued alert plus a newer one's; a repeat (same text before
+    any ':') takes the newer reading instead of growing the list"""
+    merged = list(queued)
+    keys = [issue.split(":")[0] for issue in merged]
+    for issue in new:
+        key = issue.split(":")[0]
+        if key in keys:
+            merged[keys.index(key)] = issue
+        else:
+            merged.append(issue)
+            keys.append(key)
+    return merged
+
 
 class PetHealthMonitor:
     def __init__(self):
         """Initialize the monitoring system"""
         self.last_alert_time = 0
+        self.last_impact_time = 0
         self.last_gps_update = 0
         self.wifi = None
+        self.pending_alert = None
+        self.traces = TraceBuffer(config.ALERT_TRACE_SIZE, config.ALERT_LATENCY_TARGET_MS)
+        self.abnormal_since = None
         self.i2c = None
+        self.bus = None
+        self.mux = None
+        self.registry = None
         self.mpu_sensor = None  
         self.max_sensor = None
+        self.mpu_channel = config.MPU6050_CHANNEL
+        self.max_channel = config.MAX30102_CHANNEL
         self.twilio = None
         self.gps = None
         self.current_location = None
+        self.activity = REST
+        self.classifier = ActivityClassifier(
+            sample_rate=config.ACTIVITY_SAMPLE_RATE,
+            window=config.ACTIVITY_WINDOW
+        )
+        self.activity_buf = array('f', [0.0] * (3 * config.ACTIVITY_BURST_SAMPLES))
+        self.baseline = None
+        self.impact = None
+        self.orientation = None
+        self.hrv = None
+        self.ppg = None
+        self.ppg_poll_ms = config.PPG_POLL_INTERVAL_MS
+        self.ppg_read = 0
+        self.ppg_last = None
+        self.telemetry = None
+        self.recorder = None
+        self.power = None
+        self.imu_active = True
+        self.sampler = None
+        self.imu_count = 0
+        self.imu_errors = 0
+        self.gps_polled = False
+        self.status = None
+        self.reading_timing = None
+        self.last_reading = None
+        self.history = History(config.HISTORY_BLOCKS, config.HISTORY_BLOCK_SIZE) if config.USE_HISTORY else None
+        self.issue_mask = 0
+        self.imu_buf = bytearray(14)
+        self.window = WindowEvaluator(config.ALERT_RULES, config.SENSOR_READ_INTERVAL)
+        self.twilio_checked = False
+        self.first_sample_done = False
+        self.boot_marks = []
+        self.mark_boot("imports")
 
         print("=" * 50)
         print("Pet Health Monitor Starting...")
         print("=" * 50)
-        self.connect_wifi()
+        if not config.FAST_BOOT:
+            self.connect_wifi()
+            self.mark_boot("wifi")
+        if config.USE_RECORDER:
+            self.init_recorder()
         if SENSORS_AVAILABLE and not config.SIMULATE_SENSORS:
             self.init_sensors()
+            if config.USE_MPU_CALIBRATION:
+                self.init_calibration()
+            if config.USE_IMPACT_DETECTION:
+                self.init_impact()
+            if config.USE_ORIENTATION:
+                self.init_orientation()
+            if config.USE_HRV:
+                self.init_hrv()
+                if config.USE_PPG_CONTROL:
+                    self.init_ppg_control()
+            if config.LOW_POWER_MODE:
+                self.init_power()
         else:
             print(" Running in SIMULATION mode")
+        self.mark_boot("sensors")
         if config.USE_GPS and GPS_AVAILABLE:
             self.init_gps()
         else:
             print(" GPS tracking disabled")
+        if config.USE_SAMPLING_THREAD and self.mpu_sensor and not self.power:
+            self.init_sampler()
+        if config.USE_ADAPTIVE_BASELINE:
+            self.init_baseline()
+        self.mark_boot("gps/baseline")
+        if config.FAST_BOOT:
+            # sampling starts right after this; WiFi and the Twilio check follow in the loop
+            self.connect_wifi()
+            self.mark_boot("wifi")
+        if config.USE_TELEMETRY:
+            self.init_telemetry()
         self.init_twilio()
+        self.mark_boot("twilio")
 
         print(" System initialized successfully!")
         print("=" * 50)
     
+    def mark_boot(self, label):
+        self.boot_marks.append((label, time.ticks_ms()))
+
+    def report_boot(self):
+        """Print boot-to-first-sample time, split by init phase"""
+        now = time.ticks_ms()
+        parts = []
+        prev = _BOOT_TICKS
+        for label, ticks in self.boot_marks:
+            parts.append(f"{label} {time.ticks_diff(ticks, prev)}")
+            prev = ticks
+        parts.append(f"first reading {time.ticks_diff(now, prev)}")
+        print(f" Boot to first sample: {time.ticks_diff(now, _BOOT_TICKS)} ms ({', '.join(parts)} ms)")
+
     def connect_wifi(self):
+        """Start connecting in the background; the main loop keeps it up"""
         print(f" Connecting to WiFi: {config.WIFI_SSID}")
-        
-        self.wifi = network.WLAN(network.STA_IF)
-        self.wifi.active(True)
-        self.wifi.connect(config.WIFI_SSID, config.WIFI_PASSWORD)
-        timeout = 20
-        while not self.wifi.isconnected() and timeout > 0:
-            print(".", end="")
-            time.sleep(1)
-            timeout -= 1
-        
-        if self.wifi.isconnected():
-            print(f"\n WiFi connected!")
-            print(f"   IP: {self.wifi.ifconfig()[0]}")
+        self.wifi = WifiManager(
+            config.WIFI_SSID,
+            config.WIFI_PASSWORD,
+            cache_file=config.WIFI_CACHE_FILE,
+            connect_timeout_ms=config.WIFI_CONNECT_TIMEOUT * 1000,
+            backoff_min_ms=config.WIFI_BACKOFF_MIN * 1000,
+            backoff_max_ms=config.WIFI_BACKOFF_MAX * 1000,
+            power_save=config.LOW_POWER_MODE
+        )
+        if config.LOW_POWER_MODE:
+            print(" Low-power mode: radio stays off until there is an alert or telemetry to send")
+            return
+        self.wifi.start()
+        if self.wifi.connected:
+            print(f" WiFi connected! IP: {self.wifi.ifconfig()[0]}")
         else:
-            print("\n WiFi connection failed!")
-            raise Exception("WiFi connection timeout")
+            print(" WiFi connecting in background, monitoring starts now")
     
     def init_sensors(self):
         """Initialize I2C and sensors"""
         print(" Initializing sensors...")
-        self.i2c = I2C(0, scl=Pin(config.I2C_SCL_PIN), sda=Pin(config.I2C_SDA_PIN), freq=config.I2C_FREQ)
+        self.i2c = self.make_i2c()
+        if config.USE_BUS_GUARD:
+            self.init_bus_guard()
         
         if config.USE_MULTIPLEXER:
             print(f"   Using TCA9548A multiplexer at 0x{config.TCA9548A_ADDRESS:02X}")
-            self.select_mux_channel(config.MPU6050_CHANNEL)
-            self.mpu_sensor = MPU6050(self.i2c)
-            print(f" MPU6050 on channel {config.MPU6050_CHANNEL}")
+            self.mux = Mux(self.i2c, config.TCA9548A_ADDRESS)
+            if self.bus:
+                self.bus.on_recover.append(self.mux.invalidate)
+            self.discover_sensors()
+
+            if self.mpu_sensor is None:
+                self.select_mux_channel(self.mpu_channel)
+                self.mpu_sensor = MPU6050(self.i2c, config.MPU6050_ADDRESS, recorder=self.recorder)
+            print(f" MPU6050 on channel {self.mpu_channel}")
 
-            self.select_mux_channel(config.MAX30102_CHANNEL)
-            self.max_sensor = MAX30102(self.i2c)
-            print(f" MAX30102 on channel {config.MAX30102_CHANNEL}")
+            if self.max_sensor is None:
+                self.select_mux_channel(self.max_channel)
+                self.max_sensor = MAX30102(self.i2c, config.MAX30102_ADDRESS, recorder=self.recorder)
+            print(f" MAX30102 on channel {self.max_channel}")
         else:
-            self.mpu_sensor = MPU6050(self.i2c)
-            self.max_sensor = MAX30102(self.i2c)
+            self.mpu_sensor = MPU6050(self.i2c, recorder=self.recorder)
+            self.max_sensor = MAX30102(self.i2c, recorder=self.recorder)
             print(" Sensors initialized (direct I2C)")
     
+    def make_i2c(self):
+        if config.USE_BUS_GUARD:
+            return I2C(0, scl=Pin(config.I2C_SCL_PIN), sda=Pin(config.I2C_SDA_PIN), freq=config.I2C_FREQ,
+                       timeout=config.I2C_TIMEOUT_US)
+        return I2C(0, scl=Pin(config.I2C_SCL_PIN), sda=Pin(config.I2C_SDA_PIN), freq=config.I2C_FREQ)
+
+    def init_bus_guard(self):
+        """Put the bus behind per-device breakers; drivers and the mux use the guard as their I2C"""
+        self.bus = BusGuard(
+            self.i2c,
+            make_bus=self.make_i2c,
+            scl_pin=config.I2C_SCL_PIN,
+            sda_pin=config.I2C_SDA_PIN,
+            mux_address=config.TCA9548A_ADDRESS if config.USE_MULTIPLEXER else None,
+            retries=config.I2C_RETRIES,
+            timeout_us=config.I2C_CALL_TIMEOUT_US,
+            threshold=config.I2C_BREAKER_THRESHOLD,
+            backoff_ms=config.I2C_BREAKER_BACKOFF_MS,
+            max_backoff_ms=config.I2C_BREAKER_MAX_BACKOFF_MS,
+            budget_ms=config.I2C_ERROR_BUDGET_MS
+        )
+        for address, timeout_us in config.I2C_DEVICE_TIMEOUT_US.items():
+            self.bus.set_timeout(address, timeout_us)
+        self.i2c = self.bus
+        print(f"   I2C breakers: {config.I2C_BREAKER_THRESHOLD} failures, "
+              f"{config.I2C_RETRIES} retry, {config.I2C_ERROR_BUDGET_MS} ms error budget")
+
+    def mpu_unavailable(self):
+        """True while the IMU's breaker is open, so the motion value is stale"""
+        if not self.bus or not self.mpu_sensor:
+            return False
+        return self.bus.is_open(self.mpu_sensor.address, self.mpu_channel if config.USE_MULTIPLEXER else None)
+
+    def discover_sensors(self):
+        """Find sensors on every mux channel; the configured channels are preferred"""
+        recorder = self.recorder
+        self.registry = DeviceRegistry(self.i2c, self.mux, {
+            KIND_MPU: lambda i2c, addr: MPU6050(i2c, addr, recorder=recorder),
+            KIND_MAX: lambda i2c, addr: MAX30102(i2c, addr, recorder=recorder),
+        })
+        try:
+            self.registry.discover()
+        except OSError as e:
+            print(f"   Sensor discovery failed: {e}")
+            self.mux.invalidate()
+            return
+        print(f"   Found: {self.registry.describe()}")
+        # only the sensors in use get a driver; the rest stay powered down
+        mpu = self.registry.find(KIND_MPU, config.MPU6050_CHANNEL)
+        if mpu and self.registry.open(mpu):
+            self.mpu_sensor = mpu.driver
+            self.mpu_channel = mpu.channel
+        ppg = self.registry.find(KIND_MAX, config.MAX30102_CHANNEL)
+        if ppg and self.registry.open(ppg):
+            self.max_sensor = ppg.driver
+            self.max_channel = ppg.channel
+
+    def init_calibration(self):
+        """Restore the MPU6050's bias offsets, or measure them on the first still boot"""
+        channel = self.mpu_channel if config.USE_MULTIPLEXER else None
+        key = device_key(channel, self.mpu_sensor.address)
+        cal = MPUCalibration(config.MPU_CALIBRATION_FILE, samples=config.MPU_CALIBRATION_SAMPLES)
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(channel)
+        try:
+            entry, source, ms = cal.ensure(self.mpu_sensor, key, config.MPU_RECALIBRATE)
+        except OSError as e:
+            print(f" MPU6050 {key} calibration failed: {e}")
+            return
+        if entry is None:
+            return
+        where = "offset registers" if entry["hw"] else "software"
+        print(f" MPU6050 {key} bias {source} in {ms} ms ({where})")
+        if source == "calibrated":
+            b, a = entry["before"], entry["after"]
+            print(f"   gyro {b['gyro_dps']} -> {a['gyro_dps']} dps")
+            if entry["level"]:
+                print(f"   accel {b['accel_mg']} -> {a['accel_mg']} mg")
+            else:
+                print("   accel left uncorrected: not lying level")
+
+    def init_impact(self):
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(self.mpu_channel)
+        self.mpu_sensor.set_accel_range(config.IMPACT_ACCEL_RANGE)
+        self.impact = ImpactDetector(
+            self.mpu_sensor.accel_lsb,
+            sample_rate=config.IMPACT_SAMPLE_RATE,
+            threshold_g=config.IMPACT_THRESHOLD_G,
+            still_tolerance_g=config.IMPACT_STILL_TOLERANCE_G,
+            still_seconds=config.IMPACT_STILL_SECONDS,
+            pre_seconds=config.IMPACT_PRE_SECONDS,
+            post_seconds=config.IMPACT_POST_SECONDS
+        )
+        print(f" Impact detection at {config.IMPACT_SAMPLE_RATE} Hz (+-{config.IMPACT_ACCEL_RANGE} g)")
+
+    def init_orientation(self):
+        self.orientation = OrientationFilter(
+            sample_rate=config.IMPACT_SAMPLE_RATE,
+            alpha=config.ORIENTATION_ALPHA,
+            lying_deg=config.POSTURE_LYING_DEG,
+            upside_down_deg=config.POSTURE_UPSIDE_DOWN_DEG
+        )
+        print(" Orientation filter enabled")
+
+    def init_hrv(self):
+        self.hrv = HRVMonitor(
+            sample_rate=config.HRV_SAMPLE_RATE,
+            window=config.HRV_WINDOW_BEATS,
+            pnn_ms=config.HRV_PNN_MS,
+            min_beats=config.HRV_MIN_BEATS,
+            motion_limit=config.HRV_MOTION_REJECT
+        )
+        print(f" HRV tracking over {config.HRV_WINDOW_BEATS} beats")
+
+    def init_ppg_control(self):
+        self.ppg = PPGController(
+            self.max_sensor,
+            rates=config.PPG_RATES,
+            activity_levels=config.PPG_ACTIVITY_LEVELS,
+            low_pi=config.PPG_LOW_PI,
+            hold=config.PPG_HOLD_READINGS
+        )
+        print(f" Adaptive PPG rate: {', '.join(str(r) for r in config.PPG_RATES)} Hz")
+
     def select_mux_channel(self, channel):
-        if 0 <= channel <= 7:
+        if self.mux:
+            self.mux.select(channel)
+        elif channel is not None and 0 <= channel <= 7:
             self.i2c.writeto(config.TCA9548A_ADDRESS, bytes([1 << channel]))
     
+    def init_power(self):
+        self.power = DutyCycler()
+        wakes = []
+        if config.MPU_INT_PIN is not None:
+            if config.USE_MULTIPLEXER:
+                self.select_mux_channel(self.mpu_channel)
+            self.mpu_sensor.enable_motion_interrupt(config.WAKE_MOTION_MG, config.WAKE_MOTION_MS)
+            self.power.attach(Pin(config.MPU_INT_PIN, Pin.IN), WAKE_MOTION, 1)
+            self.set_imu_active(False)
+            wakes.append("motion")
+            if self.impact:
+                # cycle mode samples at MPU_LP_WAKE_HZ and the motion wake lands after a
+                # 30-40 ms spike is over: only impacts while moving are caught
+                print("   Impact detection only while the IMU is at full rate (pet moving)")
+        else:
+            print("   No MPU INT pin: the IMU is sampled between every reading, CPU stays awake")
+        if self.hrv and config.MAX_INT_PIN is not None:
+            if config.USE_MULTIPLEXER:
+                self.select_mux_channel(self.max_channel)
+            self.max_sensor.enable_fifo_interrupt()
+            self.power.attach(Pin(config.MAX_INT_PIN, Pin.IN, Pin.PULL_UP), WAKE_PPG, 0)
+            wakes.append("PPG FIFO")
+        print(f" Duty-cycled run mode, wake sources: timer{''.join(', ' + w for w in wakes)}")
+
+    def set_imu_active(self, active):
+        """Full-rate accel + gyro while moving, accel-only cycle mode while still"""
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(self.mpu_channel)
+        if active:
+            self.mpu_sensor.wake()
+        else:
+            self.mpu_sensor.set_low_power(config.MPU_LP_WAKE_HZ)
+        self.mpu_sensor.clear_interrupt()
+        self.imu_active = active
+
+    def manage_radio(self):
+        """Low-power mode: bring WiFi up only while an alert or a full telemetry buffer waits"""
+        wifi = self.wifi
+        waiting = self.pending_alert is not None or (self.telemetry and self.telemetry.nearly_full)
+        if waiting:
+            if wifi.state == IDLE:
+                print(" Radio up for queued data")
+                wifi.start()
+            elif wifi.connected and self.telemetry:
+                self.telemetry.flush()
+        elif wifi.state != IDLE:
+            if self.telemetry and self.telemetry.count and wifi.connected:
+                self.telemetry.flush()
+            wifi.stop()
+
+    def sleep_until_next_reading(self):
+        """Low-power mode: lightsleep until the next reading, waking early for sensor work.
+
+        Once a motion wake has switched the IMU to full rate, it is sampled
+        for the rest of the interval instead of sleeping.
+        """
+        power = self.power
+        deadline = time.ticks_add(time.ticks_ms(), config.SENSOR_READ_INTERVAL * 1000)
+        poll_ppg = self.hrv and config.MAX_INT_PIN is None
+        while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            if self.imu_active:
+                # sample_imu polls the PPG FIFO itself
+                if self.sample_imu(time.ticks_diff(deadline, time.ticks_ms())):
+                    self.handle_impact()
+                    continue
+                if self.classifier.activity == REST and config.MPU_INT_PIN is not None:
+                    self.set_imu_active(False)
+                else:
+                    self.mpu_sensor.clear_interrupt()
+                break
+            wake_at = deadline
+            if poll_ppg:
+                wake_at = time.ticks_add(time.ticks_ms(), self.ppg_poll_ms)
+                if time.ticks_diff(wake_at, deadline) > 0:
+                    wake_at = deadline
+            events = power.sleep_until(wake_at, light=self.wifi.state == IDLE)
+            if self.hrv and (events & WAKE_PPG or poll_ppg):
+                self.poll_ppg()
+            if events & WAKE_MOTION:
+                self.set_imu_active(True)
+
+    def init_sampler(self):
+        """Move IMU, PPG and GPS byte sampling to a worker thread feeding SPSC rings"""
+        gps_uart = self.gps.uart if self.gps else None
+        worker = SamplingWorker(
+            self.mpu_sensor,
+            SlotRing(config.SAMPLER_IMU_SLOTS, 14),
+            imu_rate=config.IMPACT_SAMPLE_RATE,
+            max_sensor=self.max_sensor,
+            ppg_ring=ByteRing(config.SAMPLER_PPG_BYTES) if self.max_sensor else None,
+            ppg_interval_ms=self.ppg_poll_ms,
+            uart=gps_uart,
+            gps_ring=ByteRing(config.SAMPLER_GPS_BYTES) if gps_uart else None,
+            mux=self.select_mux_channel if config.USE_MULTIPLEXER else None,
+            mpu_channel=self.mpu_channel,
+            max_channel=self.max_channel
+        )
+        try:
+            worker.start()
+        except (OSError, RuntimeError) as e:
+            print(f" Sampling thread not started: {e}")
+            return
+        self.sampler = worker
+        self.gps_polled = worker.gps_ring is not None
+        self.ppg_buf = bytearray(192)
+        self.gps_buf = bytearray(128)
+        print(f" Sampling thread: IMU at {config.IMPACT_SAMPLE_RATE} Hz"
+              f"{', PPG FIFO' if worker.ppg_ring else ''}{', GPS UART' if gps_uart else ''}")
+
+    def drain_samples(self):
+        """Run analysis over what the sampling thread queued; True on a confirmed impact.
+
+        Same per-sample work as sample_imu. On an impact the rest stays queued
+        so the capture window is not disturbed before handle_impact reads it.
+        """
+        sampler = self.sampler
+        ring = sampler.imu_ring
+        views = ring.views
+        impact = self.impact
+        orientation = self.orientation
+        classifier = self.classifier
+        decimate = max(1, config.IMPACT_SAMPLE_RATE // config.ACTIVITY_SAMPLE_RATE)
+        scale = 9.81 / self.mpu_sensor.accel_lsb
+        bx, by, bz = self.mpu_sensor.accel_bias
+        bgx, bgy, _ = self.mpu_sensor.gyro_bias
+        count = self.imu_count
+        hit = False
+        while True:
+            i = ring.peek()
+            if i < 0:
+                break
+            buf = views[i]
+            x = (buf[0] << 8) | buf[1]
+            y = (buf[2] << 8) | buf[3]
+            z = (buf[4] << 8) | buf[5]
+            if x > 32767:
+                x -= 65536
+            if y > 32767:
+                y -= 65536
+            if z > 32767:
+                z -= 65536
+            x -= bx
+            y -= by
+            z -= bz
+            if orientation:
+                gx = (buf[8] << 8) | buf[9]
+                gy = (buf[10] << 8) | buf[11]
+                if gx > 32767:
+                    gx -= 65536
+                if gy > 32767:
+                    gy -= 65536
+                orientation.update(x, y, z, gx - bgx, gy - bgy)
+            count += 1
+            if count >= decimate:
+                count = 0
+                classifier.update(x * scale, y * scale, z * scale)
+            if (i + 1) % ring.slots == ring.head:
+                self.imu_buf[:] = buf
+            ring.release()
+            if impact and impact.update(x, y, z):
+                hit = True
+                break
+        self.imu_count = count
+
+        if sampler.ppg_ring:
+            self.drain_ppg()
+        if sampler.gps_ring:
+            while True:
+                n = sampler.gps_ring.readinto(self.gps_buf)
+                if not n:
+                    break
+                if self.recorder:
+                    sampler.bus_call(None, self.gps.feed, memoryview(self.gps_buf)[:n])
+                else:
+                    self.gps.feed(memoryview(self.gps_buf)[:n])
+        return hit
+
+    def drain_ppg(self):
+        """Feed the PPG blocks the sampling thread queued, restarting beats where samples are missing"""
+        sampler = self.sampler
+        data = memoryview(self.ppg_buf)
+        while True:
+            n = sampler.ppg_ring.readinto(self.ppg_buf)
+            if not n:
+                break
+            start = self.ppg_read
+            self.ppg_read = start + n
+            self.ppg_last = data[:n]
+            if not self.hrv:
+                continue
+            cut = sampler.ppg_gap_at - start
+            if 0 <= cut < n:
+                # samples are missing at this point of the stream
+                if cut:
+                    self.feed_ppg(data[:cut])
+                self.hrv.restart()
+                self.feed_ppg(data[cut:n])
+            else:
+                self.feed_ppg(data[:n])
+
+    def wait_for_next_reading(self, duration_ms):
+        """Sampling-thread mode: drain the rings until the next reading is due"""
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < duration_ms:
+            if self.drain_samples():
+                return True
+            time.sleep_ms(20)
+        return False
+
+    def flush_recorder(self):
+        if self.sampler:
+            # drivers record from the sampling thread while they hold the bus
+            self.sampler.bus_call(None, self.recorder.flush)
+        else:
+            self.recorder.flush()
+
     def init_twilio(self):
         print(" Initializing Twilio client...")
+        from twilio_client import TwilioClient, load_ca
         
         self.twilio = TwilioClient(
             account_sid=config.TWILIO_ACCOUNT_SID,
             auth_token=config.TWILIO_AUTH_TOKEN,
             from_number=config.TWILIO_PHONE_NUMBER,
-            api_url=config.TWILIO_API_URL
+            api_url=config.TWILIO_API_URL,
+            cadata=self.load_twilio_ca(load_ca),
+            tls_insecure=config.TWILIO_TLS_INSECURE
         )
+        if config.FAST_BOOT or not self.wifi.connected:
+            print("  Twilio connection test deferred until WiFi is up")
+        else:
+            self.check_twilio()
+
+    def load_twilio_ca(self, load_ca):
+        """Read the CA certificate at boot, so a missing one stops the collar here
+        rather than failing the first alert. A host build falls back to the system store."""
+        if config.TWILIO_TLS_INSECURE:
+            print(" WARNING: Twilio server certificate is NOT verified (TWILIO_TLS_INSECURE)")
+            return None
+        try:
+            cadata = load_ca(config.TWILIO_CA_FILE)
+        except OSError:
+            if sys.implementation.name == "micropython":
+                raise OSError(f"Twilio CA certificate /{config.TWILIO_CA_FILE} missing: "
+                              "no alert could be sent (see TWILIO_CA_FILE in config.py)")
+            print(f" {config.TWILIO_CA_FILE} not found: using the system certificate store")
+            return None
+        print(f" Twilio CA certificate loaded ({len(cadata)} bytes)")
+        return cadata
+
+    def check_twilio(self):
+        self.twilio_checked = True
         if self.twilio.test_connection():
             print(" Twilio ready")
         else:
             print("  Twilio connection test failed (will retry on alert)")
 
+    def start_twilio_check(self):
+        """Run the Twilio round trip off the sampling path when threads are available"""
+        self.twilio_checked = True
+        try:
+            import _thread
+            _thread.start_new_thread(self.check_twilio, ())
+        except (ImportError, OSError, RuntimeError):
+            self.check_twilio()
+
+    def init_baseline(self):
+        self.baseline = AdaptiveBaseline(
+            metrics=("spo2", "heart_rate", "motion", "rmssd"),
+            states=len(ACTIVITY_NAMES),
+            alpha=config.BASELINE_ALPHA,
+            warmup=config.BASELINE_WARMUP_SAMPLES,
+            min_std=config.BASELINE_MIN_STD,
+            path=config.BASELINE_FILE,
+            save_interval=config.BASELINE_SAVE_INTERVAL
+        )
+        print(f" Adaptive baseline loaded ({config.BASELINE_FILE})")
+
+    def init_telemetry(self):
+        if config.TELEMETRY_TRANSPORT == "mqtt":
+            transport = MqttTransport(
+                broker=config.TELEMETRY_MQTT_BROKER,
+                topic=config.TELEMETRY_MQTT_TOPIC,
+                client_id=f"collar-{config.DEVICE_ID}"
+            )
+        else:
+            transport = HttpTransport(config.TELEMETRY_URL)
+        self.telemetry = TelemetryBuffer(
+            device_id=config.DEVICE_ID,
+            transport=transport,
+            capacity=config.TELEMETRY_BUFFER_SIZE,
+            interval=config.TELEMETRY_BATCH_INTERVAL,
+            compress=config.TELEMETRY_COMPRESS
+        )
+        print(f" Telemetry via {config.TELEMETRY_TRANSPORT} every {config.TELEMETRY_BATCH_INTERVAL}s")
+
+    def init_recorder(self):
+        try:
+            self.recorder = Recorder(
+                directory=config.RECORDER_DIR,
+                page_size=config.RECORDER_PAGE_SIZE,
+                chunk_pages=config.RECORDER_CHUNK_PAGES,
+                max_chunks=config.RECORDER_MAX_CHUNKS
+            )
+            print(f" Recording raw sensor data to /{config.RECORDER_DIR} "
+                  f"(max {self.recorder.footprint // 1024} KB)")
+        except OSError as e:
+            print(f" Recorder disabled: {e}")
+            self.recorder = None
+
     def init_gps(self):
         print("\n Initializing GPS...")
 
@@ -113,7 +670,8 @@ class PetHealthMonitor:
                 uart_id=config.GPS_UART_ID,
                 tx_pin=config.GPS_TX_PIN,
                 rx_pin=config.GPS_RX_PIN,
-                baudrate=config.GPS_BAUDRATE
+                baudrate=config.GPS_BAUDRATE,
+                recorder=self.recorder
             )
             print(" GPS module initialized")
             print(" Waiting for GPS fix (this may take 30-60 seconds)...")
@@ -126,10 +684,13 @@ class PetHealthMonitor:
             return None
 
         try:
-            self.gps.update(timeout=config.GPS_TIMEOUT)
+            if not self.gps_polled:
+                self.gps.update(timeout=config.GPS_TIMEOUT)
             if self.gps.has_fix:
                 location = self.gps.get_location()
                 self.current_location = location
+                if self.telemetry:
+                    self.telemetry.add_location(time.time(), location)
 
                 if config.DEBUG_MODE:
                     print(f" GPS: {self.gps.get_coordinates_string()} | "
@@ -155,59 +716,265 @@ class PetHealthMonitor:
                 )
 
         try:
-            if config.USE_MULTIPLEXER:
-                self.select_mux_channel(config.MAX30102_CHANNEL)
-
-            spo2 = self.max_sensor.read_spo2()
-            heart_rate = self.max_sensor.read_heart_rate()
+            if self.sampler:
+                # the worker owns the FIFO: work from what it queued
+                self.drain_samples()
+                spo2 = self.max_sensor.read_spo2(self.ppg_last)
+            else:
+                if config.USE_MULTIPLEXER:
+                    self.select_mux_channel(self.max_channel)
+                self.read_ppg()
+                spo2 = self.max_sensor.read_spo2()
+            if self.hrv and self.hrv.ready:
+                heart_rate = self.hrv.heart_rate
+            elif self.sampler:
+                heart_rate = self.max_sensor.read_heart_rate(self.ppg_last)
+            else:
+                heart_rate = self.max_sensor.read_heart_rate()
         except Exception as e:
             print(f" MAX30102 read error: {e}")
             spo2 = 0
             heart_rate = 0
 
         try:
-            if config.USE_MULTIPLEXER:
-                self.select_mux_channel(config.MPU6050_CHANNEL)
+            if config.USE_MULTIPLEXER and not self.sampler:
+                self.select_mux_channel(self.mpu_channel)
 
-            accel = self.mpu_sensor.get_accel_data()
-            motion = abs(accel['x']) + abs(accel['y']) + abs(accel['z'])
+            if not (self.impact or self.orientation or self.sampler):
+                self.sample_activity(config.ACTIVITY_BURST_SAMPLES)
+            motion = None if self.mpu_unavailable() else self.classifier.motion
         except Exception as e:
             print(f" MPU6050 read error: {e}")
-            motion = 0
+            motion = None
 
+        self.activity = self.classifier.activity
         return (spo2, heart_rate, motion)
 
-    def analyze_health(self, spo2, heart_rate, motion):
-        abnormal_count = 0
-        issues = []
-        if spo2 > 0 and spo2 < config.SPO2_MIN_THRESHOLD:
-            abnormal_count += 1
-            issues.append(f"Low SpO2: {spo2}%")
-        if heart_rate > 0:
-            if heart_rate < config.HEART_RATE_MIN:
-                abnormal_count += 1
-                issues.append(f"Low heart rate: {heart_rate} BPM")
-            elif heart_rate > config.HEART_RATE_MAX:
-                abnormal_count += 1
-                issues.append(f"High heart rate: {heart_rate} BPM")
-        if motion < config.MOTION_MIN_THRESHOLD:
-            abnormal_count += 1
-            issues.append(f"Low motion: {motion:.2f}")
-        elif motion > config.MOTION_MAX_THRESHOLD:
-            abnormal_count += 1
-            issues.append(f"Excessive motion: {motion:.2f}")
+    def read_temperature(self):
+        """Collar temperature (MPU6050 die) from the last IMU burst; 0 when unknown"""
+        if not self.mpu_sensor:
+            return 0
+        if self.impact or self.orientation or self.sampler:
+            raw = (self.imu_buf[6] << 8) | self.imu_buf[7]
+            if raw > 32767:
+                raw -= 65536
+            return raw / 340.0 + 36.53
+        try:
+            if config.USE_MULTIPLEXER:
+                self.select_mux_channel(self.mpu_channel)
+            return self.mpu_sensor.get_temp()
+        except Exception:
+            return 0
+
+    def sample_activity(self, count):
+        """Feed a short burst of accelerometer samples at the activity rate"""
+        period_ms = 1000 // config.ACTIVITY_SAMPLE_RATE
+        buf = self.activity_buf
+        for i in range(count):
+            accel = self.mpu_sensor.get_accel_data()
+            buf[3 * i] = accel['x']
+            buf[3 * i + 1] = accel['y']
+            buf[3 * i + 2] = accel['z']
+            time.sleep_ms(period_ms)
+        # readings are seconds apart: the burst is classified without the previous one's filter state
+        self.classifier.add_burst(buf, count)
+
+    def feed_ppg(self, data):
+        self.hrv.add_fifo(data, self.classifier.motion)
+        if self.ppg:
+            self.ppg.observe(data)
+
+    def read_ppg(self):
+        """Read the MAX30102 FIFO into the HRV tracker; the mux must be on the MAX30102"""
+        data = self.max_sensor.read_fifo()
+        if self.hrv:
+            self.feed_ppg(data)
+            if self.max_sensor.fifo_lost:
+                # the FIFO filled up and dropped samples after this block
+                self.hrv.restart()
+
+    def adjust_ppg(self):
+        """Let the PPG controller retune the MAX30102 for the activity and signal just seen"""
+        ppg = self.ppg
+        hrv = self.hrv
+        heart_rate = hrv.heart_rate if hrv.ready else 0
+
+        def retune():
+            changed = ppg.update(self.activity, heart_rate, hrv.beats, hrv.rejected)
+            if changed:
+                # samples queued at the old rate go through the old detector first;
+                # the chip's FIFO was cleared by the rate change
+                if self.sampler:
+                    self.drain_ppg()
+                hrv.set_sample_rate(self.max_sensor.output_rate)
+            return changed
+
+        try:
+            if self.sampler:
+                # under the bus lock the worker cannot queue new-rate samples before the drain
+                changed = self.sampler.bus_call(self.max_channel, retune)
+            else:
+                if config.USE_MULTIPLEXER:
+                    self.select_mux_channel(self.max_channel)
+                changed = retune()
+                if config.USE_MULTIPLEXER:
+                    self.select_mux_channel(self.mpu_channel)
+        except OSError as e:
+            print(f" MAX30102 settings not changed: {e}")
+            return
+        if changed:
+            self.ppg_poll_ms = ppg.poll_ms
+            if self.sampler:
+                self.sampler.ppg_interval_us = ppg.poll_ms * 1000
+            if config.DEBUG_MODE:
+                print(f" PPG now {ppg.rate} Hz x{ppg.average} avg, LED {ppg.amplitude * 0.2:.1f} mA")
+
+    def poll_ppg(self):
+        """Drain the MAX30102 FIFO into the HRV tracker before it overflows"""
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(self.max_channel)
+        try:
+            self.read_ppg()
+        except Exception as e:
+            print(f" MAX30102 FIFO read error: {e}")
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(self.mpu_channel)
+
+    def sample_imu(self, duration_ms):
+        """Sample the IMU at the impact rate until the next reading is due.
 
+        Returns True as soon as the impact detector confirms an event. The
+        per-sample path only touches preallocated buffers and small ints.
+        """
+        if config.USE_MULTIPLEXER:
+            self.select_mux_channel(self.mpu_channel)
+        buf = self.imu_buf
+        impact = self.impact
+        orientation = self.orientation
+        classifier = self.classifier
+        mpu = self.mpu_sensor
+        period = 1000 // config.IMPACT_SAMPLE_RATE
+        decimate = max(1, config.IMPACT_SAMPLE_RATE // config.ACTIVITY_SAMPLE_RATE)
+        scale = 9.81 / mpu.accel_lsb
+        # zero unless the chip's offset registers did not work (see calibration.py)
+        bx, by, bz = mpu.accel_bias
+        bgx, bgy, _ = mpu.gyro_bias
+        hrv = self.hrv
+        count = 0
+        start = time.ticks_ms()
+        next_tick = start
+        next_ppg = time.ticks_add(start, self.ppg_poll_ms)
+        while time.ticks_diff(time.ticks_ms(), start) < duration_ms:
+            if hrv and time.ticks_diff(time.ticks_ms(), next_ppg) >= 0:
+                self.poll_ppg()
+                next_ppg = time.ticks_add(next_ppg, self.ppg_poll_ms)
+            try:
+                mpu.read_imu_raw_into(buf)
+            except OSError:
+                # a skipped sample; the bus guard decides when to stop trying
+                self.imu_errors += 1
+            else:
+                x = (buf[0] << 8) | buf[1]
+                y = (buf[2] << 8) | buf[3]
+                z = (buf[4] << 8) | buf[5]
+                if x > 32767:
+                    x -= 65536
+                if y > 32767:
+                    y -= 65536
+                if z > 32767:
+                    z -= 65536
+                x -= bx
+                y -= by
+                z -= bz
+                if orientation:
+                    gx = (buf[8] << 8) | buf[9]
+                    gy = (buf[10] << 8) | buf[11]
+                    if gx > 32767:
+                        gx -= 65536
+                    if gy > 32767:
+                        gy -= 65536
+                    orientation.update(x, y, z, gx - bgx, gy - bgy)
+                if impact and impact.update(x, y, z):
+                    return True
+                count += 1
+                if count == decimate:
+                    count = 0
+                    classifier.update(x * scale, y * scale, z * scale)
+            next_tick = time.ticks_add(next_tick, period)
+            wait = time.ticks_diff(next_tick, time.ticks_ms())
+            if wait > 0:
+                time.sleep_ms(wait)
+        return False
+
+    def handle_impact(self):
+        issues = [f"Impact detected: {self.impact.peak_g():.1f} g, then no movement"]
+        print(f" {issues[0]} ({len(self.impact.capture) // 3} samples captured)")
+        self.impact.clear()
+        if self.recorder:
+            self.flush_recorder()
+        trace = AlertTrace(kind="impact")
+        trace.mark("detect")
+        self.send_alert(issues, location=self.current_location, mask=ISSUE_IMPACT, abnormal_count=1,
+                        trace=trace)
+
+    def analyze_health(self, spo2, heart_rate, motion, rmssd=None):
+        abnormal_count, issues, self.issue_mask = analyze_health(
+            spo2, heart_rate, motion, rmssd, self.activity, self.baseline)
         return (abnormal_count, issues)
 
-    def send_alert(self, issues, location=None):
+    def send_alert(self, issues, location=None, mask=None, rule_mask=0, trace=None, abnormal_count=0):
         current_time = time.time()
-        if current_time - self.last_alert_time < config.ALERT_COOLDOWN:
-            remaining = config.ALERT_COOLDOWN - (current_time - self.last_alert_time)
+        # a fall can't wait out a health alert's cooldown; it has its own short one
+        kind = ALERT_IMPACT if mask is not None and mask & ISSUE_IMPACT else ALERT_HEALTH
+        if kind == ALERT_IMPACT:
+            cooldown, last = config.IMPACT_ALERT_COOLDOWN, self.last_impact_time
+        else:
+            cooldown, last = config.ALERT_COOLDOWN, self.last_alert_time
+        if current_time - last < cooldown:
+            remaining = cooldown - (current_time - last)
             print(f" Alert cooldown active ({remaining:.0f}s remaining)")
+            self.traces.suppressed += 1
+            return
+        if kind == ALERT_IMPACT:
+            self.last_impact_time = current_time
+        if trace is None:
+            trace = AlertTrace()
+        trace.mark("cooldown")
+        if self.pending_alert:
+            # one queued alert carries everything seen while offline; keep its
+            # trace, whose origin is the older abnormal sample
+            queued, queued_location, queued_trace, queued_kinds = self.pending_alert
+            self.pending_alert = (merge_issues(queued, issues), location or queued_location,
+                                  queued_trace, queued_kinds | kind)
             return
 
+        if self.telemetry:
+            # issues also lists the fired rules; the frame counts abnormal metrics only
+            self.telemetry.add_alert(current_time, abnormal_count,
+                                     self.issue_mask if mask is None else mask, rule_mask)
+            if self.history:
+                since = current_time - config.HISTORY_CONTEXT_MINUTES * 60
+                self.telemetry.add_history(current_time, self.history.export(
+                    since, max_bytes=config.TELEMETRY_BUFFER_SIZE // 2))
+
         print(" EMERGENCY DETECTED!")
         print(f"   Issues: {', '.join(issues)}")
+        trace.mark("enqueue")
+        if not self.wifi.connected:
+            print(" WiFi down: alert queued until it reconnects")
+            self.pending_alert = (issues, location, trace, kind)
+            return
+        self.deliver_alert(issues, location, trace, kind)
+
+    def retry_pending_alert(self):
+        issues, location, trace, kinds = self.pending_alert
+        self.pending_alert = None
+        print(" WiFi back: sending queued alert")
+        self.deliver_alert(issues, location or self.current_location, trace, kinds)
+
+    def deliver_alert(self, issues, location, trace=None, kinds=ALERT_HEALTH):
+        """Call and text the owner; kinds (ALERT_HEALTH | ALERT_IMPACT) picks the cooldowns it restarts"""
+        current_time = time.time()
 
         if location:
             print(f" Location: {location['latitude']:.6f}, {location['longitude']:.6f}")
@@ -215,7 +982,8 @@ class PetHealthMonitor:
         print(" Initiating voice call...")
         call_result = self.twilio.make_call(
             to_number=config.OWNER_PHONE_NUMBER,
-            twiml_url=config.TWIML_URL
+            twiml_url=config.TWIML_URL,
+            trace=trace
         )
 
         if call_result:
@@ -224,14 +992,21 @@ class PetHealthMonitor:
             print(" Voice call failed")
         if config.SEND_LOCATION_VIA_SMS:
             if location and location.get('has_fix'):
-                self.send_location_sms(issues, location)
+                self.send_location_sms(issues, location, trace)
             else:
                 print(" Sending SMS alert (no GPS fix available)...")
-                self.send_basic_sms(issues) 
+                self.send_basic_sms(issues, trace) 
         if call_result or config.SEND_LOCATION_VIA_SMS:
-            self.last_alert_time = current_time
+            if kinds & ALERT_HEALTH:
+                self.last_alert_time = current_time
+            if kinds & ALERT_IMPACT:
+                self.last_impact_time = current_time
+        if trace:
+            self.traces.add(trace)
+            print(f" Alert latency: {trace.describe()}")
+            print(f" Recent alerts: {self.traces.report()}")
 
-    def send_location_sms(self, issues, location):
+    def send_location_sms(self, issues, location, trace=None):
         try:
             lat = location['latitude']
             lon = location['longitude']
@@ -250,10 +1025,12 @@ class PetHealthMonitor:
             if config.INCLUDE_MAPS_LINK:
                 maps_url = f"https://www.google.com/maps?q={lat:.6f},{lon:.6f}"
                 sms_body += f"\n View Location:\n{maps_url}" 
+            sms_body += self.history_context()
             print(" Sending GPS location SMS...")
             result = self.twilio.send_sms(
                 to_number=config.OWNER_PHONE_NUMBER,
-                message=sms_body
+                message=sms_body,
+                trace=trace
             )
 
             if result:
@@ -264,17 +1041,27 @@ class PetHealthMonitor:
         except Exception as e:
             print(f" Error sending location SMS: {e}")
 
-    def send_basic_sms(self, issues): 
+    def history_context(self):
+        if not self.history:
+            return ""
+        context = self.history.context(time.time() - config.HISTORY_CONTEXT_MINUTES * 60)
+        if not context:
+            return ""
+        return f"\n\n Last {config.HISTORY_CONTEXT_MINUTES} min: {context}"
+
+    def send_basic_sms(self, issues, trace=None): 
         try: 
             sms_body = " PET HEALTH ALERT!\n\n"
             sms_body += "Health Issues:\n"
             for issue in issues:
                 sms_body += f"• {issue}\n"
             sms_body += "\n GPS location unavailable" 
+            sms_body += self.history_context()
             print(" Sending basic SMS alert...")
             result = self.twilio.send_sms(
                 to_number=config.OWNER_PHONE_NUMBER,
-                message=sms_body
+                message=sms_body,
+                trace=trace
             )
 
             if result:
@@ -285,39 +1072,246 @@ class PetHealthMonitor:
         except Exception as e:
             print(f" Error sending SMS: {e}")
 
+    def take_reading(self):
+        """Read, analyze, record and alert once"""
+        if self.bus:
+            self.bus.begin_cycle()
+        online = self.wifi.poll()
+        if online and self.pending_alert:
+            self.retry_pending_alert()
+        spo2, heart_rate, motion = self.read_sensors()
+        if self.ppg:
+            self.adjust_ppg()
+        if not self.first_sample_done:
+            self.first_sample_done = True
+            self.report_boot()
+        elif online and not self.twilio_checked and not self.power:
+            self.start_twilio_check()
+        current_time = time.time()
+        if config.USE_GPS and self.gps:
+            if current_time - self.last_gps_update >= config.GPS_UPDATE_INTERVAL:
+                self.read_gps()
+                self.last_gps_update = current_time
+        rmssd = self.hrv.rmssd if self.hrv and self.hrv.ready else None
+        abnormal_count, issues = self.analyze_health(spo2, heart_rate, motion, rmssd)
+        if config.DEBUG_MODE:
+            motion_text = "n/a" if motion is None else f"{motion:.2f}"
+            print(f" SpO2: {spo2}% | HR: {heart_rate} BPM | Motion: {motion_text} | "
+                  f"Activity: {ACTIVITY_NAMES[self.activity]}")
+            if rmssd is not None:
+                print(f" HRV: RMSSD {rmssd:.1f} ms | SDNN {self.hrv.sdnn:.1f} ms | "
+                      f"pNN{config.HRV_PNN_MS} {self.hrv.pnn:.0f}%")
+            if self.orientation:
+                print(f" Pitch: {self.orientation.pitch:.0f} | Roll: {self.orientation.roll:.0f} | "
+                      f"Posture: {POSTURE_NAMES[self.orientation.posture]}")
+            if self.power:
+                print(f" Awake {self.power.duty_cycle * 100:.1f}% | IMU "
+                      f"{'full rate' if self.imu_active else 'cycle'} | radio {self.wifi.state_name}")
+            if self.sampler:
+                st = self.sampler.stats()
+                print(f" Sampler: {st['imu']} IMU samples, {st['imu_dropped']} dropped | "
+                      f"ring peak {st['imu_high_water']}/{config.SAMPLER_IMU_SLOTS - 1} | "
+                      f"late ticks {st['late']} (worst {st['max_late_ms']:.0f} ms)")
+            if abnormal_count > 0:
+                print(f" Abnormal: {abnormal_count} - {issues}")
+        if abnormal_count > 0:
+            if self.abnormal_since is None:
+                self.abnormal_since = time.ticks_ms()
+        else:
+            self.abnormal_since = None
+        fired = self.window.update({
+            "spo2": spo2 if spo2 > 0 else None,
+            "heart_rate": heart_rate if heart_rate > 0 else None,
+            "motion": motion,
+            "abnormal": abnormal_count,
+            "posture": self.orientation.posture if self.orientation else None,
+            "rmssd": rmssd
+        })
+        # storage formats use 0 for a missing value, as for spo2 and heart rate
+        stored_motion = 0 if motion is None else motion
+        if self.history:
+            self.history.append(current_time, spo2, heart_rate, stored_motion,
+                                self.read_temperature())
+        if self.telemetry:
+            self.telemetry.add_reading(current_time, spo2, heart_rate, stored_motion,
+                                       self.activity, rmssd)
+        if fired:
+            if self.recorder:
+                self.flush_recorder()
+            # window rules fire seconds after their first flagged sample; time from the
+            # oldest one, or the first abnormal reading if that came earlier
+            origin = time.ticks_add(time.ticks_ms(), -int(self.window.fired_age() * 1000))
+            if self.abnormal_since is not None and time.ticks_diff(origin, self.abnormal_since) > 0:
+                origin = self.abnormal_since
+            trace = AlertTrace(origin=origin)
+            trace.mark("detect")
+            self.send_alert(issues + fired, location=self.current_location,
+                            rule_mask=self.window.fired_mask, trace=trace, abnormal_count=abnormal_count)
+        if self.telemetry and self.wifi.connected:
+            self.telemetry.poll()
+        self.last_reading = (current_time, spo2, heart_rate, motion, rmssd)
+        if self.status:
+            self.status.changed()
+        gc.collect()
+
+    def wait_between_readings(self):
+        """Sample or sleep until the next reading is due"""
+        if self.power:
+            self.manage_radio()
+            self.sleep_until_next_reading()
+        elif self.sampler:
+            if self.wait_for_next_reading(config.SENSOR_READ_INTERVAL * 1000):
+                self.handle_impact()
+        elif self.impact or self.orientation:
+            if self.sample_imu(config.SENSOR_READ_INTERVAL * 1000):
+                self.handle_impact()
+        elif self.hrv:
+            # the 32-sample FIFO holds about a second at 25 Hz: drain it between readings
+            deadline = time.ticks_add(time.ticks_ms(), config.SENSOR_READ_INTERVAL * 1000)
+            while True:
+                remaining = time.ticks_diff(deadline, time.ticks_ms())
+                if remaining <= 0:
+                    break
+                time.sleep_ms(min(remaining, self.ppg_poll_ms))
+                self.poll_ppg()
+        else:
+            time.sleep(config.SENSOR_READ_INTERVAL)
+
+    def status_snapshot(self):
+        """Live state for the status endpoint"""
+        reading = None
+        if self.last_reading:
+            ts, spo2, heart_rate, motion, rmssd = self.last_reading
+            reading = {"ts": ts, "spo2": spo2, "heart_rate": heart_rate,
+                       "motion": None if motion is None else round(motion, 2),
+                       "rmssd": rmssd, "activity": ACTIVITY_NAMES[self.activity],
+                       "temperature": round(self.read_temperature(), 1)}
+        gps = None
+        if self.gps:
+            gps = {"fix": self.gps.has_fix, "satellites": self.gps.satellites,
+                   "lat": self.gps.latitude, "lon": self.gps.longitude}
+        counters = {"loop": self.reading_timing.as_dict(), "server": self.status.counters(),
+                    "free_mem": gc.mem_free() if hasattr(gc, "mem_free") else None}
+        if self.sampler:
+            counters["sampler"] = self.sampler.stats()
+        if self.telemetry:
+            counters["telemetry"] = {"queued": self.telemetry.count}
+        if self.impact:
+            counters["impacts"] = self.impact.events
+        if self.recorder:
+            counters["recorder"] = {"records": self.recorder.records, "errors": self.recorder.errors,
+                                    "evicted": self.recorder.evicted}
+        if self.ppg:
+            counters["ppg"] = self.ppg.as_dict()
+        if self.bus:
+            counters["i2c"] = self.bus.stats()
+            counters["i2c"]["imu_errors"] = self.imu_errors
+        counters["alert_latency"] = self.traces.as_dict()
+        return {
+            "device": config.DEVICE_ID,
+            "reading": reading,
+            "posture": POSTURE_NAMES[self.orientation.posture] if self.orientation else None,
+            "gps": gps,
+            "alerts": {"pending": self.pending_alert is not None, "last": self.last_alert_time,
+                       "issues": self.issue_mask},
+            "wifi": self.wifi.state_name,
+            "counters": counters,
+        }
+
+    async def run_async(self):
+        """Monitoring loop sharing the event loop with the status server.
+
+        Readings keep a fixed schedule; between them the IMU is sampled in
+        STATUS_SLICE_MS slices, and queued requests are served between slices.
+        """
+        from status_server import StatusServer, LoopTiming, asyncio
+        self.reading_timing = LoopTiming(tolerance_ms=config.STATUS_SLICE_MS)
+        self.status = StatusServer(self.status_snapshot, port=config.STATUS_PORT)
+        await self.status.start()
+        print(f" Status endpoint on http://{self.wifi.ifconfig()[0]}:{config.STATUS_PORT}/status")
+        interval = config.SENSOR_READ_INTERVAL * 1000
+        # read buffered NMEA between slices instead of blocking GPS_TIMEOUT in read_gps
+        poll_gps = self.gps is not None and not self.gps_polled
+        self.gps_polled = True
+        next_reading = time.ticks_ms()
+        next_ppg = next_reading
+        while True:
+            try:
+                self.reading_timing.record(time.ticks_diff(time.ticks_ms(), next_reading))
+                self.take_reading()
+                next_reading = time.ticks_add(next_reading, interval)
+                if time.ticks_diff(next_reading, time.ticks_ms()) < 0:
+                    next_reading = time.ticks_ms()
+                while True:
+                    remaining = time.ticks_diff(next_reading, time.ticks_ms())
+                    if remaining <= 0:
+                        break
+                    span = min(remaining, config.STATUS_SLICE_MS)
+                    if poll_gps:
+                        self.gps.update(timeout=1)
+                    if self.sampler:
+                        if self.drain_samples():
+                            self.handle_impact()
+                        await asyncio.sleep(min(span, 20) / 1000)
+                    elif self.impact or self.orientation:
+                        if self.sample_imu(span):
+                            self.handle_impact()
+                        # a request takes a few loop passes: accept, read, write and close
+                        for _ in range(3):
+                            await asyncio.sleep(0)
+                    else:
+                        if self.hrv and time.ticks_diff(time.ticks_ms(), next_ppg) >= 0:
+                            self.poll_ppg()
+                            next_ppg = time.ticks_add(time.ticks_ms(), self.ppg_poll_ms)
+                        await asyncio.sleep(span / 1000)
+            except KeyboardInterrupt:
+                raise
+            except Exception as e:
+                print(f" Error in main loop: {e}")
+                await asyncio.sleep(5)
+
     def run(self):
         """Main monitoring loop"""
         print("\n Starting monitoring loop...")
         print(f"   Reading interval: {config.SENSOR_READ_INTERVAL}s")
-        print(f"   Alert threshold: {config.ABNORMAL_COUNT_THRESHOLD} abnormal readings")
+        print("   Alert rules:")
+        for rule in self.window.rules:
+            print(f"     - {rule.describe()}")
         if config.USE_GPS and self.gps:
             print(f"   GPS update interval: {config.GPS_UPDATE_INTERVAL}s")
         print("-" * 50)
 
+        if config.USE_STATUS_SERVER and not self.power:
+            import status_server
+            try:
+                status_server.asyncio.run(self.run_async())
+            except KeyboardInterrupt:
+                self.shutdown()
+            return
+
         while True:
             try:
-                spo2, heart_rate, motion = self.read_sensors()
-                current_time = time.time()
-                if config.USE_GPS and self.gps:
-                    if current_time - self.last_gps_update >= config.GPS_UPDATE_INTERVAL:
-                        self.read_gps()
-                        self.last_gps_update = current_time
-                abnormal_count, issues = self.analyze_health(spo2, heart_rate, motion)
-                if config.DEBUG_MODE:
-                    print(f" SpO2: {spo2}% | HR: {heart_rate} BPM | Motion: {motion:.2f}")
-                    if abnormal_count > 0:
-                        print(f" Abnormal: {abnormal_count} - {issues}")
-                if abnormal_count >= config.ABNORMAL_COUNT_THRESHOLD:
-                    self.send_alert(issues, location=self.current_location)
-                gc.collect()
-                time.sleep(config.SENSOR_READ_INTERVAL)
+                self.take_reading()
+                self.wait_between_readings()
 
             except KeyboardInterrupt:
-                print("\n\n Monitoring stopped by user")
+                self.shutdown()
                 break
             except Exception as e:
                 print(f" Error in main loop: {e}")
                 time.sleep(5) 
+
+    def shutdown(self):
+        print("\n\n Monitoring stopped by user")
+        if self.status:
+            self.status.stop()
+        if self.sampler:
+            self.sampler.stop()
+        if self.baseline:
+            self.baseline.save()
+        if self.recorder:
+            self.recorder.close()
+
 if __name__ == "__main__":
     try:
         monitor = PetHealthMonitor()
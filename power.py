@@ -0,0 +1,221 @@
+#duty-cycled run support: lightsleep until the next deadline or a sensor interrupt, with awake/asleep accounting
+
+from clock import ticks_ms, ticks_diff, sleep_ms
+
+try:
+    import machine
+except ImportError:
+    machine = None
+
+WAKE_TIMER = 0x01
+WAKE_MOTION = 0x02
+WAKE_PPG = 0x04
+
+# Typical average current per component state in mA, used for projections.
+# ESP32-C3 class MCU, MPU6050 and MAX30102 datasheet figures.
+CURRENT_MA = {
+    "cpu_active": 25.0,
+    "cpu_idle": 18.0,        # awake in time.sleep
+    "cpu_lightsleep": 0.35,
+    "wifi_on": 75.0,         # associated, PM_NONE
+    "wifi_powersave": 12.0,  # associated, PM_POWERSAVE (DTIM sleep)
+    "wifi_tx": 110.0,        # connecting / sending
+    "mpu_normal": 3.8,       # accel + gyro
+    "mpu_cycle": 0.02,       # accel only, 5 Hz cycle
+    "ppg": 1.2,              # MAX30102 at 100 Hz, LED average included
+}
+
+
+class DutyCycler:
+    """Sleeps between scheduled work and reports which sources woke it.
+
+    Interrupt pins are also checked by level after every sleep: both sensor
+    interrupts stay asserted until their status register is read, so a wake
+    is never lost even if the IRQ handler did not run.
+    """
+
+    def __init__(self, light=None, ticks=ticks_ms, min_sleep_ms=5):
+        if light is None:
+            light = machine.lightsleep if machine and hasattr(machine, "lightsleep") else sleep_ms
+        self.light = light
+        self.ticks = ticks
+        self.min_sleep_ms = min_sleep_ms
+        self.sources = []
+        self.pending = 0
+        self.awake_ms = 0
+        self.asleep_ms = 0
+        self.idle_ms = 0
+        self.wakes = {WAKE_TIMER: 0, WAKE_MOTION: 0, WAKE_PPG: 0}
+        self._mark = ticks()
+
+    def attach(self, pin, source, level):
+        """Use pin as a wake source; level is the asserted pin value"""
+        trigger = pin.IRQ_RISING if level else pin.IRQ_FALLING
+
+        def handler(_):
+            self.pending |= source
+
+        try:
+            pin.irq(trigger=trigger, handler=handler, wake=machine.SLEEP)
+        except (AttributeError, TypeError, ValueError):
+            pin.irq(trigger=trigger, handler=handler)
+        self.sources.append((pin, source, level))
+
+    def signal(self, source):
+        self.pending |= source
+
+    def _take(self):
+        for pin, source, level in self.sources:
+            if pin.value() == level:
+                self.pending |= source
+        if machine and hasattr(machine, "disable_irq"):
+            state = machine.disable_irq()
+            events = self.pending
+            self.pending = 0
+            machine.enable_irq(state)
+        else:
+            events = self.pending
+            self.pending = 0
+        return events
+
+    def sleep_until(self, deadline, light=True):
+        """Sleep until deadline (ticks_ms) or a wake source; returns the WAKE_* bits.
+
+        light=False idles in sleep_ms instead, for while the radio must stay up.
+        """
+        now = self.ticks()
+        self.awake_ms += ticks_diff(now, self._mark)
+        events = self._take()
+        if not events:
+            ms = ticks_diff(deadline, now)
+            if ms >= self.min_sleep_ms:
+                (self.light if light else sleep_ms)(ms)
+            events = self._take()
+        after = self.ticks()
+        slept = ticks_diff(after, now)
+        if light:
+            self.asleep_ms += slept
+        else:
+            self.idle_ms += slept
+        self._mark = after
+        if not events and ticks_diff(deadline, after) <= 0:
+            events = WAKE_TIMER
+        for source in self.wakes:
+            if events & source:
+                self.wakes[source] += 1
+        return events
+
+    @property
+    def duty_cycle(self):
+        total = self.awake_ms + self.asleep_ms + self.idle_ms
+        return (self.awake_ms + self.idle_ms) / total if total else 1.0
+
+
+class EnergyMeter:
+    """Integrates CURRENT_MA states over time"""
+
+    def __init__(self, currents=CURRENT_MA):
+        self.currents = currents
+        self.mas = {}
+
+    def add(self, ms, *states):
+        for state in states:
+            self.mas[state] = self.mas.get(state, 0) + self.currents[state] * ms / 1000
+
+    def mah(self):
+        return sum(self.mas.values()) / 3600
+
+
+if __name__ == '__main__':
+    # One simulated day on a virtual clock: the scheduler above, fed by emulated
+    # sensor interrupts, against the always-awake loop it replaces.
+    import random
+
+    random.seed(7)
+    HOUR = 3600 * 1000
+    DAY = 24 * HOUR
+    READ_MS = 3000           # config.SENSOR_READ_INTERVAL
+    PPG_FULL_MS = 680        # 17 samples at 25 Hz until FIFO_A_FULL
+    COST = {"reading": 30, "ppg": 4, "alert_radio": 6000, "flush": 1500}
+
+    # (start hour, end hour) in which the pet moves; the IMU runs full rate then
+    active = [(7.0, 8.0), (12.5, 13.0), (17.0, 18.5), (20.0, 20.3)]
+    alerts = [9.2 * HOUR, 18.1 * HOUR]
+    # motion wakes during rest periods (twitches, rolling over)
+    twitches = sorted(random.uniform(0, DAY) for _ in range(300))
+
+    def moving(t):
+        h = t / HOUR
+        return any(a <= h < b for a, b in active)
+
+    clock = [0]
+
+    def light(ms):
+        # advance to the deadline or to the next emulated interrupt
+        target = clock[0] + ms
+        next_ppg = (clock[0] // PPG_FULL_MS + 1) * PPG_FULL_MS
+        if next_ppg <= target:
+            target = next_ppg
+            cycler.signal(WAKE_PPG)
+        while twitches and twitches[0] < clock[0]:
+            twitches.pop(0)
+        if twitches and twitches[0] <= target:
+            target = int(twitches.pop(0))
+            cycler.signal(WAKE_MOTION)
+        if moving(target) and not moving(clock[0]):
+            cycler.signal(WAKE_MOTION)
+        clock[0] = max(target, clock[0])
+
+    cycler = DutyCycler(light=light, ticks=lambda: clock[0])
+    meter = EnergyMeter()
+    radio_ms = 0
+    imu_full_ms = 0
+    telemetry_frames = 0
+    deadline = READ_MS
+    while clock[0] < DAY:
+        events = cycler.sleep_until(deadline)
+        if events & WAKE_PPG:
+            clock[0] += COST["ppg"]
+        if events & WAKE_MOTION or moving(clock[0]):
+            # full-rate IMU (sample_imu) until the reading is due, then back to cycle mode
+            span = max(0, deadline - clock[0])
+            imu_full_ms += span
+            clock[0] += span
+        if clock[0] >= deadline:
+            clock[0] += COST["reading"]
+            telemetry_frames += 1
+            deadline += READ_MS
+            if alerts and clock[0] >= alerts[0]:
+                alerts.pop(0)
+                clock[0] += COST["alert_radio"]
+                radio_ms += COST["alert_radio"]
+                telemetry_frames = 0
+            elif telemetry_frames >= 110:      # buffer three-quarters full: radio up to flush
+                clock[0] += COST["flush"]
+                radio_ms += COST["flush"]
+                telemetry_frames = 0
+
+    awake = cycler.awake_ms
+    asleep = cycler.asleep_ms
+    meter.add(awake, "cpu_active")
+    meter.add(asleep, "cpu_lightsleep")
+    meter.add(radio_ms, "wifi_tx")
+    meter.add(imu_full_ms, "mpu_normal")
+    meter.add(DAY - imu_full_ms, "mpu_cycle")
+    meter.add(DAY, "ppg")
+    lp_mah = meter.mah() / 24
+
+    base = EnergyMeter()
+    base.add(DAY, "cpu_idle", "wifi_on", "mpu_normal", "ppg")
+    base.add(DAY // READ_MS * COST["reading"], "cpu_active")
+    base_mah = base.mah() / 24
+
+    print(f"Simulated day: {cycler.wakes[WAKE_PPG]:,} PPG wakes, {cycler.wakes[WAKE_MOTION]:,} motion wakes, "
+          f"{cycler.wakes[WAKE_TIMER]:,} timer wakes")
+    print(f"Duty cycle: {cycler.duty_cycle * 100:.1f}% awake "
+          f"(IMU full rate {imu_full_ms / DAY * 100:.1f}% of the day, radio up {radio_ms / 1000:.0f} s)")
+    print(f"Always-on loop:   {base_mah:6.2f} mAh/h  -> {500 / base_mah:5.1f} h on a 500 mAh cell")
+    print(f"Duty-cycled mode: {lp_mah:6.2f} mAh/h  -> {500 / lp_mah:5.1f} h on a 500 mAh cell")
+    share = sorted(meter.mas.items(), key=lambda kv: -kv[1])
+    print("Duty-cycled energy by state: " + ", ".join(
+        f"{k} {v / 3600 / 24 / lp_mah * 100:.0f}%" for k, v in share))
@@ -0,0 +1,360 @@
+#adaptive MAX30102 settings: output rate, averaging and LED current from signal quality and activity
+
+FULL_SCALE = 0x3FFFF    # 18-bit ADC at the 411 us pulse width
+NO_CONTACT = FULL_SCALE // 100    # IR DC below this: nothing against the sensor, leave the LEDs alone
+
+
+class PPGController:
+    """Runs the MAX30102 at the lowest data rate that still gives a stable pulse.
+
+    observe() sees every FIFO block and keeps the IR DC level, its
+    peak-to-peak swing (perfusion index, swing / DC in %) and the clipped
+    samples. update(), once per reading, then retunes the chip:
+      - LED current: cut on clipping, otherwise steered towards a DC
+        target that is higher while perfusion is weak
+      - averaging: the first of `averages` normally, the last while
+        perfusion is weak (same FIFO rate, less ADC noise)
+      - output rate: the lowest of `rates` that suits the activity and
+        gives `samples_per_beat` at the current heart rate, one step
+        higher for a while after beats keep getting rejected at rest
+    Faster settings apply at once, slower ones only after `hold` readings
+    in a row ask for them.
+    """
+
+    def __init__(self, sensor, rates=(12.5, 25, 50), averages=(4, 8), activity_levels=(0, 1, 1, 1, 1),
+                 samples_per_beat=6, low_pi=0.5, dc_target=(0.3, 0.6), clip_level=0.98,
+                 max_reject=0.3, hold=5, poll_samples=20, min_amplitude=4):
+        self.sensor = sensor
+        self.rates = rates
+        self.averages = averages
+        self.activity_levels = activity_levels
+        self.samples_per_beat = samples_per_beat
+        self.low_pi = low_pi
+        self.dc_target = dc_target
+        self.clip_level = int(clip_level * FULL_SCALE)
+        self.max_reject = max_reject
+        self.hold = hold
+        self.poll_samples = poll_samples
+        self.min_amplitude = min_amplitude
+
+        rate = sensor.output_rate
+        self.level = 0
+        for i in range(len(rates)):
+            if rates[i] <= rate:
+                self.level = i
+        self.average = sensor.average
+        self.amplitude = sensor.led_amplitude[1]
+        self.slower = 0
+        self.boost_level = 0
+        self.boost_left = 0
+        self._beats = 0
+        self._rejected = 0
+        self.dc = 0.0
+        self.pi = None
+        self.reset_window()
+
+        self.changes = 0
+        self.led_changes = 0
+        self.clip_windows = 0
+        self.unstable = 0
+
+    def reset_window(self):
+        self.n = 0
+        self.ir_sum = 0
+        self.ir_min = FULL_SCALE
+        self.ir_max = 0
+        self.clipped = 0
+        self._smooth = -1
+
+    @property
+    def rate(self):
+        return self.rates[self.level]
+
+    @property
+    def poll_ms(self):
+        """FIFO poll interval: poll_samples at the current rate, well inside the 32-sample FIFO"""
+        return int(self.poll_samples * 1000 / self.rates[self.level])
+
+    def observe(self, data):
+        """Fold one FIFO block (6 bytes per sample: RED[3], IR[3]) into the window"""
+        if not data:
+            return
+        lo = self.ir_min
+        hi = self.ir_max
+        total = 0
+        clipped = 0
+        limit = self.clip_level
+        smooth = self._smooth
+        n = 0
+        for i in range(3, len(data) - 2, 6):
+            ir = ((data[i] << 16) | (data[i + 1] << 8) | data[i + 2]) & 0x3FFFF
+            total += ir
+            n += 1
+            if ir >= limit:
+                clipped += 1
+            # the swing is taken on a lightly smoothed trace so ADC noise does not pass for pulse
+            smooth = ir if smooth < 0 else (smooth + ir) >> 1
+            if smooth < lo:
+                lo = smooth
+            if smooth > hi:
+                hi = smooth
+        self._smooth = smooth
+        self.ir_min = lo
+        self.ir_max = hi
+        self.ir_sum += total
+        self.n += n
+        self.clipped += clipped
+
+    def update(self, activity=0, heart_rate=0, beats=0, rejected=0):
+        """Retune after a reading; True when the chip's settings changed.
+
+        heart_rate is the current beat-to-beat estimate (0 if none); beats
+        and rejected are the HRV tracker's running totals.
+        """
+        changed = False
+        average = self.average
+        dc = self.ir_sum / self.n if self.n else 0
+        if dc >= NO_CONTACT:
+            self.dc = dc / FULL_SCALE
+            self.pi = (self.ir_max - self.ir_min) * 100 / dc
+            if self.clipped:
+                # the swing is meaningless while the ADC saturates
+                self.clip_windows += 1
+                amplitude = max(self.min_amplitude, self.amplitude * 3 // 4)
+            else:
+                weak = self.pi < self.low_pi
+                if weak:
+                    average = self.averages[-1]
+                elif self.pi > self.low_pi * 1.5:
+                    average = self.averages[0]
+                target = self.dc_target[1 if weak else 0]
+                amplitude = self.amplitude
+                if not target * 0.7 < self.dc < target * 1.3:
+                    scale = min(2.0, max(0.5, target / self.dc))
+                    amplitude = min(255, max(self.min_amplitude, int(self.amplitude * scale + 0.5)))
+            if amplitude != self.amplitude:
+                self.sensor.set_led_amplitude(amplitude, amplitude)
+                self.amplitude = amplitude
+                # queued samples were lit at the old current; a DC step would pass for a beat
+                self.sensor.clear_fifo()
+                self.led_changes += 1
+                changed = True
+        self.reset_window()
+
+        top = len(self.rates) - 1
+        want = self.activity_levels[activity]
+        if heart_rate:
+            while want < top and self.rates[want] * 60 < heart_rate * self.samples_per_beat:
+                want += 1
+        elif want < self.level:
+            # no beat-to-beat estimate: do not slow down blind
+            want = self.level
+        # rejected beats at rest mean the rate is too low for this pulse; judged over 10+ beats
+        new_beats = beats - self._beats
+        if activity != 0 or changed:
+            self._beats = beats
+            self._rejected = rejected
+        elif new_beats >= 10:
+            if rejected - self._rejected > new_beats * self.max_reject:
+                self.unstable += 1
+                self.boost_level = min(top, self.level + 1)
+                self.boost_left = self.hold * 8
+            self._beats = beats
+            self._rejected = rejected
+        if self.boost_left:
+            self.boost_left -= 1
+            if want < self.boost_level:
+                want = self.boost_level
+
+        level = self.level
+        if want > level:
+            level = want
+            self.slower = 0
+        elif want < level:
+            self.slower += 1
+            if self.slower >= self.hold:
+                level = want
+                self.slower = 0
+        else:
+            self.slower = 0
+
+        if level != self.level or average != self.average:
+            self.sensor.set_sample_rate(int(self.rates[level] * average), average)
+            self.level = level
+            self.average = average
+            self.changes += 1
+            changed = True
+        return changed
+
+    def as_dict(self):
+        return {"rate": self.rates[self.level], "average": self.average, "led": self.amplitude,
+                "dc": round(self.dc, 2), "pi": None if self.pi is None else round(self.pi, 2),
+                "changes": self.changes, "led_changes": self.led_changes,
+                "clip_windows": self.clip_windows, "unstable": self.unstable}
+
+
+if __name__ == '__main__':
+    # Twenty minutes of a dog's day against an emulated MAX30102 driven
+    # through the real driver: the chip averages its internal samples into
+    # the FIFO, IR DC follows the LED current and clips at full scale, and
+    # the pulse rides on motion artifacts and ADC noise. The same run with
+    # the fixed setup (25 Hz, 500 ms polls) and with this controller, over
+    # a counting bus: I2C bytes per minute, LED current, and how often and
+    # how well the HRV tracker's heart rate follows the true one.
+    import math
+    import random
+
+    from hrv import HRVMonitor
+    from max30102_1 import MAX30102
+
+    READING_MS = 3000
+    MOTION_REJECT = 3.0
+    # (label, minutes, activity, heart rate at start and end, perfusion %, motion,
+    #  artifact % of DC, skin contact: IR counts per LED step)
+    TIMELINE = (("rest", 5, 0, 80, 80, 1.2, 0.1, 0.0, 6000),
+                ("walk", 3, 1, 80, 115, 1.2, 1.5, 0.4, 6000),
+                ("play", 2, 3, 115, 165, 1.2, 4.5, 3.0, 6000),
+                ("recover", 3, 0, 165, 90, 1.4, 0.2, 0.0, 6000),
+                ("weak pulse", 3, 0, 85, 85, 0.3, 0.1, 0.0, 6000),
+                ("snug collar", 2, 0, 80, 80, 1.2, 0.1, 0.0, 15000),
+                ("rest", 2, 0, 80, 80, 1.2, 0.1, 0.0, 6000))
+
+    class EmulatedMAX30102:
+        """FIFO-level model of the chip; counts every byte on the wire"""
+
+        def __init__(self):
+            self.regs = bytearray(256)
+            self.fifo = []
+            self.now = 0.0
+            self.next_sample = 0.0
+            self.wire = 0
+            self.led_charge = 0.0     # mA*s
+            self.beats = []
+            self.first = 0            # first beat that can still shape a sample
+            self.seg = TIMELINE[0]
+
+        def rate(self):
+            sps = MAX30102.SAMPLE_RATES[(self.regs[0x0A] >> 2) & 7]
+            return sps, MAX30102.AVERAGES[min(self.regs[0x08] >> 5, 5)]
+
+        def writeto_mem(self, addr, reg, buf):
+            self.wire += 2 + len(buf)
+            for i, b in enumerate(buf):
+                self.regs[reg + i] = b
+            if reg <= 0x04 < reg + len(buf):
+                self.fifo = []
+                self.next_sample = self.now
+
+        def readfrom_mem(self, addr, reg, n):
+            self.wire += 3 + n
+            if reg == 0x04:
+                return bytes(((self.regs[0x06] + len(self.fifo)) & 0x1F,))
+            if reg == 0x07:
+                out = bytearray()
+                for ir in self.fifo[:n // 6]:
+                    out += bytes((0, 0, 0, (ir >> 16) & 0x03, (ir >> 8) & 0xFF, ir & 0xFF))
+                self.fifo = self.fifo[n // 6:]
+                self.regs[0x06] = (self.regs[0x06] + n // 6) & 0x1F
+                return bytes(out)
+            return bytes(self.regs[reg:reg + n])
+
+        def advance(self, ms):
+            end = self.now + ms / 1000
+            sps, ave = self.rate()
+            period = ave / sps
+            _, _, _, _, _, pi, _, artifact, gain = self.seg
+            amp = self.regs[0x0D]
+            # both LEDs pulse 411 us per internal sample
+            self.led_charge += (self.regs[0x0C] + amp) * 0.2 * sps * 411e-6 * (end - self.now)
+            while self.next_sample < end:
+                t = self.next_sample
+                self.next_sample += period
+                beats = self.beats
+                while self.first < len(beats) and beats[self.first] < t - 0.3:
+                    self.first += 1
+                pulse = 0.0
+                k = self.first
+                while k < len(beats) and beats[k] < t + 0.3:
+                    pulse += math.exp(-((t - beats[k]) / 0.1) ** 2)
+                    k += 1
+                dc = amp * gain
+                ir = dc * (1 - pi / 100 * pulse + artifact / 100 * math.sin(2 * math.pi * 2.5 * t))
+                ir += random.gauss(0, 120 / math.sqrt(ave)) + random.gauss(0, 60)
+                ir = max(0, min(FULL_SCALE, int(ir)))
+                if len(self.fifo) < 32:
+                    self.fifo.append(ir)
+            self.now = end
+
+    def run(adaptive, seed=21):
+        random.seed(seed)
+        chip = EmulatedMAX30102()
+        sensor = MAX30102(chip)
+        chip.wire = 0
+        hrv = HRVMonitor(sample_rate=25, motion_limit=MOTION_REJECT)
+        ctrl = PPGController(sensor) if adaptive else None
+        # beat times for the whole day, heart rate sweeping within each segment
+        t = start = 0.0
+        spans = []
+        for seg in TIMELINE:
+            length = seg[1] * 60
+            while t < start + length:
+                hr = seg[3] + (seg[4] - seg[3]) * (t - start) / length
+                t += 60 / hr * (1 + 0.04 * math.sin(t * 1.3)) + random.gauss(0, 0.005)
+                chip.beats.append(t)
+            spans.append((start, start + length, seg))
+            start += length
+        errors = {}
+        ready = {}
+        poll = 500
+        next_poll = poll
+        ms = 0
+        end_ms = int(spans[-1][1] * 1000)
+        while ms < end_ms:
+            step = min(next_poll, (ms // READING_MS + 1) * READING_MS) - ms
+            seg = next(s for s in spans if s[0] <= ms / 1000 < s[1])[2]
+            chip.seg = seg
+            chip.advance(step)
+            ms += step
+            if ms >= next_poll:
+                data = sensor.read_fifo()
+                hrv.add_fifo(data, seg[6])
+                if ctrl:
+                    ctrl.observe(data)
+                next_poll = ms + poll
+            if ms % READING_MS == 0:
+                now = ms / 1000
+                prev = [b for b in chip.beats if now - 20 < b <= now]
+                true_hr = 60 * (len(prev) - 1) / (prev[-1] - prev[0]) if len(prev) > 2 else 0
+                label = seg[0]
+                ready.setdefault(label, [0, 0])
+                ready[label][1] += 1
+                if hrv.ready:
+                    ready[label][0] += 1
+                    errors.setdefault(label, []).append(hrv.heart_rate - true_hr)
+                if ctrl:
+                    hr = hrv.heart_rate if hrv.ready else 0
+                    if ctrl.update(seg[2], hr, hrv.beats, hrv.rejected):
+                        hrv.set_sample_rate(sensor.output_rate)
+                    poll = ctrl.poll_ms
+                    next_poll = min(next_poll, ms + poll)
+        return chip, ready, errors, ctrl, end_ms
+
+    def rms(v):
+        return math.sqrt(sum(x * x for x in v) / len(v)) if v else float("nan")
+
+    results = {}
+    for adaptive in (False, True):
+        chip, ready, errors, ctrl, end_ms = run(adaptive)
+        minutes = end_ms / 60000
+        all_err = [e for v in errors.values() for e in v]
+        n_ready = sum(r[0] for r in ready.values())
+        n = sum(r[1] for r in ready.values())
+        name = "adaptive" if adaptive else "fixed 25 Hz"
+        results[adaptive] = chip.wire / minutes
+        print(f"{name:12} I2C {chip.wire / minutes:7,.0f} B/min   LED {chip.led_charge / (end_ms / 1000):5.2f} mA avg   "
+              f"HR ready {n_ready * 100 / n:3.0f}%   HR error rms {rms(all_err):4.1f} bpm")
+        for label, (ok, total) in ready.items():
+            print(f"   {label:11} ready {ok:3}/{total:3}   error rms {rms(errors.get(label, [])):5.1f} bpm")
+        if ctrl:
+            print(f"   controller: {ctrl.as_dict()}")
+    print(f"I2C traffic {100 - results[True] * 100 / results[False]:.0f}% lower")
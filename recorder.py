@@ -0,0 +1,462 @@
+#raw sensor recorder: MPU6050 bursts, MAX30102 FIFO blocks and NMEA lines into chunk files on flash,
+#plus a CPython reader and replay bus/UART that feed a recording back into the drivers
+#
+# Chunk file rec_NNNNNN.bin:
+#   header  "<4sBBHI"  magic, version, reserved, page size, chunk number
+#   records "<BBHI"    type, reserved, payload length, ticks_ms; then the payload
+# Records never straddle a page; type 0 pads to the end of the page. Pages are
+# written whole from one preallocated buffer, and once the directory holds
+# max_chunks files the oldest one is deleted.
+
+import os
+import struct
+
+from clock import ticks_ms, ticks_diff, sleep_ms
+
+MAGIC = b'PREC'
+VERSION = 1
+CHUNK_HEADER = "<4sBBHI"
+CHUNK_HEADER_SIZE = struct.calcsize(CHUNK_HEADER)
+RECORD_HEADER = "<BBHI"
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER)
+
+REC_PAD = 0
+REC_MPU = 1     # burst from ACCEL_XOUT_H: 6 (accel) or 14 (accel, temp, gyro) bytes
+REC_PPG = 2     # MAX30102 FIFO block, 6 bytes per sample
+REC_NMEA = 3    # one NMEA line as read from the UART
+
+RECORD_NAMES = {REC_MPU: "mpu", REC_PPG: "ppg", REC_NMEA: "nmea"}
+
+TICKS_MASK = 0x3FFFFFFF   # MicroPython ticks period
+
+
+def _chunk_number(name):
+    if name.startswith("rec_") and name.endswith(".bin"):
+        try:
+            return int(name[4:-4])
+        except ValueError:
+            pass
+    return -1
+
+
+def list_chunks(directory):
+    """Chunk file names in recording order"""
+    names = [n for n in os.listdir(directory) if _chunk_number(n) >= 0]
+    names.sort(key=_chunk_number)
+    return names
+
+
+class Recorder:
+    """Append-only raw sensor log with a bounded flash footprint"""
+
+    def __init__(self, directory="rec", page_size=4096, chunk_pages=16, max_chunks=16):
+        self.directory = directory
+        self.page_size = page_size
+        self.chunk_pages = chunk_pages
+        self.max_chunks = max_chunks
+        self.page = bytearray(page_size)
+        self.pos = 0
+        self.pages_written = 0
+        self.file = None
+        self.records = 0
+        self.bytes = 0
+        self.evicted = 0
+        self.too_big = 0
+        self.errors = 0         # flash writes that failed; those records are lost
+        try:
+            os.mkdir(directory)
+        except OSError:
+            pass
+        self.chunks = list_chunks(directory)
+        self.next_chunk = _chunk_number(self.chunks[-1]) + 1 if self.chunks else 0
+
+    def _open_chunk(self):
+        while len(self.chunks) >= self.max_chunks:
+            os.remove(self.directory + "/" + self.chunks.pop(0))
+            self.evicted += 1
+        name = "rec_%06d.bin" % self.next_chunk
+        self.file = open(self.directory + "/" + name, "wb")
+        self.chunks.append(name)
+        struct.pack_into(CHUNK_HEADER, self.page, 0, MAGIC, VERSION, 0, self.page_size, self.next_chunk)
+        self.pos = CHUNK_HEADER_SIZE
+        self.pages_written = 0
+        self.next_chunk += 1
+
+    def _write_page(self):
+        page = self.page
+        if self.pos < self.page_size:
+            page[self.pos] = REC_PAD
+        self.file.write(page)
+        self.pages_written += 1
+        self.pos = 0
+        if self.pages_written >= self.chunk_pages:
+            self.file.close()
+            self.file = None
+
+    def record(self, kind, data, n=None):
+        """Append one record; data is any buffer (n limits it to its first n bytes)"""
+        if n is None:
+            n = len(data)
+        size = RECORD_HEADER_SIZE + n
+        if size > self.page_size - CHUNK_HEADER_SIZE:
+            self.too_big += 1
+            return False
+        try:
+            if self.file is None:
+                self._open_chunk()
+            elif self.pos + size > self.page_size:
+                self._write_page()
+                if self.file is None:
+                    self._open_chunk()
+        except OSError:
+            self._failed()
+            return False
+        pos = self.pos
+        struct.pack_into(RECORD_HEADER, self.page, pos, kind, 0, n, ticks_ms() & 0xFFFFFFFF)
+        pos += RECORD_HEADER_SIZE
+        self.page[pos:pos + n] = data if n == len(data) else memoryview(data)[:n]
+        self.pos = pos + n
+        self.records += 1
+        self.bytes += size
+        return True
+
+    def _failed(self):
+        """Count a failed flash write, drop the page and start a new chunk on the next record"""
+        self.errors += 1
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+        self.pos = 0
+
+    def flush(self):
+        """Write out the current (padded) page so a crash loses nothing before this point"""
+        if self.file is not None and self.pos:
+            try:
+                self._write_page()
+                if self.file is not None:
+                    self.file.flush()
+            except OSError:
+                self._failed()
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @property
+    def footprint(self):
+        return self.max_chunks * self.chunk_pages * self.page_size
+
+
+class RecordingReader:
+    """Memory-mapped reader for a recording directory (CPython host)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = [os.path.join(directory, n) for n in list_chunks(directory)]
+
+    def _chunk_records(self, path):
+        import mmap
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _, page_size, _ = struct.unpack_from(CHUNK_HEADER, data, 0)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path}: not a recorder chunk")
+            pos = CHUNK_HEADER_SIZE
+            end = len(data)
+            while pos + RECORD_HEADER_SIZE <= end:
+                kind, _, n, ts = struct.unpack_from(RECORD_HEADER, data, pos)
+                room = page_size - pos % page_size
+                if kind == REC_PAD or RECORD_HEADER_SIZE + n > room:
+                    pos += room
+                    continue
+                pos += RECORD_HEADER_SIZE
+                yield kind, ts, data[pos:pos + n]
+                pos += n
+        finally:
+            data.close()
+
+    def records(self, kinds=None):
+        """Yield (type, ms since the first record, payload bytes) in recording order"""
+        prev = None
+        elapsed = 0
+        for path in self.paths:
+            for kind, ts, payload in self._chunk_records(path):
+                if prev is None:
+                    prev = ts
+                elapsed += (ts - prev) & TICKS_MASK
+                prev = ts
+                if kinds is None or kind in kinds:
+                    yield kind, elapsed, payload
+
+    def summary(self):
+        counts = {}
+        size = {}
+        duration = 0
+        for kind, elapsed, payload in self.records():
+            counts[kind] = counts.get(kind, 0) + 1
+            size[kind] = size.get(kind, 0) + len(payload)
+            duration = elapsed
+        return counts, size, duration
+
+
+class _Clock:
+    """Paces replay: speed 1.0 is real time, 0 is as fast as possible"""
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.start = None
+
+    def wait(self, elapsed):
+        if not self.speed:
+            return
+        if self.start is None:
+            self.start = ticks_ms()
+        late = ticks_diff(ticks_ms(), self.start) - int(elapsed / self.speed)
+        if late < 0:
+            sleep_ms(-late)
+
+
+class ReplayBus:
+    """I2C stand-in that answers the MPU6050 and MAX30102 drivers from a recording.
+
+    Each MPU burst read consumes the next MPU record and updates a register
+    image from ACCEL_XOUT_H, so single-register reads see the same sample.
+    MAX30102 FIFO pointer reads report the size of the next PPG block.
+    Writes are accepted and ignored. Raises EOFError when the recording ends.
+    """
+
+    def __init__(self, reader, speed=0, mpu_address=0x68, max_address=0x57):
+        self.mpu_address = mpu_address
+        self.max_address = max_address
+        self.clock = _Clock(speed)
+        self.mpu_regs = bytearray(14)
+        self.mpu = self._stream(reader, REC_MPU)
+        self.ppg = self._stream(reader, REC_PPG)
+        self.ppg_next = None
+        self.mpu_reads = 0
+        self.ppg_reads = 0
+
+    def _stream(self, reader, kind):
+        for _, elapsed, payload in reader.records((kind,)):
+            self.clock.wait(elapsed)
+            yield payload
+
+    def scan(self):
+        return [self.max_address, self.mpu_address]
+
+    def writeto(self, addr, buf):
+        pass
+
+    def writeto_mem(self, addr, reg, buf):
+        pass
+
+    def _next_mpu(self):
+        payload = next(self.mpu, None)
+        if payload is None:
+            raise EOFError("end of MPU recording")
+        self.mpu_regs[:len(payload)] = payload
+        self.mpu_reads += 1
+
+    def _peek_ppg(self):
+        if self.ppg_next is None:
+            payload = next(self.ppg, None)
+            if payload is None:
+                raise EOFError("end of PPG recording")
+            self.ppg_next = payload
+        return self.ppg_next
+
+    def readfrom_mem_into(self, addr, reg, buf):
+        if addr == self.mpu_address and reg == 0x3B:
+            self._next_mpu()
+            buf[:] = self.mpu_regs[:len(buf)]
+        else:
+            buf[:] = self.readfrom_mem(addr, reg, len(buf))
+
+    def readfrom_mem(self, addr, reg, n):
+        if addr == self.mpu_address:
+            offset = reg - 0x3B
+            if 0 <= offset and offset + n <= 14:
+                return bytes(self.mpu_regs[offset:offset + n])
+            return bytes(n)
+        if addr == self.max_address:
+            if reg == 0x04:     # FIFO_WR_PTR
+                return bytes([(len(self._peek_ppg()) // 6) & 0x1F])
+            if reg == 0x07:     # FIFO_DATA
+                data = self._peek_ppg()
+                self.ppg_next = None
+                self.ppg_reads += 1
+                return data[:n]
+        return bytes(n)
+
+
+class ReplayUART:
+    """UART stand-in that plays recorded NMEA lines back to the GPS driver"""
+
+    def __init__(self, reader, speed=0):
+        self.clock = _Clock(speed)
+        self.lines = self._lines(reader)
+        self.pending = None
+        self.done = False
+
+    def _lines(self, reader):
+        for _, elapsed, payload in reader.records((REC_NMEA,)):
+            yield elapsed, payload
+
+    def any(self):
+        if self.pending is None and not self.done:
+            item = next(self.lines, None)
+            if item is None:
+                self.done = True
+            else:
+                self.clock.wait(item[0])
+                self.pending = item[1]
+        return 0 if self.pending is None else len(self.pending)
+
+    def readline(self):
+        if not self.any():
+            return None
+        line, self.pending = self.pending, None
+        return line
+
+    def read(self, n=-1):
+        return self.readline()
+
+
+if __name__ == '__main__':
+    # Record synthetic sensor traffic through the drivers, then replay it on CPython.
+    import math
+    import shutil
+    import tempfile
+    import time
+    from mpu6050_1 import MPU6050
+    from max30102_1 import MAX30102
+    from gps_module import GPS
+    from activity import ActivityClassifier, ACTIVITY_NAMES
+
+    directory = tempfile.mkdtemp(prefix="rec_")
+    rec = Recorder(directory, page_size=4096, chunk_pages=8, max_chunks=6)
+
+    class SourceBus:
+        """Synthetic registers for the recording pass"""
+
+        def __init__(self):
+            self.t = 0
+
+        def writeto(self, addr, buf):
+            pass
+
+        def writeto_mem(self, addr, reg, buf):
+            pass
+
+        def readfrom_mem_into(self, addr, reg, buf):
+            self.t += 1
+            s = math.sin(self.t * 0.4)
+            struct.pack_into(">hhhhhhh", buf, 0, int(4000 * s), int(800 * s), 16384 + int(2000 * s),
+                             0, int(300 * s), 0, 0)
+
+        def readfrom_mem(self, addr, reg, n):
+            if reg == 0x04:
+                return bytes([8])
+            if reg == 0x07:
+                return bytes((i * 7 + self.t) & 0xFF for i in range(n))
+            return bytes(n)
+
+    class SourceUART:
+        def __init__(self):
+            body = "GPGGA,123519,1258.2960,N,07735.6760,E,1,08,0.9,920.0,M,,,,"
+            checksum = 0
+            for c in body:
+                checksum ^= ord(c)
+            self.line = f"${body}*{checksum:02X}\r\n".encode()
+            self.pending = 0
+
+        def any(self):
+            return len(self.line) if self.pending else 0
+
+        def readline(self):
+            self.pending -= 1
+            return self.line
+
+    bus = SourceBus()
+    mpu = MPU6050(bus, recorder=rec)
+    ppg = MAX30102(bus, recorder=rec)
+    gps = GPS(uart=SourceUART(), recorder=rec)
+
+    buf = bytearray(14)
+    samples = 30000
+    start = time.perf_counter()
+    for i in range(samples):
+        mpu.read_imu_raw_into(buf)
+        if i % 8 == 0:
+            ppg.read_fifo()
+        if i % 100 == 0:
+            gps.uart.pending = 1
+            gps.update(timeout=1)
+    rec.close()
+    elapsed = time.perf_counter() - start
+    on_disk = sum(os.path.getsize(os.path.join(directory, n)) for n in list_chunks(directory))
+    print(f"Recorded {rec.records:,} records ({rec.bytes:,} bytes) in {elapsed * 1000:.0f} ms, "
+          f"{rec.records / elapsed:,.0f} records/s")
+    print(f"On flash: {len(rec.chunks)} chunks, {on_disk:,} bytes (limit {rec.footprint:,}), "
+          f"evicted {rec.evicted} oldest chunks")
+
+    reader = RecordingReader(directory)
+    counts, sizes, duration = reader.summary()
+    print("Kept: " + ", ".join(f"{RECORD_NAMES[k]}={counts[k]:,}" for k in sorted(counts)))
+
+    replay = ReplayBus(reader, speed=0)
+    mpu = MPU6050(replay)
+    ppg = MAX30102(replay)
+    gps = GPS(uart=ReplayUART(reader))
+    classifier = ActivityClassifier(sample_rate=50, window=100)
+    seen = {}
+    start = time.perf_counter()
+    try:
+        while True:
+            mpu.read_imu_raw_into(buf)
+            x, y, z = struct.unpack_from(">hhh", buf, 0)
+            act = classifier.update(x / mpu.accel_lsb * 9.81, y / mpu.accel_lsb * 9.81, z / mpu.accel_lsb * 9.81)
+            seen[act] = seen.get(act, 0) + 1
+            if replay.mpu_reads % 8 == 0:
+                try:
+                    ppg.read_fifo()
+                except EOFError:
+                    pass
+    except EOFError:
+        pass
+    elapsed = time.perf_counter() - start
+    gps.update(timeout=50)
+    assert replay.mpu_reads == counts[REC_MPU]
+    print(f"Replayed {replay.mpu_reads:,} IMU bursts and {replay.ppg_reads:,} FIFO blocks in "
+          f"{elapsed * 1000:.0f} ms ({replay.mpu_reads / elapsed:,.0f} samples/s through driver + classifier)")
+    print(f"GPS from replayed NMEA: {gps.get_coordinates_string()}")
+    print("Activity: " + ", ".join(f"{ACTIVITY_NAMES[k]}={v}" for k, v in sorted(seen.items())))
+    shutil.rmtree(directory)
+
+    # a failed flash write is counted and dropped, never raised into a driver read
+    full = Recorder(directory=tempfile.mkdtemp(), page_size=256, chunk_pages=2, max_chunks=2)
+    mpu = MPU6050(bus, recorder=full)
+    mpu.read_imu_raw_into(buf)
+
+    class FullFile:
+        def write(self, data):
+            raise OSError(28)   # ENOSPC
+
+        def close(self):
+            pass
+
+    full.file = FullFile()
+    for _ in range(40):
+        mpu.read_imu_raw_into(buf)
+    full.close()
+    assert full.errors == 1 and full.records == 40, (full.errors, full.records)
+    print(f"Flash write failure: {full.errors} counted, recording resumed in a new chunk")
+    shutil.rmtree(full.directory)
@@ -0,0 +1,382 @@
+#sampling worker for a second core/thread: IMU, PPG and GPS bytes go into lock-free single-producer/single-consumer rings
+
+from clock import ticks_us, ticks_diff, ticks_add, sleep_ms
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+
+
+class SlotRing:
+    """Single-producer/single-consumer ring of preallocated fixed-size slots.
+
+    Only the producer moves `head` and only the consumer moves `tail`; each
+    is one int store, published after the slot contents are written, so no
+    lock is needed. One slot stays empty to tell full from empty. A full ring
+    drops the new sample and counts it.
+    """
+
+    def __init__(self, slots, slot_size):
+        self.buf = bytearray(slots * slot_size)
+        mv = memoryview(self.buf)
+        self.views = [mv[i * slot_size:(i + 1) * slot_size] for i in range(slots)]
+        self.stamps = [0] * slots
+        self.slots = slots
+        self.slot_size = slot_size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return (self.head - self.tail) % self.slots
+
+    def reserve(self):
+        """View of the next free slot (producer side), or None when full"""
+        if (self.head + 1) % self.slots == self.tail:
+            self.dropped += 1
+            return None
+        return self.views[self.head]
+
+    def commit(self, stamp=0):
+        head = self.head
+        self.stamps[head] = stamp
+        self.head = (head + 1) % self.slots
+        used = (self.head - self.tail) % self.slots
+        if used > self.high_water:
+            self.high_water = used
+
+    def peek(self):
+        """Index of the oldest filled slot (consumer side), or -1 when empty"""
+        if self.tail == self.head:
+            return -1
+        return self.tail
+
+    def release(self):
+        self.tail = (self.tail + 1) % self.slots
+
+
+class ByteRing:
+    """Single-producer/single-consumer byte ring; a write that does not fit is dropped whole"""
+
+    def __init__(self, size):
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.size = size
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return (self.head - self.tail) % self.size
+
+    def write(self, data, n=None):
+        if n is None:
+            n = len(data)
+        if n <= 0:
+            return 0
+        used = (self.head - self.tail) % self.size
+        if used + n >= self.size:
+            self.dropped += n
+            return 0
+        head = self.head
+        first = min(n, self.size - head)
+        self.mv[head:head + first] = memoryview(data)[:first]
+        if first < n:
+            self.mv[0:n - first] = memoryview(data)[first:n]
+        self.head = (head + n) % self.size
+        if used + n > self.high_water:
+            self.high_water = used + n
+        return n
+
+    def readinto(self, dst):
+        """Copy up to len(dst) bytes out; returns the count"""
+        tail = self.tail
+        n = min((self.head - tail) % self.size, len(dst))
+        if not n:
+            return 0
+        first = min(n, self.size - tail)
+        dst[0:first] = self.mv[tail:tail + first]
+        if first < n:
+            dst[first:n] = self.mv[0:n - first]
+        self.tail = (tail + n) % self.size
+        return n
+
+
+class SamplingWorker:
+    """High-rate sensor sampling meant to run on its own thread.
+
+    The worker owns the I2C bus while running: any other bus access must go
+    through bus_call(), which takes the same lock the worker holds for each
+    transaction. Sample data only crosses threads through the rings.
+    """
+
+    def __init__(self, mpu, imu_ring, imu_rate=100, max_sensor=None, ppg_ring=None,
+                 ppg_interval_ms=500, uart=None, gps_ring=None, mux=None,
+                 mpu_channel=None, max_channel=None):
+        self.mpu = mpu
+        self.imu_ring = imu_ring
+        self.period_us = 1000000 // imu_rate
+        self.max_sensor = max_sensor
+        self.ppg_ring = ppg_ring
+        self.ppg_interval_us = ppg_interval_ms * 1000
+        self.uart = uart
+        self.gps_ring = gps_ring
+        self.gps_buf = bytearray(128)
+        self.mux = mux
+        self.mpu_channel = mpu_channel
+        self.max_channel = max_channel
+        self.channel = None
+        self.bus = _thread.allocate_lock() if _thread else None
+
+        self.running = False
+        self.stopped = True
+        self.imu_samples = 0
+        self.ppg_reads = 0
+        # PPG bytes put in the ring so far, and the offset of the latest gap in that
+        # stream (FIFO overflow or a dropped write); the consumer restarts beat
+        # detection when its own byte count reaches it
+        self.ppg_written = 0
+        self.ppg_gap_at = -1
+        self.gps_bytes = 0
+        self.late = 0
+        self.max_late_us = 0
+        self.errors = 0
+
+    def _select(self, channel):
+        if self.mux is not None and channel is not None and channel != self.channel:
+            self.mux(channel)
+            self.channel = channel
+
+    def bus_call(self, channel, fn, *args):
+        """Run fn(*args) with the bus lock held and the mux on channel"""
+        bus = self.bus
+        if bus:
+            bus.acquire()
+        try:
+            self._select(channel)
+            return fn(*args)
+        finally:
+            if bus:
+                bus.release()
+
+    def start(self):
+        if _thread is None:
+            raise OSError("_thread not available")
+        self.running = True
+        self.stopped = False
+        _thread.start_new_thread(self.run, ())
+
+    def stop(self, timeout_ms=1000):
+        self.running = False
+        while not self.stopped and timeout_ms > 0:
+            sleep_ms(5)
+            timeout_ms -= 5
+
+    def run(self):
+        imu_ring = self.imu_ring
+        ppg_ring = self.ppg_ring
+        gps_ring = self.gps_ring
+        uart = self.uart
+        mpu = self.mpu
+        bus = self.bus
+        period = self.period_us
+        next_tick = ticks_us()
+        next_ppg = ticks_add(next_tick, self.ppg_interval_us)
+        try:
+            while self.running:
+                now = ticks_us()
+                late = ticks_diff(now, next_tick)
+                if late > period:
+                    self.late += 1
+                    if late > self.max_late_us:
+                        self.max_late_us = late
+                    # skip the missed ticks instead of bursting to catch up
+                    next_tick = now
+                slot = imu_ring.reserve()
+                if slot is not None:
+                    if bus:
+                        bus.acquire()
+                    try:
+                        self._select(self.mpu_channel)
+                        mpu.read_imu_raw_into(slot)
+                        ok = True
+                    except OSError:
+                        self.errors += 1
+                        ok = False
+                    finally:
+                        if bus:
+                            bus.release()
+                    if ok:
+                        imu_ring.commit(now)
+                        self.imu_samples += 1
+
+                if ppg_ring is not None and ticks_diff(now, next_ppg) >= 0:
+                    next_ppg = ticks_add(next_ppg, self.ppg_interval_us)
+                    if bus:
+                        bus.acquire()
+                    try:
+                        self._select(self.max_channel)
+                        data = self.max_sensor.read_fifo()
+                        # queued under the lock, so a bus_call that retunes the chip
+                        # finds every sample taken at the old settings already in the ring
+                        if data:
+                            n = len(data)
+                            if self.max_sensor.fifo_lost:
+                                # the chip dropped samples after this block; set before it is published
+                                self.ppg_gap_at = self.ppg_written + n
+                            if ppg_ring.write(data):
+                                self.ppg_written += n
+                                self.ppg_reads += 1
+                            else:
+                                self.ppg_gap_at = self.ppg_written
+                    except OSError:
+                        self.errors += 1
+                    finally:
+                        if bus:
+                            bus.release()
+
+                if gps_ring is not None and uart.any():
+                    n = uart.readinto(self.gps_buf)
+                    if n:
+                        gps_ring.write(self.gps_buf, n)
+                        self.gps_bytes += n
+
+                next_tick = ticks_add(next_tick, period)
+                wait = ticks_diff(next_tick, ticks_us())
+                if wait >= 1000:
+                    sleep_ms(wait // 1000)
+        finally:
+            self.stopped = True
+
+    def stats(self):
+        dropped = self.imu_ring.dropped
+        total = self.imu_samples + dropped
+        return {
+            "imu": self.imu_samples,
+            "imu_dropped": dropped,
+            "imu_drop_pct": dropped * 100 / total if total else 0,
+            "imu_high_water": self.imu_ring.high_water,
+            "ppg_dropped": self.ppg_ring.dropped if self.ppg_ring else 0,
+            "gps_dropped": self.gps_ring.dropped if self.gps_ring else 0,
+            "late": self.late,
+            "max_late_ms": self.max_late_us / 1000,
+            "errors": self.errors,
+        }
+
+
+if __name__ == '__main__':
+    # Both sides under real threads on CPython: the worker samples fake sensors
+    # at a high rate while the consumer stalls the way a TLS request does.
+    # Every IMU read carries a sequence number: the consumer must see each
+    # stored sample exactly once and in order, and everything else is a counted drop.
+    import time
+
+    class FakeMPU:
+        def __init__(self):
+            self.seq = 0
+
+        def read_imu_raw_into(self, buf):
+            s = self.seq
+            buf[0] = s >> 24 & 0xFF
+            buf[1] = s >> 16 & 0xFF
+            buf[2] = s >> 8 & 0xFF
+            buf[3] = s & 0xFF
+            self.seq = s + 1
+
+    class FakeMAX:
+        def __init__(self):
+            self.seq = 0
+            self.fifo_lost = 0
+
+        def read_fifo(self):
+            out = bytearray(6 * 4)
+            for i in range(4):
+                out[i * 6 + 5] = self.seq & 0xFF
+                self.seq += 1
+            return out
+
+    class FakeUART:
+        SENTENCE = b"$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47\r\n"
+
+        def __init__(self, bps=9600):
+            self.bytes_per_s = bps // 10
+            self.start = time.monotonic()
+            self.sent = 0
+
+        def _due(self):
+            return int((time.monotonic() - self.start) * self.bytes_per_s) - self.sent
+
+        def any(self):
+            return max(0, self._due())
+
+        def readinto(self, buf):
+            n = min(len(buf), self._due())
+            s = self.SENTENCE
+            for i in range(n):
+                buf[i] = s[(self.sent + i) % len(s)]
+            self.sent += n
+            return n
+
+    def consume(ring, ppg, gps, seconds, stall_every_s, stall_s, result, expect=0):
+        gaps = 0
+        got = 0
+        ppg_buf = bytearray(256)
+        gps_buf = bytearray(256)
+        ppg_bytes = gps_bytes = 0
+        worst_backlog = 0
+        end = time.monotonic() + seconds
+        next_stall = time.monotonic() + stall_every_s
+        while time.monotonic() < end:
+            worst_backlog = max(worst_backlog, len(ring))
+            while True:
+                i = ring.peek()
+                if i < 0:
+                    break
+                v = ring.views[i]
+                seq = v[0] << 24 | v[1] << 16 | v[2] << 8 | v[3]
+                if seq != expect:
+                    gaps += seq - expect
+                expect = seq + 1
+                got += 1
+                ring.release()
+            ppg_bytes += ppg.readinto(ppg_buf)
+            while True:
+                n = gps.readinto(gps_buf)
+                if not n:
+                    break
+                gps_bytes += n
+            if time.monotonic() >= next_stall:
+                time.sleep(stall_s)      # network send on the main thread
+                next_stall += stall_every_s
+            else:
+                time.sleep(0.005)
+        result.update(got=got, gaps=gaps, expect=expect, ppg_bytes=ppg_bytes, gps_bytes=gps_bytes,
+                      backlog=worst_backlog)
+
+    for rate, slots, stall, every in ((1000, 2048, 0.8, 1.0), (1000, 256, 0.8, 1.0), (2000, 4096, 1.5, 2.0)):
+        imu_ring = SlotRing(slots, 14)
+        ppg_ring = ByteRing(2048)
+        gps_ring = ByteRing(1024)
+        mpu = FakeMPU()
+        worker = SamplingWorker(mpu, imu_ring, rate, FakeMAX(), ppg_ring, 50,
+                                FakeUART(), gps_ring)
+        result = {}
+        worker.start()
+        consume(imu_ring, ppg_ring, gps_ring, 4.0, every, stall, result)
+        worker.stop()
+        # drain what the worker produced after the consumer stopped
+        tail = {}
+        consume(imu_ring, ppg_ring, gps_ring, 0.05, 10, 0, tail, result["expect"])
+        s = worker.stats()
+        got = result["got"] + tail["got"]
+        gaps = result["gaps"] + tail["gaps"]
+        assert gaps == 0 and got == s["imu"] == mpu.seq, (gaps, got, s["imu"], mpu.seq)
+        print(f"{rate} Hz IMU, {slots}-slot ring, {stall * 1000:.0f} ms consumer stall every {every:.0f} s:")
+        print(f"   produced {s['imu']:,}, consumed {got:,}, dropped {s['imu_dropped']:,} "
+              f"({s['imu_drop_pct']:.2f}%), ring high water {s['imu_high_water']}/{slots - 1}")
+        print(f"   PPG {result['ppg_bytes'] + tail['ppg_bytes']:,} B (dropped {s['ppg_dropped']}), "
+              f"GPS {result['gps_bytes'] + tail['gps_bytes']:,} B (dropped {s['gps_dropped']}), "
+              f"late ticks {s['late']}, worst {s['max_late_ms']:.1f} ms")
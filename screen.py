@@ -0,0 +1,223 @@
+#terminal output for the sensor monitor: redraw only changed fields, or stream CSV/binary frames for host plotting
+
+import struct
+import sys
+
+from clock import ticks_ms
+
+ESC = "\x1b["
+FRAME_SYNC = b"\xa5\x5a"
+FRAME_HEAD = "<2sHI"     # sync, sequence, ticks_ms; then one f32 per field and an XOR checksum byte
+
+
+def _write(out, text):
+    out.write(text)
+    return len(text.encode()) if isinstance(text, str) else len(text)
+
+
+class DiffScreen:
+    """Draws rows of (label, value) once, then rewrites only the values that changed.
+
+    A row whose label changes, or a different number of rows, triggers a
+    full redraw. Values are rewritten in place with a cursor move and an
+    erase to end of line, all in a single write per refresh.
+    """
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.labels = None
+        self.values = []
+        self.last_bytes = 0
+        self.full_redraws = 0
+
+    def invalidate(self):
+        self.labels = None
+
+    def render(self, rows):
+        labels = [r[0] for r in rows]
+        parts = []
+        if labels != self.labels:
+            parts.append(ESC + "2J" + ESC + "H")
+            for label, value in rows:
+                parts.append(label + value + "\r\n")
+            self.labels = labels
+            self.values = [r[1] for r in rows]
+            self.full_redraws += 1
+        else:
+            values = self.values
+            for i in range(len(rows)):
+                value = rows[i][1]
+                if value != values[i]:
+                    parts.append(f"{ESC}{i + 1};{len(labels[i]) + 1}H{value}{ESC}K")
+                    values[i] = value
+            if parts:
+                # park the cursor below the table
+                parts.append(f"{ESC}{len(rows) + 1};1H")
+        text = "".join(parts)
+        self.last_bytes = _write(self.out, text) if text else 0
+        return self.last_bytes
+
+
+class FullScreen:
+    """The original output: clear the screen and print every row"""
+
+    def __init__(self, out=None):
+        self.out = out or sys.stdout
+        self.last_bytes = 0
+
+    def invalidate(self):
+        pass
+
+    def render(self, rows):
+        text = ESC + "2J" + ESC + "H" + "".join(label + value + "\n" for label, value in rows)
+        self.last_bytes = _write(self.out, text)
+        return self.last_bytes
+
+
+class StreamWriter:
+    """Machine-readable readings for host tools: one CSV line or one binary frame per refresh.
+
+    Both start with a '#fields name,name,...' line, repeated whenever the
+    field set changes. Missing values are empty in CSV and NaN in binary.
+    """
+
+    def __init__(self, out=None, binary=False):
+        out = out or sys.stdout
+        self.binary = binary
+        self.out = getattr(out, "buffer", out) if binary else out
+        self.fields = None
+        self.seq = 0
+        self.last_bytes = 0
+        self._fmt = None
+
+    def invalidate(self):
+        self.fields = None
+
+    def write(self, values, ticks=None):
+        """values: list of (name, number or None)"""
+        if ticks is None:
+            ticks = ticks_ms()
+        names = [v[0] for v in values]
+        n = 0
+        if names != self.fields:
+            self.fields = names
+            header = "#fields " + ",".join(names) + "\n"
+            n += _write(self.out, header.encode() if self.binary else header)
+            self._fmt = FRAME_HEAD + "f" * len(names)
+        if self.binary:
+            nums = [float("nan") if v[1] is None else float(v[1]) for v in values]
+            frame = bytearray(struct.pack(self._fmt, FRAME_SYNC, self.seq & 0xFFFF,
+                                          ticks & 0xFFFFFFFF, *nums))
+            check = 0
+            for b in frame:
+                check ^= b
+            frame.append(check)
+            n += _write(self.out, frame)
+        else:
+            line = str(ticks) + "," + ",".join("" if v[1] is None else _num(v[1]) for v in values) + "\n"
+            n += _write(self.out, line)
+        self.seq += 1
+        self.last_bytes = n
+        return n
+
+
+def _num(v):
+    if isinstance(v, float):
+        return f"{v:.4g}"
+    return str(v)
+
+
+def decode_stream(data):
+    """Host side: yield (fields, seq, ticks, values) from a binary stream; bad frames are skipped"""
+    fields = None
+    fmt = None
+    size = 0
+    pos = 0
+    end = len(data)
+    while pos < end:
+        if data[pos:pos + 8] == b"#fields ":
+            nl = data.index(b"\n", pos)
+            fields = data[pos + 8:nl].decode().split(",")
+            fmt = FRAME_HEAD + "f" * len(fields)
+            size = struct.calcsize(fmt)
+            pos = nl + 1
+            continue
+        if fields is None or data[pos:pos + 2] != FRAME_SYNC or pos + size + 1 > end:
+            pos += 1
+            continue
+        frame = data[pos:pos + size]
+        check = 0
+        for b in frame:
+            check ^= b
+        if check != data[pos + size]:
+            pos += 1
+            continue
+        _, seq, ticks, *values = struct.unpack(fmt, frame)
+        yield fields, seq, ticks, values
+        pos += size + 1
+
+
+if __name__ == '__main__':
+    # Bytes per refresh and time on the wire for the sensor monitor table,
+    # redrawn in full versus diffed, and the stream modes, over a run of
+    # readings where a few fields change each cycle.
+    import io
+    import math
+    import random
+    import time
+
+    random.seed(3)
+
+    def rows_for(i, n_mpu=2):
+        rows = [("=" * 60, ""), (" SENSOR READINGS - ", f"({2026}, 10, 18, 12, {i // 60:02d}, {i % 60:02d})"),
+                ("=" * 60, "")]
+        for m in range(n_mpu):
+            t = i / 10 + m
+            rows += [("", ""), (f" MPU6050@ch{m}/0x68 (Motion Sensor)", ""), ("-" * 60, ""),
+                     ("  Accelerometer:", "")]
+            for axis, v in (("X", math.sin(t) * 2), ("Y", 0.12), ("Z", 9.81 + math.cos(t) * 0.4)):
+                rows.append((f"    {axis}: ", f"{v:7.2f} m/s²"))
+            rows.append(("  Gyroscope:", ""))
+            for axis, v in (("X", 0.0), ("Y", round(math.sin(t * 3), 1)), ("Z", 0.0)):
+                rows.append((f"    {axis}: ", f"{v:7.2f} °/s"))
+            rows += [("  Temperature: ", f"{36.5 + (i // 50) * 0.1:.1f} °C"),
+                     ("  Motion Magnitude: ", f"{abs(math.sin(t)) * 1.5:.2f}"),
+                     ("  Activity: ", "walk" if math.sin(t / 5) > 0 else "rest")]
+        rows += [("", ""), (" MAX30102 (Pulse Oximeter)", ""), ("-" * 60, ""),
+                 ("  SpO2: ", f"{97 + (i % 7 == 0)}%"), ("  Heart Rate: ", f"{88 + i % 3} BPM"),
+                 ("", ""), (" GPS Location", ""), ("-" * 60, ""),
+                 (" Searching for GPS fix...", ""), (" Satellites: ", str(min(9, i // 20))),
+                 ("", ""), ("=" * 60, ""), ("Press Ctrl+C to stop monitoring", ""), ("=" * 60, "")]
+        return rows
+
+    def values_for(rows):
+        return [(label.strip(" :") or str(k), float(value.split()[0].rstrip("%")))
+                for k, (label, value) in enumerate(rows)
+                if value and value.split()[0].rstrip("%").replace(".", "").replace("-", "").isdigit()]
+
+    refreshes = 300
+    baud = 115200
+    results = []
+    for name, make in (("full redraw", lambda o: FullScreen(o)), ("diff redraw", lambda o: DiffScreen(o)),
+                       ("CSV stream", lambda o: StreamWriter(o)),
+                       ("binary stream", lambda o: StreamWriter(io.BytesIO(), binary=True))):
+        sink = io.StringIO()
+        out = make(sink)
+        total = 0
+        start = time.perf_counter()
+        for i in range(refreshes):
+            rows = rows_for(i)
+            if isinstance(out, StreamWriter):
+                total += out.write(values_for(rows), ticks=i * 2000)
+            else:
+                total += out.render(rows)
+        cpu = (time.perf_counter() - start) / refreshes * 1000
+        per = total / refreshes
+        results.append((name, per, per * 10 / baud * 1000, cpu))
+        if name == "binary stream":
+            frames = list(decode_stream(out.out.getvalue()))
+            assert len(frames) == refreshes and frames[-1][1] == refreshes - 1
+
+    print(f"{'Output':14} {'bytes/refresh':>14} {'ms on wire @115200':>19} {'host CPU ms':>12}")
+    for name, per, wire, cpu in results:
+        print(f"{name:14} {per:14,.0f} {wire:19.1f} {cpu:12.3f}")
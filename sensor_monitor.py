@@ -3,6 +3,7 @@
 from machine import I2C, Pin
 import time
 import gc
+from array import array
 try:
     import config
 except ImportError:
@@ -18,6 +19,10 @@ except ImportError:
         MAX30102_CHANNEL = 2
         MPU6050_ADDRESS = 0x68
         MAX30102_ADDRESS = 0x57
+        MONITOR_OUTPUT = "diff"
+        ACTIVITY_SAMPLE_RATE = 50
+        ACTIVITY_WINDOW = 100
+        ACTIVITY_BURST_SAMPLES = 25
 
 try:
     from mpu6050_1 import MPU6050
@@ -26,6 +31,13 @@ except ImportError:
     print("mpu6050_1.py not found")
     MPU_AVAILABLE = False
 
+try:
+    from activity import ActivityClassifier
+    ACTIVITY_AVAILABLE = True
+except ImportError:
+    print("activity.py not found")
+    ACTIVITY_AVAILABLE = False
+
 try:
     from max30102_1 import MAX30102
     MAX_AVAILABLE = True
@@ -33,6 +45,15 @@ except ImportError:
     print("max30102_1.py not found")
     MAX_AVAILABLE = False
 
+try:
+    from device_registry import DeviceRegistry, RoundRobinScheduler, Mux, KIND_MPU, KIND_MAX
+    REGISTRY_AVAILABLE = True
+except ImportError:
+    print("device_registry.py not found")
+    REGISTRY_AVAILABLE = False
+
+from screen import DiffScreen, FullScreen, StreamWriter
+
 try:
     from gps_module import GPS
     GPS_AVAILABLE = True
@@ -41,6 +62,11 @@ except ImportError:
     GPS_AVAILABLE = False
 
 
+def _s16(hi, lo):
+    v = (hi << 8) | lo
+    return v - 65536 if v > 32767 else v
+
+
 class SensorMonitor:
     
     def __init__(self):
@@ -57,12 +83,26 @@ class SensorMonitor:
         self.mpu_sensor = None  
         self.max_sensor = None
         self.gps = None
+        self.classifier = None
+        self.mux = None
+        self.registry = None
+        self.scheduler = None
+        self.mpu_devices = []
+        self.max_device = None
+        self.classifiers = {}
+        self.output = None
+        self.output_mode = None
+        self.last_bytes = 0
+        self.loop_ms = 0
+        self.set_output(getattr(config, "MONITOR_OUTPUT", "diff"))
 
-        if MPU_AVAILABLE:
-            self.init_mpu_sensor()
-
-        if MAX_AVAILABLE:
-            self.init_max_sensor()
+        if REGISTRY_AVAILABLE and (MPU_AVAILABLE or MAX_AVAILABLE):
+            self.init_devices()
+        else:
+            if MPU_AVAILABLE:
+                self.init_mpu_sensor()
+            if MAX_AVAILABLE:
+                self.init_max_sensor()
 
         if GPS_AVAILABLE:
             self.init_gps()
@@ -93,8 +133,60 @@ class SensorMonitor:
         return names.get(addr, "Unknown")
     
     def select_mux_channel(self, channel):
-        if config.USE_MULTIPLEXER and 0 <= channel <= 7:
+        if self.mux:
+            self.mux.select(channel)
+        elif config.USE_MULTIPLEXER and 0 <= channel <= 7:
             self.i2c.writeto(config.TCA9548A_ADDRESS, bytes([1 << channel]))
+
+    def init_devices(self):
+        """Discover every sensor on every mux channel and read the IMUs round-robin"""
+        factories = {}
+        if MPU_AVAILABLE:
+            factories[KIND_MPU] = lambda i2c, addr: MPU6050(i2c, addr)
+        if MAX_AVAILABLE:
+            factories[KIND_MAX] = lambda i2c, addr: MAX30102(i2c, addr)
+        if config.USE_MULTIPLEXER:
+            self.mux = Mux(self.i2c, config.TCA9548A_ADDRESS)
+        self.registry = DeviceRegistry(self.i2c, self.mux, factories)
+        try:
+            self.registry.discover()
+        except Exception as e:
+            print(f"Sensor discovery failed: {e}")
+            return
+        print(f"\n Sensors: {self.registry.describe()}")
+        self.mpu_devices = [d for d in self.registry.of_kind(KIND_MPU) if self.registry.open(d)]
+        if self.mpu_devices:
+            self.mpu_sensor = self.mpu_devices[0].driver
+            self.scheduler = RoundRobinScheduler(self.registry, kinds=(KIND_MPU,))
+            if ACTIVITY_AVAILABLE:
+                for d in self.mpu_devices:
+                    self.classifiers[d.index] = ActivityClassifier(sample_rate=config.ACTIVITY_SAMPLE_RATE,
+                                                                   window=config.ACTIVITY_WINDOW)
+        max_device = self.registry.find(KIND_MAX, config.MAX30102_CHANNEL)
+        if max_device and self.registry.open(max_device):
+            self.max_device = max_device
+            self.max_sensor = max_device.driver
+
+    def sample_activity(self):
+        """One burst per IMU at the activity rate; each pass costs one mux switch per channel"""
+        count = config.ACTIVITY_BURST_SAMPLES
+        bursts = {index: [array('f', [0.0] * (3 * count)), 0] for index in self.classifiers}
+        for _ in range(count):
+            self.scheduler.read_cycle()
+            for device, _, raw in self.scheduler.merged():
+                burst = bursts.get(device.index)
+                if burst is None or burst[1] == count:
+                    continue
+                buf, n = burst
+                scale = 9.81 / device.driver.accel_lsb
+                buf[3 * n] = _s16(raw[0], raw[1]) * scale
+                buf[3 * n + 1] = _s16(raw[2], raw[3]) * scale
+                buf[3 * n + 2] = _s16(raw[4], raw[5]) * scale
+                burst[1] = n + 1
+            time.sleep_ms(1000 // config.ACTIVITY_SAMPLE_RATE)
+        # refreshes are seconds apart: each burst is classified on its own filter state
+        for index, (buf, n) in bursts.items():
+            self.classifiers[index].add_burst(buf, n)
     
     def init_mpu_sensor(self):
         try:
@@ -105,6 +197,9 @@ class SensorMonitor:
             else:
                 self.mpu_sensor = MPU6050(self.i2c)
                 print("MPU6050 initialized (direct I2C)")
+            if ACTIVITY_AVAILABLE:
+                self.classifier = ActivityClassifier(sample_rate=config.ACTIVITY_SAMPLE_RATE,
+                                                     window=config.ACTIVITY_WINDOW)
         except Exception as e:
             print(f"MPU6050 init failed: {e}")
     
@@ -130,25 +225,45 @@ class SensorMonitor:
         except Exception as e:
             print(f"GPS init failed: {e}")
     
-    def read_mpu(self, sensor, name):
+    def read_mpu(self, sensor, name, classifier=None):
         try:
             accel = sensor.get_accel_data()
             gyro = sensor.get_gyro_data()
             temp = sensor.get_temp()
-            motion = abs(accel['x']) + abs(accel['y']) + abs(accel['z'])
+            activity = None
+            if classifier:
+                motion = classifier.motion
+                activity = classifier.name
+            elif self.classifier:
+                count = config.ACTIVITY_BURST_SAMPLES
+                buf = array('f', [0.0] * (3 * count))
+                for i in range(count):
+                    sample = sensor.get_accel_data()
+                    buf[3 * i] = sample['x']
+                    buf[3 * i + 1] = sample['y']
+                    buf[3 * i + 2] = sample['z']
+                    time.sleep_ms(1000 // config.ACTIVITY_SAMPLE_RATE)
+                self.classifier.add_burst(buf, count)
+                motion = self.classifier.motion
+                activity = self.classifier.name
+            else:
+                motion = abs(accel['x']) + abs(accel['y']) + abs(accel['z'])
             
             return {
+                'name': name,
                 'accel': accel,
                 'gyro': gyro,
                 'temp': temp,
                 'motion': motion,
+                'activity': activity,
                 'available': True
             }
         except Exception as e:
-            return {'available': False, 'error': str(e)}
+            return {'name': name, 'available': False, 'error': str(e)}
     
     def read_max(self):
         try:
+            self.max_sensor.read_fifo()
             spo2 = self.max_sensor.read_spo2()
             hr = self.max_sensor.read_heart_rate()
 
@@ -175,68 +290,124 @@ class SensorMonitor:
         except Exception as e:
             return {'available': False, 'error': str(e)}
     
-    def display_readings(self, mpu_data, max_data, gps_data):
-        """Display sensor readings in formatted output"""
-        print("\033[2J\033[H", end="")
-
-        print("=" * 60)
-        print(f" SENSOR READINGS - {time.localtime()}")
-        print("=" * 60)
-
-        print("\n MPU6050 (Motion Sensor)")
-        print("-" * 60)
-        if mpu_data and mpu_data.get('available'):
-            print(f"  Accelerometer:")
-            print(f"    X: {mpu_data['accel']['x']:7.2f} m/s²")
-            print(f"    Y: {mpu_data['accel']['y']:7.2f} m/s²")
-            print(f"    Z: {mpu_data['accel']['z']:7.2f} m/s²")
-            print(f"  Gyroscope:")
-            print(f"    X: {mpu_data['gyro']['x']:7.2f} °/s")
-            print(f"    Y: {mpu_data['gyro']['y']:7.2f} °/s")
-            print(f"    Z: {mpu_data['gyro']['z']:7.2f} °/s")
-            print(f"  Temperature: {mpu_data['temp']:.1f} °C")
-            print(f"  Motion Magnitude: {mpu_data['motion']:.2f}")
-        else:
-            print(f"Not available")
-        print("\n MAX30102 (Pulse Oximeter)")
-        print("-" * 60)
+    def format_readings(self, mpu_data, max_data, gps_data):
+        """Screen rows as (label, value); labels are static, values change"""
+        rows = [("=" * 60, ""), (" SENSOR READINGS - ", str(time.localtime())), ("=" * 60, "")]
+        if not isinstance(mpu_data, list):
+            mpu_data = [mpu_data]
+        for data in mpu_data:
+            rows += self.mpu_rows(data)
+        rows += [("", ""), (" MAX30102 (Pulse Oximeter)", ""), ("-" * 60, "")]
         if max_data and max_data.get('available'):
-            print(f"  SpO2: {max_data['spo2']}%")
-            print(f"  Heart Rate: {max_data['heart_rate']} BPM")
+            rows.append(("  SpO2: ", f"{max_data['spo2']}%"))
+            rows.append(("  Heart Rate: ", f"{max_data['heart_rate']} BPM"))
         else:
-            print(f"Not available")
-        print("\n GPS Location")
-        print("-" * 60)
+            rows.append(("Not available", ""))
+        rows += [("", ""), (" GPS Location", ""), ("-" * 60, "")]
         if gps_data and gps_data.get('available'):
             if gps_data.get('has_fix'):
-                print(f"  Latitude:  {gps_data['latitude']:.6f}°")
-                print(f"  Longitude: {gps_data['longitude']:.6f}°")
-                print(f"  Altitude:  {gps_data['altitude']:.1f} m")
-                print(f"  Satellites: {gps_data['satellites']}")
-                print(f"  Status:  GPS Fix Acquired")
+                rows.append(("  Latitude:  ", f"{gps_data['latitude']:.6f}°"))
+                rows.append(("  Longitude: ", f"{gps_data['longitude']:.6f}°"))
+                rows.append(("  Altitude:  ", f"{gps_data['altitude']:.1f} m"))
+                rows.append(("  Satellites: ", str(gps_data['satellites'])))
+                rows.append(("  Status:  GPS Fix Acquired", ""))
                 if gps_data['latitude'] and gps_data['longitude']:
-                    maps_url = f"https://maps.google.com/?q={gps_data['latitude']},{gps_data['longitude']}"
-                    print(f"  Maps: {maps_url}")
+                    rows.append(("  Maps: ", f"https://maps.google.com/?q={gps_data['latitude']},{gps_data['longitude']}"))
             else:
-                print(f" Searching for GPS fix...")
-                print(f" Satellites: {gps_data['satellites']}")
+                rows.append((" Searching for GPS fix...", ""))
+                rows.append((" Satellites: ", str(gps_data['satellites'])))
         else:
-            print(f"GPS not available")
+            rows.append(("GPS not available", ""))
+        rows += [("", ""), ("=" * 60, ""),
+                 (" Last refresh: ", f"{self.last_bytes} bytes, loop {self.loop_ms} ms"),
+                 ("Press Ctrl+C to stop monitoring", ""), ("=" * 60, "")]
+        return rows
+
+    def mpu_rows(self, mpu_data):
+        name = mpu_data.get('name', 'MPU6050') if mpu_data else 'MPU6050'
+        rows = [("", ""), (f" {name} (Motion Sensor)", ""), ("-" * 60, "")]
+        if mpu_data and mpu_data.get('available'):
+            accel = mpu_data['accel']
+            gyro = mpu_data['gyro']
+            rows.append(("  Accelerometer:", ""))
+            for axis in ('x', 'y', 'z'):
+                rows.append((f"    {axis.upper()}: ", f"{accel[axis]:7.2f} m/s²"))
+            rows.append(("  Gyroscope:", ""))
+            for axis in ('x', 'y', 'z'):
+                rows.append((f"    {axis.upper()}: ", f"{gyro[axis]:7.2f} °/s"))
+            rows.append(("  Temperature: ", f"{mpu_data['temp']:.1f} °C"))
+            rows.append(("  Motion Magnitude: ", f"{mpu_data['motion']:.2f}"))
+            if mpu_data.get('activity'):
+                rows.append(("  Activity: ", mpu_data['activity']))
+        else:
+            rows.append(("Not available", ""))
+        return rows
+
+    def stream_values(self, mpu_data, max_data, gps_data):
+        """Numeric fields for the CSV/binary stream, as (name, value or None)"""
+        values = []
+        if not isinstance(mpu_data, list):
+            mpu_data = [mpu_data] if mpu_data else []
+        for i, data in enumerate(mpu_data):
+            ok = data and data.get('available')
+            for group, keys in (('accel', ('ax', 'ay', 'az')), ('gyro', ('gx', 'gy', 'gz'))):
+                for axis, key in zip(('x', 'y', 'z'), keys):
+                    values.append((f"mpu{i}_{key}", data[group][axis] if ok else None))
+            values.append((f"mpu{i}_temp", data['temp'] if ok else None))
+            values.append((f"mpu{i}_motion", data['motion'] if ok else None))
+        ok = max_data and max_data.get('available')
+        values.append(("spo2", max_data['spo2'] if ok else None))
+        values.append(("heart_rate", max_data['heart_rate'] if ok else None))
+        if self.gps:
+            fix = gps_data and gps_data.get('available') and gps_data.get('has_fix')
+            values.append(("lat", gps_data['latitude'] if fix else None))
+            values.append(("lon", gps_data['longitude'] if fix else None))
+            values.append(("sats", gps_data['satellites'] if gps_data and gps_data.get('available') else None))
+        values.append(("loop_ms", self.loop_ms))
+        return values
+
+    def display_readings(self, mpu_data, max_data, gps_data):
+        """Write one refresh in the selected output mode; returns the bytes written"""
+        out = self.output
+        if isinstance(out, StreamWriter):
+            self.last_bytes = out.write(self.stream_values(mpu_data, max_data, gps_data))
+        else:
+            self.last_bytes = out.render(self.format_readings(mpu_data, max_data, gps_data))
+        return self.last_bytes
+
+    def set_output(self, mode):
+        """full: clear and reprint; diff: rewrite changed values only; csv/binary: stream for host tools"""
+        if mode == "full":
+            self.output = FullScreen()
+        elif mode == "csv":
+            self.output = StreamWriter()
+        elif mode == "binary":
+            self.output = StreamWriter(binary=True)
+        else:
+            self.output = DiffScreen()
+        self.output_mode = mode
 
-        print("\n" + "=" * 60)
-        print("Press Ctrl+C to stop monitoring")
-        print("=" * 60)
-    
     def run(self, interval=2):
         while True:
             try:
+                start = time.ticks_ms()
                 mpu_data = None
-                if self.mpu_sensor:
+                if self.mpu_devices:
+                    if self.classifiers:
+                        self.sample_activity()
+                    mpu_data = []
+                    for d in self.mpu_devices:
+                        self.registry.select(d)
+                        mpu_data.append(self.read_mpu(d.driver, d.name, self.classifiers.get(d.index)))
+                elif self.mpu_sensor:
                     if config.USE_MULTIPLEXER:
                         self.select_mux_channel(config.MPU6050_CHANNEL)
                     mpu_data = self.read_mpu(self.mpu_sensor, "MPU6050")
                 max_data = None
-                if self.max_sensor:
+                if self.max_device:
+                    self.registry.select(self.max_device)
+                    max_data = self.read_max()
+                elif self.max_sensor:
                     if config.USE_MULTIPLEXER:
                         self.select_mux_channel(config.MAX30102_CHANNEL)
                     max_data = self.read_max()
@@ -244,10 +415,13 @@ class SensorMonitor:
                 if self.gps:
                     gps_data = self.read_gps()
                 self.display_readings(mpu_data, max_data, gps_data)
+                self.loop_ms = time.ticks_diff(time.ticks_ms(), start)
                 gc.collect()
                 time.sleep(interval)
                 
             except KeyboardInterrupt:
+                if self.output_mode in ("csv", "binary"):
+                    break
                 print("\n\n Monitoring stopped by user")
                 break
             except Exception as e:
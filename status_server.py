@@ -0,0 +1,229 @@
+#on-device HTTP status endpoint: latest readings, GPS fix, alert queue and counters as cached JSON
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import json
+
+from clock import ticks_ms, ticks_diff
+
+_NOT_FOUND = b"HTTP/1.0 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+_BAD_REQUEST = b"HTTP/1.0 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+
+
+class LoopTiming:
+    """Lateness of a periodic loop against its schedule, in ms"""
+
+    def __init__(self, tolerance_ms=50):
+        self.tolerance_ms = tolerance_ms
+        self.count = 0
+        self.missed = 0
+        self.max_late = 0
+        self.total_late = 0
+
+    def record(self, late_ms):
+        if late_ms < 0:
+            late_ms = 0
+        self.count += 1
+        self.total_late += late_ms
+        if late_ms > self.max_late:
+            self.max_late = late_ms
+        if late_ms > self.tolerance_ms:
+            self.missed += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "missed": self.missed,
+            "max_late_ms": self.max_late,
+            "avg_late_ms": round(self.total_late / self.count, 1) if self.count else 0,
+        }
+
+
+class StatusServer:
+    """Serves GET /status as JSON built by snapshot().
+
+    The owner calls changed() whenever the data behind the snapshot moves on
+    (a new reading, an alert queued or sent). The full HTTP response is
+    serialized once per change and the same bytes are written to every
+    request until the next one, so polling costs a socket write, not a
+    json.dumps.
+    """
+
+    def __init__(self, snapshot, port=80, host="0.0.0.0", path="/status"):
+        self.snapshot = snapshot
+        self.port = port
+        self.host = host
+        self.path = path.encode()
+        self.version = 0
+        self._built = -1
+        self._response = b""
+        self.server = None
+
+        self.requests = 0
+        self.rebuilds = 0
+        self.errors = 0
+        self.bytes_sent = 0
+
+    def changed(self):
+        self.version += 1
+
+    def response(self):
+        if self._built != self.version:
+            body = json.dumps(self.snapshot()).encode()
+            self._response = (b"HTTP/1.0 200 OK\r\nContent-Type: application/json\r\n"
+                              b"Cache-Control: no-store\r\nConnection: close\r\n"
+                              b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            self._built = self.version
+            self.rebuilds += 1
+        return self._response
+
+    def counters(self):
+        return {"requests": self.requests, "rebuilds": self.rebuilds,
+                "errors": self.errors, "bytes_sent": self.bytes_sent}
+
+    async def handle(self, reader, writer):
+        try:
+            line = await reader.readline()
+            # skip the headers; the request has no body we care about
+            while True:
+                header = await reader.readline()
+                if not header or header == b"\r\n" or header == b"\n":
+                    break
+            parts = line.split()
+            if len(parts) < 2 or parts[0] != b"GET":
+                out = _BAD_REQUEST
+            elif parts[1] == self.path or parts[1].startswith(self.path + b"?"):
+                self.requests += 1
+                out = self.response()
+            else:
+                out = _NOT_FOUND
+            writer.write(out)
+            await writer.drain()
+            self.bytes_sent += len(out)
+        except OSError:
+            self.errors += 1
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (AttributeError, OSError):
+                pass
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        return self.server
+
+    def stop(self):
+        if self.server:
+            self.server.close()
+
+
+if __name__ == '__main__':
+    # A 100 Hz sampling loop run in 100 ms slices with a reading every second,
+    # sharing one event loop with this server, while a local load generator
+    # polls /status as fast as it can. Run once with the cached response and
+    # once rebuilding the JSON on every request.
+    import math
+    import random
+    import time
+    from multiprocessing import Process, Value
+
+    PERIOD_MS = 10
+    SLICE_MS = 100
+    READING_MS = 1000
+    RUN_S = 8
+
+    def imu_work():
+        # about what sample_imu does per sample on the host
+        s = 0.0
+        for i in range(40):
+            s += math.sqrt(i * 3.7)
+        return s
+
+    def poll(port, seconds, count):
+        async def client():
+            end = time.monotonic() + seconds
+            while time.monotonic() < end:
+                try:
+                    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                    writer.write(b"GET /status HTTP/1.1\r\nHost: collar\r\n\r\n")
+                    await writer.drain()
+                    await reader.read()
+                    writer.close()
+                    with count.get_lock():
+                        count.value += 1
+                except OSError:
+                    await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(*(client() for _ in range(16)))
+
+        asyncio.run(main())
+
+    async def run(cached):
+        state = {"ts": 0, "spo2": 97, "heart_rate": 90, "motion": 0.5,
+                 "history": [[random.randint(60, 140) for _ in range(4)] for _ in range(30)]}
+
+        def snapshot():
+            return {"reading": dict(state), "gps": {"fix": False, "satellites": 6},
+                    "alerts": {"pending": False, "last": 0},
+                    "loop": sample_timing.as_dict(), "reading_loop": reading_timing.as_dict(),
+                    "server": server.counters()}
+
+        server = StatusServer(snapshot, port=0, host="127.0.0.1")
+        if not cached:
+            server.response_cached = server.response
+
+            def rebuild():
+                server.changed()
+                return server.response_cached()
+            server.response = rebuild
+        srv = await server.start()
+        port = srv.sockets[0].getsockname()[1]
+        sample_timing = LoopTiming(tolerance_ms=PERIOD_MS)
+        reading_timing = LoopTiming(tolerance_ms=50)
+
+        count = Value("i", 0)
+        gen = Process(target=poll, args=(port, RUN_S, count))
+        gen.start()
+        await asyncio.sleep(0.5)
+
+        start = ticks_ms()
+        next_reading = start
+        next_sample = start
+        while ticks_diff(ticks_ms(), start) < (RUN_S - 1) * 1000:
+            now = ticks_ms()
+            reading_timing.record(ticks_diff(now, next_reading))
+            next_reading += READING_MS
+            state["ts"] += 1
+            state["heart_rate"] = 90 + random.randint(-3, 3)
+            server.changed()
+            # sample until the next reading, yielding to the server between slices
+            while ticks_diff(next_reading, ticks_ms()) > 0:
+                slice_end = min(next_reading, ticks_ms() + SLICE_MS)
+                while ticks_diff(slice_end, ticks_ms()) > 0:
+                    sample_timing.record(ticks_diff(ticks_ms(), next_sample))
+                    if ticks_diff(ticks_ms(), next_sample) > PERIOD_MS:
+                        next_sample = ticks_ms()
+                    imu_work()
+                    next_sample += PERIOD_MS
+                    wait = ticks_diff(next_sample, ticks_ms())
+                    if wait > 0:
+                        time.sleep(wait / 1000)
+                for _ in range(3):
+                    await asyncio.sleep(0)
+        await asyncio.get_running_loop().run_in_executor(None, gen.join)
+        server.stop()
+        return count.value, server, sample_timing, reading_timing
+
+    for cached in (True, False):
+        requests, server, sampling, reading = asyncio.run(run(cached))
+        s = sampling.as_dict()
+        r = reading.as_dict()
+        print(f"{'cached response' if cached else 'json per request'}: {server.requests:,} requests "
+              f"({server.requests / (RUN_S - 1.5):,.0f}/s), {server.rebuilds:,} rebuilds, "
+              f"{len(server._response):,} B/response")
+        print(f"   100 Hz samples: {s['missed']} of {s['count']:,} more than one period late, "
+              f"worst {s['max_late_ms']} ms; 1 s readings: worst {r['max_late_ms']} ms late")
@@ -0,0 +1,320 @@
+#batched binary telemetry: packs readings, GPS fixes and alerts into struct frames and uplinks them
+
+import struct
+import time
+
+try:
+    import deflate  # MicroPython >= 1.21
+except ImportError:
+    deflate = None
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+MAGIC = b'PW'
+VERSION = 1
+FLAG_COMPRESSED = 0x01
+
+FRAME_READING = 1
+FRAME_LOCATION = 2
+FRAME_ALERT = 3
+FRAME_HISTORY = 4
+
+# magic, version, flags, device id, sequence, frame count
+HEADER = "<2sBBIHH"
+HEADER_SIZE = struct.calcsize(HEADER)
+
+# type, ts, spo2, heart rate, motion (cm/s^2), activity, rmssd (0.1 ms, 0 = none)
+READING = "<BIBHHBH"
+# type, ts, lat (1e-7 deg), lon (1e-7 deg), altitude (m), satellites
+LOCATION = "<BIiihB"
+# type, ts, abnormal count, issue mask, fired rule mask
+ALERT = "<BIBHH"
+# type, ts, payload length; followed by history.History.export() bytes
+HISTORY = "<BIH"
+
+FRAME_FORMATS = {
+    FRAME_READING: READING,
+    FRAME_LOCATION: LOCATION,
+    FRAME_ALERT: ALERT,
+    FRAME_HISTORY: HISTORY,
+}
+FRAME_SIZES = {}
+for _kind, _fmt in FRAME_FORMATS.items():
+    FRAME_SIZES[_kind] = struct.calcsize(_fmt)
+
+
+def _clamp(value, lo, hi):
+    return lo if value < lo else hi if value > hi else value
+
+
+def compress(data):
+    if zlib and hasattr(zlib, "compress"):
+        return zlib.compress(data)
+    if deflate:
+        import io
+        out = io.BytesIO()
+        with deflate.DeflateIO(out, deflate.ZLIB) as f:
+            f.write(data)
+        return out.getvalue()
+    return None
+
+
+def decode_batch(data):
+    """Decode one uplinked batch.
+
+    Returns (header dict, list of (frame type, tuple of fields)). Frames are
+    unpacked straight out of a memoryview, without slicing copies; a history
+    frame's fields end with its payload bytes.
+    """
+    magic, version, flags, device_id, seq, count = struct.unpack_from(HEADER, data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a telemetry batch")
+    body = memoryview(data)[HEADER_SIZE:]
+    if flags & FLAG_COMPRESSED:
+        body = memoryview(zlib.decompress(body))
+    frames = []
+    pos = 0
+    for _ in range(count):
+        kind = body[pos]
+        fmt = FRAME_FORMATS[kind]
+        fields = struct.unpack_from(fmt, body, pos)
+        pos += FRAME_SIZES[kind]
+        if kind == FRAME_HISTORY:
+            fields += (bytes(body[pos:pos + fields[2]]),)
+            pos += fields[2]
+        frames.append((kind, fields))
+    header = {'device_id': device_id, 'seq': seq, 'count': count, 'flags': flags}
+    return header, frames
+
+
+class HttpTransport:
+
+    def __init__(self, url):
+        self.url = url
+
+    def send(self, payload):
+        try:
+            import urequests
+        except ImportError:
+            urequests = None
+        headers = {"Content-Type": "application/octet-stream"}
+        if urequests:
+            response = urequests.post(self.url, data=payload, headers=headers)
+            ok = 200 <= response.status_code < 300
+            response.close()
+            return ok
+        import urllib.request
+        request = urllib.request.Request(self.url, data=bytes(payload), headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return 200 <= response.status < 300
+
+
+class MqttTransport:
+
+    def __init__(self, broker, topic, client_id, port=1883):
+        self.broker = broker
+        self.topic = topic
+        self.client_id = client_id
+        self.port = port
+        self.client = None
+
+    def send(self, payload):
+        if self.client is None:
+            from umqtt.simple import MQTTClient
+            self.client = MQTTClient(self.client_id, self.broker, port=self.port)
+            self.client.connect()
+        try:
+            self.client.publish(self.topic, payload)
+            return True
+        except OSError:
+            try:
+                self.client.disconnect()
+            except OSError:
+                pass
+            self.client = None
+            raise
+
+
+class TelemetryBuffer:
+    """Fixed-size frame buffer that is flushed as one batch.
+
+    Frames are packed into a preallocated bytearray, so buffering a reading
+    does not allocate. A batch goes out when the interval has elapsed or the
+    buffer is three-quarters full; if the uplink is down the frames are kept
+    and new ones are dropped (and counted) once the buffer is full.
+    """
+
+    def __init__(self, device_id, transport, capacity=2048, interval=60, compress=False):
+        self.device_id = device_id
+        self.transport = transport
+        self.interval = interval
+        self.compress = compress
+        self.buf = bytearray(HEADER_SIZE + capacity)
+        self.capacity = capacity
+        self.pos = HEADER_SIZE
+        self.count = 0
+        self.seq = 0
+        self.last_flush = time.time()
+        self.sent_batches = 0
+        self.sent_bytes = 0
+        self.dropped = 0
+
+    def _reserve(self, kind):
+        size = FRAME_SIZES[kind]
+        if self.pos + size > len(self.buf):
+            self.dropped += 1
+            return -1
+        pos = self.pos
+        self.pos += size
+        self.count += 1
+        return pos
+
+    def add_reading(self, ts, spo2, heart_rate, motion, activity=0, rmssd=None):
+        pos = self._reserve(FRAME_READING)
+        if pos < 0:
+            return False
+        struct.pack_into(READING, self.buf, pos, FRAME_READING, int(ts),
+                         _clamp(int(spo2), 0, 255),
+                         _clamp(int(heart_rate), 0, 65535),
+                         _clamp(int(motion * 100), 0, 65535),
+                         activity,
+                         0 if rmssd is None else _clamp(int(rmssd * 10), 1, 65535))
+        return True
+
+    def add_location(self, ts, location):
+        pos = self._reserve(FRAME_LOCATION)
+        if pos < 0:
+            return False
+        struct.pack_into(LOCATION, self.buf, pos, FRAME_LOCATION, int(ts),
+                         int(location['latitude'] * 10000000),
+                         int(location['longitude'] * 10000000),
+                         _clamp(int(location.get('altitude') or 0), -32768, 32767),
+                         _clamp(location.get('satellites') or 0, 0, 255))
+        return True
+
+    def add_alert(self, ts, abnormal_count, issue_mask, rule_mask=0):
+        pos = self._reserve(FRAME_ALERT)
+        if pos < 0:
+            return False
+        struct.pack_into(ALERT, self.buf, pos, FRAME_ALERT, int(ts),
+                         _clamp(abnormal_count, 0, 255), issue_mask & 0xFFFF, rule_mask & 0xFFFF)
+        return True
+
+    def add_history(self, ts, data):
+        """Append an encoded history export (see history.History.export)"""
+        size = FRAME_SIZES[FRAME_HISTORY] + len(data)
+        if self.pos + size > len(self.buf) or len(data) > 65535:
+            self.dropped += 1
+            return False
+        pos = self.pos
+        struct.pack_into(HISTORY, self.buf, pos, FRAME_HISTORY, int(ts), len(data))
+        pos += FRAME_SIZES[FRAME_HISTORY]
+        self.buf[pos:pos + len(data)] = data
+        self.pos = pos + len(data)
+        self.count += 1
+        return True
+
+    @property
+    def nearly_full(self):
+        return self.pos - HEADER_SIZE >= self.capacity * 3 // 4
+
+    def due(self):
+        if not self.count:
+            return False
+        if self.nearly_full:
+            return True
+        return time.time() - self.last_flush >= self.interval
+
+    def poll(self):
+        if self.due():
+            return self.flush()
+        return False
+
+    def flush(self):
+        if not self.count:
+            return True
+        flags = 0
+        body = memoryview(self.buf)[HEADER_SIZE:self.pos]
+        if self.compress:
+            packed = compress(body)
+            if packed is not None and len(packed) < len(body):
+                body = packed
+                flags |= FLAG_COMPRESSED
+        header = struct.pack(HEADER, MAGIC, VERSION, flags, self.device_id, self.seq, self.count)
+        if flags:
+            payload = header + body
+        else:
+            self.buf[:HEADER_SIZE] = header
+            payload = memoryview(self.buf)[:self.pos]
+
+        self.last_flush = time.time()
+        try:
+            ok = self.transport.send(payload)
+        except Exception as e:
+            print(f" Telemetry upload failed: {e}")
+            ok = False
+        if not ok:
+            return False
+
+        self.sent_batches += 1
+        self.sent_bytes += len(payload)
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.pos = HEADER_SIZE
+        self.count = 0
+        return True
+
+
+if __name__ == '__main__':
+    # Round trip against a local HTTP stand-in on CPython.
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            received.append(body)
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/telemetry"
+
+    for use_compression in (False, True):
+        received.clear()
+        tb = TelemetryBuffer(42, HttpTransport(url), capacity=2048, interval=60, compress=use_compression)
+        readings = 0
+        for i in range(600):
+            tb.add_reading(1000 + 3 * i, 97, 80 + i % 7, 0.4 + (i % 5) / 10, 1, 31.4)
+            readings += 1
+            if i % 20 == 0:
+                tb.add_location(1000 + 3 * i, {'latitude': 12.9716, 'longitude': 77.5946,
+                                               'altitude': 920, 'satellites': 9})
+            if i == 300:
+                tb.add_alert(1900, 2, 0x05, 0x1)
+                tb.add_history(1900, bytes(range(40)))
+            tb.poll()
+        tb.flush()
+
+        decoded = 0
+        alerts = 0
+        history = []
+        for batch in received:
+            header, frames = decode_batch(batch)
+            assert header['device_id'] == 42
+            decoded += sum(1 for kind, _ in frames if kind == FRAME_READING)
+            alerts += sum(1 for kind, _ in frames if kind == FRAME_ALERT)
+            history += [f[-1] for kind, f in frames if kind == FRAME_HISTORY]
+        assert decoded == readings and alerts == 1 and history == [bytes(range(40))]
+        label = "compressed" if use_compression else "raw"
+        print(f"{label:>10}: {readings} readings in {tb.sent_batches} batches, "
+              f"{tb.sent_bytes} bytes ({tb.sent_bytes / readings:.1f} B/reading), dropped {tb.dropped}")
+    server.shutdown()
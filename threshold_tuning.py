@@ -0,0 +1,587 @@
+#offline threshold tuning (CPython host, NumPy): replay recorded readings through the static health rules,
+#the window alert rules and the alert cooldown for every combination of a threshold grid
+#
+#   python threshold_tuning.py --store /data/fleet --incidents incidents.json --grid grid.json
+#   python threshold_tuning.py --pets 4 --days 365
+
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import config
+from health_window import _OPS
+
+# swept thresholds; the first five are the analyze_health component thresholds
+GRID_KEYS = ("spo2_min", "heart_rate_min", "heart_rate_max", "motion_min", "motion_max", "abnormal_count")
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+# ALERT_RULES thresholds that are really one of the swept config values
+_RULE_KEYS = {
+    ("spo2", "SPO2_MIN_THRESHOLD"): "spo2_min",
+    ("heart_rate", "HEART_RATE_MIN"): "heart_rate_min",
+    ("heart_rate", "HEART_RATE_MAX"): "heart_rate_max",
+    ("motion", "MOTION_MIN_THRESHOLD"): "motion_min",
+    ("motion", "MOTION_MAX_THRESHOLD"): "motion_max",
+    ("abnormal", "ABNORMAL_COUNT_THRESHOLD"): "abnormal_count",
+}
+
+
+def default_grid():
+    """Every swept threshold at its config value"""
+    return {
+        "spo2_min": [config.SPO2_MIN_THRESHOLD],
+        "heart_rate_min": [config.HEART_RATE_MIN],
+        "heart_rate_max": [config.HEART_RATE_MAX],
+        "motion_min": [config.MOTION_MIN_THRESHOLD],
+        "motion_max": [config.MOTION_MAX_THRESHOLD],
+        "abnormal_count": [config.ABNORMAL_COUNT_THRESHOLD],
+    }
+
+
+def rule_keys(rules=None):
+    """For each alert rule, the grid key its threshold follows, or None when it is fixed"""
+    keys = []
+    for metric, op, threshold, duration, window in (rules or config.ALERT_RULES):
+        key = None
+        for (m, name), k in _RULE_KEYS.items():
+            if m == metric and getattr(config, name) == threshold:
+                key = k
+        keys.append(key)
+    return keys
+
+
+def alert_rules(t, rules=None):
+    """config.ALERT_RULES with the thresholds of combination t substituted"""
+    rules = rules or config.ALERT_RULES
+    return [(metric, op, threshold if key is None else t[key], duration, window)
+            for (metric, op, threshold, duration, window), key in zip(rules, rule_keys(rules))]
+
+
+def load_store(path, t0=0, t1=2 ** 62):
+    """Raw readings of every pet from a ts_store.TimeSeriesStore, as column arrays"""
+    from ts_store import TimeSeriesStore
+    store = TimeSeriesStore(path)
+    return store.raw.select({"ts": (t0, t1)}, ("pet_id", "ts", "spo2", "heart_rate", "motion"))
+
+
+def load_incidents(path):
+    """Labelled incidents: a JSON list of {"pet_id", "start", "end"} (epoch seconds)"""
+    with open(path) as f:
+        rows = json.load(f)
+    return (np.array([r["pet_id"] for r in rows], dtype=np.int64),
+            np.array([r["start"] for r in rows], dtype=np.int64),
+            np.array([r["end"] for r in rows], dtype=np.int64))
+
+
+def _bins(values, grid, missing):
+    """Position of each value among the sorted grid thresholds.
+
+    With lo = count of thresholds <= value and hi = count < value:
+    value < grid[j] <=> j >= lo, value > grid[j] <=> j < hi.
+    """
+    lo = np.searchsorted(grid, values, "right").astype(np.uint16)
+    hi = np.searchsorted(grid, values, "left").astype(np.uint16)
+    lo[missing] = len(grid)     # never below a threshold
+    hi[missing] = 0             # never above one
+    return lo, hi
+
+
+class Replay:
+    """Recorded readings prepared for a threshold grid.
+
+    Rows are ordered by (pet, ts) and each pet is one continuous stream, as
+    on the fleet server. Only readings that some combination can flag are
+    visited per combination: the rest have an abnormal count of 0 under
+    every combination. Each of them carries a code for where its values sit
+    among the grid thresholds, so a combination's abnormal counts are one
+    table lookup per row, and a rule's firing is a set of row intervals
+    worked out from the flagged rows alone.
+
+    The rules are the static ones (fleet_analysis.analyze_batch, i.e.
+    analyze_health without a baseline); rules on metrics that are not
+    recorded (posture) are left out.
+    """
+
+    def __init__(self, data, grid, incidents=None, rules=None, cooldown=None, grace=None, rmssd_min=None):
+        self.grid = {k: np.array(sorted(grid[k]), dtype=np.float64) for k in GRID_KEYS}
+        self.cooldown = config.ALERT_COOLDOWN if cooldown is None else cooldown
+        rules = rules or config.ALERT_RULES
+        interval = config.SENSOR_READ_INTERVAL
+        rmssd_min = config.HRV_RMSSD_MIN if rmssd_min is None else rmssd_min
+
+        pet = np.asarray(data["pet_id"])
+        ts = np.asarray(data["ts"], dtype=np.int64)
+        ordered = np.all((pet[1:] > pet[:-1]) | ((pet[1:] == pet[:-1]) & (ts[1:] >= ts[:-1])))
+        # already in (pet, ts) order, as simulate_fleet and most stores give it
+        order = slice(None) if ordered else np.lexsort((ts, pet))
+        pet = pet[order]
+        ts = ts[order]
+        spo2 = np.asarray(data["spo2"])[order]
+        hr = np.asarray(data["heart_rate"])[order]
+        # float64 like the scalar path: a float32 compare would round the thresholds
+        motion = np.asarray(data["motion"], dtype=np.float64)[order]
+        rmssd = data.get("rmssd")
+        if rmssd is not None:
+            rmssd = np.asarray(rmssd, dtype=np.float64)[order]
+        n = len(ts)
+        self.rows = n
+
+        self.pets, first = np.unique(pet, return_index=True)
+        bounds = np.append(first, n)
+        self.pet_days = float(np.sum(ts[bounds[1:] - 1] - ts[first] + interval)) / 86400
+        # one int64 timeline for the whole fleet; pets sit far enough apart
+        # that the cooldown never carries from one to the next
+        t0 = int(ts.min()) if n else 0
+        self.stride = int(ts.max() - t0 + self.cooldown + 1) if n else 1
+
+        # where each reading sits among the thresholds of every component, as one code
+        g = self.grid
+        self.radix = (len(g["spo2_min"]) + 1, len(g["heart_rate_min"]) + 1, len(g["heart_rate_max"]) + 1,
+                      len(g["motion_min"]) + 1, len(g["motion_max"]) + 1, 2)
+        if np.prod(self.radix) > 65536:
+            raise ValueError("threshold grid too fine: more than 65536 row codes")
+        valid = {"spo2": spo2 > 0, "heart_rate": hr > 0, "motion": ~np.isnan(motion)}
+        values = {"spo2": spo2, "heart_rate": hr, "motion": motion}
+        if rmssd is not None:
+            valid["rmssd"] = ~np.isnan(rmssd)
+            values["rmssd"] = rmssd
+        code, _ = _bins(spo2, g["spo2_min"], ~valid["spo2"])
+        for part, r in ((_bins(hr, g["heart_rate_min"], ~valid["heart_rate"])[0], self.radix[1]),
+                        (_bins(hr, g["heart_rate_max"], ~valid["heart_rate"])[1], self.radix[2]),
+                        (_bins(motion, g["motion_min"], ~valid["motion"])[0], self.radix[3]),
+                        (_bins(motion, g["motion_max"], ~valid["motion"])[1], self.radix[4])):
+            code *= np.uint16(r)
+            code += part
+        code *= np.uint16(2)
+        if rmssd is not None:
+            code += rmssd < rmssd_min
+
+        # rows some combination can flag: any component under its loosest threshold,
+        # plus whatever the value rules flag at any of their thresholds
+        self.rules = []
+        self.dropped = []
+        loose = self._lut_count(tuple(0 if k in ("heart_rate_max", "motion_max") else len(g[k]) - 1
+                                      for k in GRID_KEYS[:5]))
+        candidate = loose[code] > 0
+        for (metric, op, threshold, duration, window), gkey in zip(rules, rule_keys(rules)):
+            if metric != "abnormal" and metric not in values:
+                self.dropped.append(f"{metric} {op} {threshold}")
+                continue
+            slots = max(1, int(window / interval + 0.5))
+            need = min(max(int(duration / interval + 0.5), 1), slots)
+            test = _OPS[op]
+            for v in (g[gkey] if gkey else [threshold]):
+                if metric == "abnormal":
+                    if test(0, v):
+                        candidate[:] = True
+                else:
+                    candidate |= valid[metric] & test(values[metric], v)
+            self.rules.append((metric, op, threshold, gkey, slots, need))
+
+        # only flagged readings are visited per combination; the rows between
+        # them are covered by the rule windows as intervals
+        rows = np.flatnonzero(candidate)
+        del candidate
+        self.kept = len(rows)
+        self.rows_at = rows
+        self.code = code[rows]
+        pet_of = np.searchsorted(first, rows, "right") - 1
+        self.seg_start = first[pet_of]
+        self.seg_end = bounds[pet_of + 1]
+        self.key = np.repeat(np.arange(len(first), dtype=np.int64) * self.stride, np.diff(bounds))
+        self.key += ts
+        self.key -= t0
+        # value-rule flags per threshold, shared by every combination
+        self._value_flags = {}
+        for metric, op, threshold, gkey, slots, need in self.rules:
+            if metric != "abnormal":
+                for v in (g[gkey] if gkey else [threshold]):
+                    self._value_flags[(metric, op, float(v))] = (valid[metric][rows]
+                                                                 & _OPS[op](values[metric][rows], v))
+
+        self.incidents = None
+        if incidents is not None:
+            inc_pet, inc_start, inc_end = (np.asarray(a, dtype=np.int64) for a in incidents)
+            rank = np.searchsorted(self.pets, inc_pet)
+            known = (rank < len(self.pets)) & (self.pets[np.minimum(rank, len(self.pets) - 1)] == inc_pet)
+            rank = rank[known]
+            start = rank * self.stride + (inc_start[known] - t0)
+            # window rules need their duration before they fire
+            if grace is None:
+                grace = max([r[4] for r in self.rules] or [1]) * interval
+            end = rank * self.stride + (inc_end[known] - t0) + grace
+            order = np.argsort(start)
+            self.incidents = (start[order], end[order])
+        self._last = {}
+        self._count = (None, None)
+
+    def _lut_count(self, j):
+        """Abnormal count for every row code under the component thresholds at grid positions j"""
+        js, jhmin, jhmax, jmmin, jmmax = j
+        r = self.radix
+        codes = np.arange(int(np.prod(r)))
+        hrv = codes % 2
+        codes //= 2
+        mmax_hi = codes % r[4]
+        codes //= r[4]
+        mmin_lo = codes % r[3]
+        codes //= r[3]
+        hmax_hi = codes % r[2]
+        codes //= r[2]
+        hmin_lo = codes % r[1]
+        s_lo = codes // r[1]
+        low_hr = jhmin >= hmin_lo
+        low_mo = jmmin >= mmin_lo
+        count = ((js >= s_lo).astype(np.uint8) + low_hr + (~low_hr & (jhmax < hmax_hi))
+                 + low_mo + (~low_mo & (jmmax < mmax_hi)) + hrv)
+        return count.astype(np.uint8)
+
+    def combinations(self):
+        """Grid positions of every combination, abnormal_count varying fastest"""
+        return list(itertools.product(*(range(len(self.grid[k])) for k in GRID_KEYS)))
+
+    def thresholds(self, combo):
+        return {k: self.grid[k][j].item() for k, j in zip(GRID_KEYS, combo)}
+
+    def _fired(self, flags, slots, need):
+        """Row ranges [start, end] where a rule holds, from the flags of the candidate rows.
+
+        A rule holds from the flagged row that brings `need` flags into its
+        window until the oldest of those leaves it (or the pet's stream ends).
+        """
+        pos = np.flatnonzero(flags)
+        if len(pos) < need:
+            return _EMPTY, _EMPTY
+        rows = self.rows_at[pos]
+        back = rows[:len(rows) - need + 1]
+        rows = rows[need - 1:]
+        pos = pos[need - 1:]
+        ok = (rows - back < slots) & (back >= self.seg_start[pos])
+        end = np.minimum(back[ok] + (slots - 1), self.seg_end[pos[ok]] - 1)
+        return rows[ok], end
+
+    def alerts(self, combo):
+        """Timeline keys of the alerts one combination sends"""
+        t = self.thresholds(combo)
+        starts = []
+        ends = []
+        for i, (metric, op, threshold, gkey, slots, need) in enumerate(self.rules):
+            v = t[gkey] if gkey else threshold
+            # abnormal counts only depend on the first five keys; value rules on their threshold
+            memo_key = (combo[:5], v) if metric == "abnormal" else float(v)
+            last = self._last.get(i)
+            if last and last[0] == memo_key:
+                hit = last[1]
+            else:
+                if metric == "abnormal":
+                    if self._count[0] != combo[:5]:
+                        self._count = (combo[:5], self._lut_count(combo[:5])[self.code])
+                    flags = _OPS[op](self._count[1], v)
+                else:
+                    flags = self._value_flags[(metric, op, float(v))]
+                hit = self._fired(flags, slots, need)
+                self._last[i] = (memo_key, hit)
+            starts.append(hit[0])
+            ends.append(hit[1])
+        start, end = merge_intervals(np.concatenate(starts), np.concatenate(ends))
+        return self.key[cooldown_filter(start, end, self.key, self.cooldown)]
+
+    def evaluate(self, combo):
+        """Alert count, detection rate and time-to-alert for one combination"""
+        keys = self.alerts(combo)
+        out = {"thresholds": self.thresholds(combo), "alerts": len(keys),
+               "alerts_per_pet_day": len(keys) / self.pet_days if self.pet_days else 0.0}
+        if self.incidents is not None:
+            start, end = self.incidents
+            out.update(score_alerts(keys, start, end))
+            out["false_per_pet_day"] = out["false_alerts"] / self.pet_days if self.pet_days else 0.0
+        return out
+
+
+def merge_intervals(start, end):
+    """Union of row ranges [start, end], sorted and non-overlapping"""
+    if len(start) == 0:
+        return start, end
+    order = np.argsort(start, kind="stable")
+    start = start[order]
+    reach = np.maximum.accumulate(end[order])
+    new = start[1:] > reach[:-1]
+    return start[np.concatenate(([True], new))], reach[np.concatenate((new, [True]))]
+
+
+def cooldown_filter(start, end, key, cooldown):
+    """Rows that send an alert: the first fired row, then the first fired row
+    at least `cooldown` after the last one sent, as the collar and server do"""
+    sent = []
+    j = 0
+    n = len(start)
+    row = start[0] if n else 0
+    while j < n:
+        row = max(row, start[j])
+        sent.append(row)
+        row = int(np.searchsorted(key, key[row] + cooldown, "left"))
+        j = int(np.searchsorted(end, row, "left"))
+    return np.array(sent, dtype=np.int64)
+
+
+def score_alerts(keys, start, end):
+    """Match alerts to labelled incidents [start, end]; time-to-alert is from the incident start"""
+    if len(start) == 0:
+        return {"incidents": 0, "detected": 0, "detection_rate": None, "false_alerts": len(keys),
+                "tta_median_s": None, "tta_p90_s": None}
+    idx = np.searchsorted(start, keys, "right") - 1
+    inside = (idx >= 0) & (keys <= end[np.maximum(idx, 0)])
+    hit, first = np.unique(idx[inside], return_index=True)
+    tta = keys[inside][first] - start[hit]
+    return {
+        "incidents": len(start),
+        "detected": len(hit),
+        "detection_rate": len(hit) / len(start),
+        "false_alerts": int(np.count_nonzero(~inside)),
+        "tta_median_s": float(np.median(tta)) if len(tta) else None,
+        "tta_p90_s": float(np.percentile(tta, 90)) if len(tta) else None,
+    }
+
+
+_replay = None
+
+
+def _init_worker(replay):
+    global _replay
+    _replay = replay
+
+
+def _evaluate_chunk(combos):
+    return [_replay.evaluate(c) for c in combos]
+
+
+def sweep(replay, workers=None, chunks_per_worker=4):
+    """Evaluate every combination of the grid across a process pool, in grid order"""
+    combos = replay.combinations()
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        return [replay.evaluate(c) for c in combos]
+    # contiguous chunks keep combinations that share a rule result on one worker
+    size = max(1, -(-len(combos) // (workers * chunks_per_worker)))
+    parts = [combos[i:i + size] for i in range(0, len(combos), size)]
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(replay,)) as pool:
+        return [r for part in pool.map(_evaluate_chunk, parts) for r in part]
+
+
+def rank(results, min_detection=0.0):
+    """Best first: most incidents caught, then fewest false alerts, then fastest"""
+    def score(r):
+        rate = r.get("detection_rate") or 0.0
+        return (rate < min_detection, -rate, r.get("false_alerts", r["alerts"]), r.get("tta_median_s") or 0)
+    return sorted(results, key=score)
+
+
+def format_row(r):
+    t = r["thresholds"]
+    text = (f"SpO2<{t['spo2_min']:g} HR<{t['heart_rate_min']:g}/>{t['heart_rate_max']:g} "
+            f"motion<{t['motion_min']:g}/>{t['motion_max']:g} abnormal>={t['abnormal_count']:g}")
+    text = f"{text:62} alerts {r['alerts']:6}"
+    if "detection_rate" in r and r["detection_rate"] is not None:
+        tta = "-" if r["tta_median_s"] is None else f"{r['tta_median_s']:.0f}/{r['tta_p90_s']:.0f} s"
+        text += (f"  detected {r['detected']:4}/{r['incidents']:<4} ({r['detection_rate'] * 100:5.1f}%)"
+                 f"  false/pet-day {r['false_per_pet_day']:6.3f}  time-to-alert p50/p90 {tta}")
+    return text
+
+
+def simulate_fleet(pets, days, seed=1, incidents_per_year=10):
+    """A synthetic fleet with labelled incidents: (data, (pet, start, end))"""
+    rng = np.random.default_rng(seed)
+    interval = config.SENSOR_READ_INTERVAL
+    n = int(days * 86400 / interval)
+    t0 = 1767225600    # 2026-01-01
+    parts = {k: [] for k in ("pet_id", "ts", "spo2", "heart_rate", "motion")}
+    inc_pet, inc_start, inc_end = [], [], []
+    block = 600 // interval
+    for p in range(pets):
+        pet_id = 100 + p
+        ts = t0 + interval * np.arange(n, dtype=np.int64)
+        hour = (ts % 86400) / 3600
+        # 10-minute activity blocks: 0 sleep, 1 rest, 2 active
+        nb = -(-n // block)
+        night = ((np.arange(nb) * block * interval / 3600) % 24 < 6) | ((np.arange(nb) * block * interval / 3600) % 24 >= 22)
+        state = np.where(night, np.where(rng.random(nb) < 0.85, 0, 1),
+                         rng.choice(3, nb, p=(0.25, 0.55, 0.2)))
+        state = np.repeat(state, block)[:n]
+        base_hr = rng.uniform(62, 115)     # giant breeds to terriers
+        hr = base_hr + np.array((-10.0, 0.0, 70.0))[state] + 4 * np.sin(hour / 24 * 2 * np.pi) + rng.normal(0, 6, n)
+        motion = rng.gamma(2.0, np.array((0.03, 0.25, 2.8))[state])
+        spo2 = np.round(rng.normal(96.8, 1.1, n))
+        # short glitches: a bad PPG contact, a shake
+        glitch = rng.random(n) < 0.004
+        hr[glitch] = rng.uniform(30, 240, glitch.sum())
+        spo2[rng.random(n) < 0.003] -= rng.integers(5, 12)
+
+        count = rng.poisson(incidents_per_year * days / 365)
+        for _ in range(count):
+            kind = rng.integers(3)
+            length = int(rng.uniform(120, 1200) / interval)
+            s = int(rng.integers(0, n - length))
+            e = s + length
+            on = rng.random(length) < 0.85    # the sensors do not see every reading of it
+            if kind == 0:       # desaturation
+                spo2[s:e][on] = np.round(rng.normal(86.5, 1.5, on.sum()))
+            elif kind == 1:     # collapse: racing heart, no movement
+                hr[s:e][on] = rng.uniform(185, 230, on.sum())
+                motion[s:e] = rng.gamma(2.0, 0.004, length)
+            else:               # bradycardia at rest
+                hr[s:e][on] = rng.uniform(38, 52, on.sum())
+                motion[s:e] = rng.gamma(2.0, 0.2, length)
+            inc_pet.append(pet_id)
+            inc_start.append(int(ts[s]))
+            inc_end.append(int(ts[e - 1]))
+
+        spo2 = np.clip(spo2, 70, 100)
+        spo2[rng.random(n) < 0.03] = 0        # no PPG reading
+        hr = np.clip(np.round(hr), 0, 300)
+        hr[rng.random(n) < 0.03] = 0
+        parts["pet_id"].append(np.full(n, pet_id, dtype=np.uint32))
+        parts["ts"].append(ts)
+        parts["spo2"].append(spo2.astype(np.uint8))
+        parts["heart_rate"].append(hr.astype(np.uint16))
+        parts["motion"].append(motion.astype(np.float32))
+    data = {k: np.concatenate(v) for k, v in parts.items()}
+    return data, (np.array(inc_pet), np.array(inc_start), np.array(inc_end))
+
+
+def scalar_alerts(data, t, cooldown=None):
+    """Reference: the collar/server path (analyze_health, WindowEvaluator, cooldown) one reading at a time"""
+    from health_rules import analyze_health
+    from health_window import WindowEvaluator
+
+    cooldown = config.ALERT_COOLDOWN if cooldown is None else cooldown
+    saved = {}
+    names = {"spo2_min": "SPO2_MIN_THRESHOLD", "heart_rate_min": "HEART_RATE_MIN",
+             "heart_rate_max": "HEART_RATE_MAX", "motion_min": "MOTION_MIN_THRESHOLD",
+             "motion_max": "MOTION_MAX_THRESHOLD"}
+    for k, name in names.items():
+        saved[name] = getattr(config, name)
+        setattr(config, name, t[k])
+    try:
+        rules = [r for r in alert_rules(t) if r[0] in ("spo2", "heart_rate", "motion", "abnormal")]
+        order = np.lexsort((data["ts"], data["pet_id"]))
+        sent = []
+        pet = None
+        for i in order:
+            p = int(data["pet_id"][i])
+            if p != pet:
+                pet = p
+                window = WindowEvaluator(rules, config.SENSOR_READ_INTERVAL)
+                last = None
+            ts = int(data["ts"][i])
+            spo2 = int(data["spo2"][i])
+            hr = int(data["heart_rate"][i])
+            motion = float(data["motion"][i])
+            count, _, _ = analyze_health(spo2, hr, motion)
+            fired = window.update({"spo2": spo2 if spo2 > 0 else None,
+                                   "heart_rate": hr if hr > 0 else None,
+                                   "motion": motion, "abnormal": count})
+            if fired and (last is None or ts - last >= cooldown):
+                last = ts
+                sent.append((p, ts))
+        return sent
+    finally:
+        for name, v in saved.items():
+            setattr(config, name, v)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Sweep health thresholds over recorded readings")
+    parser.add_argument("--store", help="ts_store directory of recorded readings (default: a simulated fleet)")
+    parser.add_argument("--incidents", help="JSON list of labelled incidents {pet_id, start, end}")
+    parser.add_argument("--grid", help="JSON map of threshold name -> values (missing names stay at config)")
+    parser.add_argument("--pets", type=int, default=4, help="simulated pets")
+    parser.add_argument("--days", type=int, default=365, help="simulated days per pet")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--min-detection", type=float, default=0.9)
+    parser.add_argument("--csv", help="write every combination's results here")
+    parser.add_argument("--no-check", action="store_true", help="skip the scalar cross-check")
+    args = parser.parse_args()
+
+    grid = default_grid()
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    elif not args.store:
+        grid.update({"spo2_min": [86, 88, 90, 92], "heart_rate_min": [45, 50, 55, 60],
+                     "heart_rate_max": [180, 200, 220], "motion_min": [0.005, 0.01, 0.02],
+                     "motion_max": [15.0, 20.0, 25.0], "abnormal_count": [2, 3]})
+
+    start = time.perf_counter()
+    if args.store:
+        data = load_store(args.store)
+        incidents = load_incidents(args.incidents) if args.incidents else None
+        source = args.store
+    else:
+        data, incidents = simulate_fleet(args.pets, args.days)
+        source = f"simulated fleet, {args.pets} pets x {args.days} days"
+    loaded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    replay = Replay(data, grid, incidents)
+    prepared = time.perf_counter() - start
+    combos = replay.combinations()
+    print(f"{source}: {replay.rows:,} readings, {replay.pet_days:,.0f} pet-days, "
+          f"{0 if replay.incidents is None else len(replay.incidents[0])} labelled incidents")
+    print(f"Loaded in {loaded:.1f} s, prepared in {prepared:.1f} s: {replay.kept:,} readings "
+          f"({replay.kept * 100 / max(1, replay.rows):.1f}%) can flag under some combination")
+    if replay.dropped:
+        print(f"Rules on unrecorded metrics left out: {', '.join(replay.dropped)}")
+
+    start = time.perf_counter()
+    results = sweep(replay, args.workers)
+    swept = time.perf_counter() - start
+    workers = args.workers or os.cpu_count() or 1
+    print(f"Swept {len(combos):,} combinations in {swept:.1f} s on {workers} worker(s): "
+          f"{replay.rows * len(combos) / swept / 1e9:,.2f} billion reading-combinations/s")
+
+    current = {k: grid[k][0] for k in GRID_KEYS}
+    current.update({"spo2_min": config.SPO2_MIN_THRESHOLD, "heart_rate_min": config.HEART_RATE_MIN,
+                    "heart_rate_max": config.HEART_RATE_MAX, "motion_min": config.MOTION_MIN_THRESHOLD,
+                    "motion_max": config.MOTION_MAX_THRESHOLD,
+                    "abnormal_count": config.ABNORMAL_COUNT_THRESHOLD})
+    for r in results:
+        if r["thresholds"] == {k: float(v) for k, v in current.items()}:
+            print(f"\nconfig.py:\n   {format_row(r)}")
+    print(f"\nBest {args.top} (detection >= {args.min_detection * 100:.0f}% first):")
+    for r in rank(results, args.min_detection)[:args.top]:
+        print(f"   {format_row(r)}")
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            cols = list(GRID_KEYS) + ["alerts", "alerts_per_pet_day", "incidents", "detected",
+                                      "detection_rate", "false_alerts", "false_per_pet_day",
+                                      "tta_median_s", "tta_p90_s"]
+            f.write(",".join(cols) + "\n")
+            for r in results:
+                row = dict(r["thresholds"], **r)
+                f.write(",".join("" if row.get(c) is None else str(row.get(c)) for c in cols) + "\n")
+        print(f"All combinations written to {args.csv}")
+
+    if not args.no_check:
+        # the same answers as the per-reading path, on a slice small enough to replay one by one
+        keep = (data["pet_id"] <= data["pet_id"].min() + 1) & (data["ts"] < data["ts"].min() + 5 * 86400)
+        part = {k: v[keep] for k, v in data.items()}
+        small = Replay(part, grid)
+        checked = small.combinations()[::max(1, len(combos) // 4)]
+        for combo in checked:
+            t = small.thresholds(combo)
+            fast = small.alerts(combo)
+            ref = scalar_alerts(part, t)
+            ranks = np.searchsorted(small.pets, [p for p, _ in ref])
+            ref_keys = [int(r * small.stride + ts - part["ts"].min()) for r, (_, ts) in zip(ranks, ref)]
+            assert list(fast) == ref_keys, (t, len(fast), len(ref_keys))
+        print(f"Scalar cross-check: {len(checked)} combinations over {len(part['ts']):,} readings give "
+              f"identical alerts")
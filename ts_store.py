@@ -0,0 +1,365 @@
+#append-only columnar time-series store for collar readings (CPython host, NumPy)
+#
+# Each store is a directory of fixed-capacity chunk files. A chunk holds every
+# column back to back and is memory-mapped; index.json keeps the row count and
+# per-column min/max of every chunk so range scans only open chunks that can
+# match. 1-minute and 1-hour rollups are columnar stores of mergeable partial
+# aggregates, updated as data is appended.
+#
+#   python ts_store.py --rows 100000000 --path /data/bench_store
+
+import json
+import os
+
+import numpy as np
+
+RAW_SCHEMA = (
+    ("ts", "<i8"),
+    ("lat", "<f8"),
+    ("lon", "<f8"),
+    ("pet_id", "<u4"),
+    ("motion", "<f4"),
+    ("heart_rate", "<u2"),
+    ("spo2", "u1"),
+)
+
+ROLLUP_SCHEMA = (
+    ("bucket", "<i8"),
+    ("spo2_sum", "<f8"),
+    ("hr_sum", "<f8"),
+    ("motion_sum", "<f8"),
+    ("pet_id", "<u4"),
+    ("count", "<u4"),
+    ("spo2_n", "<u4"),
+    ("hr_n", "<u4"),
+    ("motion_max", "<f4"),
+    ("hr_min", "<u2"),
+    ("hr_max", "<u2"),
+    ("spo2_min", "u1"),
+    ("spo2_max", "u1"),
+)
+
+# how partial rollup rows combine
+ROLLUP_MERGE = {
+    "count": np.add, "spo2_n": np.add, "spo2_sum": np.add,
+    "hr_n": np.add, "hr_sum": np.add, "motion_sum": np.add,
+    "spo2_min": np.minimum, "spo2_max": np.maximum,
+    "hr_min": np.minimum, "hr_max": np.maximum,
+    "motion_max": np.maximum,
+}
+
+RESOLUTIONS = {"1m": 60, "1h": 3600}
+
+
+class ColumnStore:
+    """Chunked, memory-mapped, append-only column store"""
+
+    def __init__(self, path, schema, sort_key, chunk_rows=1 << 20):
+        self.path = path
+        self.schema = tuple((name, np.dtype(dt)) for name, dt in schema)
+        self.sort_key = sort_key
+        self.chunk_rows = chunk_rows
+        os.makedirs(path, exist_ok=True)
+
+        self.offsets = {}
+        offset = 0
+        for name, dt in self.schema:
+            offset = (offset + 7) & ~7
+            self.offsets[name] = offset
+            offset += dt.itemsize * chunk_rows
+        self.chunk_bytes = offset
+
+        self.index = []
+        self._maps = {}
+        index_path = os.path.join(path, "index.json")
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                meta = json.load(f)
+            if meta["chunk_rows"] != chunk_rows or meta["columns"] != [n for n, _ in self.schema]:
+                raise ValueError(f"{path}: store layout does not match")
+            self.index = meta["chunks"]
+
+    @property
+    def rows(self):
+        return sum(c["rows"] for c in self.index)
+
+    def _chunk_file(self, i):
+        return os.path.join(self.path, f"chunk_{i:06d}.col")
+
+    def _columns(self, i):
+        cols = self._maps.get(i)
+        if cols is None:
+            name = self._chunk_file(i)
+            if not os.path.exists(name):
+                with open(name, "wb") as f:
+                    f.truncate(self.chunk_bytes)
+            mm = np.memmap(name, dtype=np.uint8, mode="r+", shape=(self.chunk_bytes,))
+            cols = {"_mm": mm}
+            for col, dt in self.schema:
+                start = self.offsets[col]
+                cols[col] = mm[start:start + dt.itemsize * self.chunk_rows].view(dt)
+            self._maps[i] = cols
+        return cols
+
+    def append(self, data):
+        n = len(data[self.sort_key])
+        done = 0
+        while done < n:
+            if not self.index or self.index[-1]["rows"] == self.chunk_rows:
+                self.index.append({"rows": 0, "min": {}, "max": {}, "sorted": True})
+            i = len(self.index) - 1
+            meta = self.index[i]
+            cols = self._columns(i)
+            start = meta["rows"]
+            take = min(n - done, self.chunk_rows - start)
+            for col, dt in self.schema:
+                values = np.asarray(data[col][done:done + take], dtype=dt)
+                cols[col][start:start + take] = values
+                lo = values.min().item()
+                hi = values.max().item()
+                if start:
+                    lo = min(lo, meta["min"][col])
+                    hi = max(hi, meta["max"][col])
+                meta["min"][col] = lo
+                meta["max"][col] = hi
+            if meta["sorted"]:
+                key = cols[self.sort_key][max(0, start - 1):start + take]
+                meta["sorted"] = bool(np.all(key[1:] >= key[:-1]))
+            meta["rows"] = start + take
+            done += take
+
+    def chunks(self, ranges):
+        """Ids of chunks whose min/max can satisfy every (lo, hi) in ranges"""
+        for i, meta in enumerate(self.index):
+            if not meta["rows"]:
+                continue
+            if all(meta["min"][col] <= hi and meta["max"][col] >= lo
+                   for col, (lo, hi) in ranges.items()):
+                yield i
+
+    def select(self, ranges, columns):
+        """Rows inside every (lo, hi) range, as a dict of column arrays"""
+        parts = {col: [] for col in columns}
+        for i in self.chunks(ranges):
+            meta = self.index[i]
+            cols = self._columns(i)
+            lo_row, hi_row = 0, meta["rows"]
+            if meta["sorted"] and self.sort_key in ranges:
+                lo, hi = ranges[self.sort_key]
+                key = cols[self.sort_key][:hi_row]
+                lo_row = int(np.searchsorted(key, lo, "left"))
+                hi_row = int(np.searchsorted(key, hi, "right"))
+            if lo_row >= hi_row:
+                continue
+            keep = None
+            for col, (lo, hi) in ranges.items():
+                values = cols[col][lo_row:hi_row]
+                cond = (values >= lo) & (values <= hi)
+                keep = cond if keep is None else keep & cond
+            for col in columns:
+                parts[col].append(cols[col][lo_row:hi_row][keep])
+        dtypes = dict(self.schema)
+        return {col: np.concatenate(parts[col]) if parts[col] else np.empty(0, dtypes[col])
+                for col in columns}
+
+    def flush(self):
+        for cols in self._maps.values():
+            cols["_mm"].flush()
+        tmp = os.path.join(self.path, "index.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"chunk_rows": self.chunk_rows,
+                       "columns": [n for n, _ in self.schema],
+                       "chunks": self.index}, f)
+        os.replace(tmp, os.path.join(self.path, "index.json"))
+
+    def close(self):
+        self.flush()
+        self._maps.clear()
+
+
+def _group(key, table, merge):
+    """Reduce rows of a column table that share the same uint64 key"""
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+    starts = np.concatenate(([0], np.flatnonzero(key[1:] != key[:-1]) + 1))
+    out = {}
+    for col, values in table.items():
+        values = values[order]
+        op = merge.get(col)
+        out[col] = op.reduceat(values, starts) if op else values[starts]
+    return key[starts], out
+
+
+def _rollup_key(pet_id, bucket):
+    return (pet_id.astype(np.uint64) << np.uint64(32)) | bucket.astype(np.uint64)
+
+
+class TimeSeriesStore:
+    """(pet_id, ts, spo2, heart_rate, motion, lat, lon) with 1m/1h rollups"""
+
+    def __init__(self, path, chunk_rows=1 << 20, rollup_chunk_rows=1 << 18):
+        self.path = path
+        self.raw = ColumnStore(os.path.join(path, "raw"), RAW_SCHEMA, "ts", chunk_rows)
+        self.rollups = {}
+        self.pending = {}
+        for name in RESOLUTIONS:
+            self.rollups[name] = ColumnStore(os.path.join(path, "rollup_" + name),
+                                             ROLLUP_SCHEMA, "bucket", rollup_chunk_rows)
+            self.pending[name] = None
+
+    def append(self, pet_id, ts, spo2, heart_rate, motion, lat=None, lon=None):
+        pet_id = np.asarray(pet_id, dtype=np.uint32)
+        ts = np.asarray(ts, dtype=np.int64)
+        spo2 = np.asarray(spo2, dtype=np.uint8)
+        heart_rate = np.asarray(heart_rate, dtype=np.uint16)
+        motion = np.asarray(motion, dtype=np.float32)
+        n = len(ts)
+        if n == 0:
+            return
+        nan = np.full(n, np.nan)
+        self.raw.append({
+            "pet_id": pet_id, "ts": ts, "spo2": spo2, "heart_rate": heart_rate,
+            "motion": motion,
+            "lat": nan if lat is None else lat,
+            "lon": nan if lon is None else lon,
+        })
+
+        spo2_ok = spo2 > 0
+        hr_ok = heart_rate > 0
+        partial = {
+            "pet_id": pet_id,
+            "count": np.ones(n, np.uint32),
+            "spo2_n": spo2_ok.astype(np.uint32),
+            "spo2_sum": np.where(spo2_ok, spo2, 0).astype(np.float64),
+            "spo2_min": np.where(spo2_ok, spo2, 255).astype(np.uint8),
+            "spo2_max": spo2,
+            "hr_n": hr_ok.astype(np.uint32),
+            "hr_sum": heart_rate.astype(np.float64),
+            "hr_min": np.where(hr_ok, heart_rate, 65535).astype(np.uint16),
+            "hr_max": heart_rate,
+            "motion_sum": motion.astype(np.float64),
+            "motion_max": motion,
+        }
+        for name, seconds in RESOLUTIONS.items():
+            table = dict(partial)
+            table["bucket"] = ts - ts % seconds
+            self._merge_pending(name, table)
+
+    def _merge_pending(self, name, table):
+        pending = self.pending[name]
+        if pending is not None:
+            table = {col: np.concatenate((pending[col], table[col])) for col in table}
+        key, table = _group(_rollup_key(table["pet_id"], table["bucket"]), table, ROLLUP_MERGE)
+        # rows are sorted by (pet, bucket); the last row of each pet is its
+        # still-open bucket, everything before it is closed and can be written
+        pet = table["pet_id"]
+        last = np.ones(len(pet), dtype=bool)
+        last[:-1] = pet[1:] != pet[:-1]
+        closed = ~last
+        if closed.any():
+            self.rollups[name].append({col: v[closed] for col, v in table.items()})
+        self.pending[name] = {col: v[last] for col, v in table.items()}
+
+    def scan(self, pet_id, t0, t1, columns=("ts", "heart_rate")):
+        """Raw rows of one pet with t0 <= ts <= t1"""
+        return self.raw.select({"ts": (t0, t1), "pet_id": (pet_id, pet_id)}, columns)
+
+    def rollup(self, pet_id, t0, t1, resolution="1h"):
+        """Merged rollup rows of one pet for buckets starting in [t0, t1]"""
+        seconds = RESOLUTIONS[resolution]
+        t0 -= t0 % seconds
+        cols = [name for name, _ in ROLLUP_SCHEMA]
+        rows = self.rollups[resolution].select({"bucket": (t0, t1), "pet_id": (pet_id, pet_id)}, cols)
+        pending = self.pending[resolution]
+        if pending is not None:
+            keep = (pending["pet_id"] == pet_id) & (pending["bucket"] >= t0) & (pending["bucket"] <= t1)
+            rows = {col: np.concatenate((rows[col], pending[col][keep])) for col in cols}
+        if not len(rows["bucket"]):
+            return rows
+        _, rows = _group(rows["bucket"].astype(np.uint64), rows, ROLLUP_MERGE)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rows["spo2_mean"] = rows["spo2_sum"] / rows["spo2_n"]
+            rows["hr_mean"] = rows["hr_sum"] / rows["hr_n"]
+            rows["motion_mean"] = rows["motion_sum"] / rows["count"]
+        return rows
+
+    def flush(self):
+        """Persist everything, including still-open rollup buckets as partial rows"""
+        for name, pending in self.pending.items():
+            if pending is not None and len(pending["bucket"]):
+                self.rollups[name].append(pending)
+            self.pending[name] = None
+        self.raw.flush()
+        for store in self.rollups.values():
+            store.flush()
+
+    def close(self):
+        self.flush()
+        self.raw.close()
+        for store in self.rollups.values():
+            store.close()
+
+
+if __name__ == '__main__':
+    import argparse
+    import shutil
+    import tempfile
+    import time
+
+    parser = argparse.ArgumentParser(description="Ingest/query benchmark for the columnar store")
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--pets", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=200_000)
+    parser.add_argument("--path", help="store directory (default: a temp dir, removed afterwards)")
+    args = parser.parse_args()
+
+    path = args.path or tempfile.mkdtemp(prefix="ts_store_")
+    rng = np.random.default_rng(3)
+    store = TimeSeriesStore(path)
+
+    # every pet reports every 3 s; rows arrive in time order, pets interleaved
+    t_start = 1_700_000_000
+    per_step = args.pets
+    start = time.perf_counter()
+    written = 0
+    while written < args.rows:
+        n = min(args.batch, args.rows - written)
+        idx = np.arange(written, written + n)
+        pet = (idx % per_step + 1).astype(np.uint32)
+        ts = t_start + (idx // per_step) * 3
+        store.append(pet, ts,
+                     rng.integers(90, 100, n, dtype=np.uint8),
+                     rng.integers(60, 140, n, dtype=np.uint16),
+                     rng.random(n, dtype=np.float32) * 3,
+                     12.97 + rng.random(n) * 1e-3, 77.59 + rng.random(n) * 1e-3)
+        written += n
+    store.flush()
+    ingest = time.perf_counter() - start
+    t_end = int(t_start + ((args.rows - 1) // per_step) * 3)
+    print(f"Ingested {args.rows:,} rows in {ingest:.1f} s ({args.rows / ingest:,.0f} rows/s), "
+          f"{len(store.raw.index)} raw chunks")
+
+    week = 7 * 24 * 3600
+    pet = args.pets // 2
+    for label, fn in (
+        ("raw scan, last 7 days HR", lambda: store.scan(pet, t_end - week, t_end, ("ts", "heart_rate"))),
+        ("raw scan, last 1 hour HR", lambda: store.scan(pet, t_end - 3600, t_end, ("ts", "heart_rate"))),
+        ("1h rollup, last 7 days", lambda: store.rollup(pet, t_end - week, t_end, "1h")),
+        ("1m rollup, last 24 hours", lambda: store.rollup(pet, t_end - 86400, t_end, "1m")),
+    ):
+        fn()
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        rows = len(next(iter(result.values())))
+        print(f"   {label:28} {elapsed * 1000:8.1f} ms  ({rows:,} rows)")
+
+    t0 = (t_end - 3600) // 60 * 60
+    check = store.scan(pet, t0, t_end, ("ts", "heart_rate"))
+    roll = store.rollup(pet, t0, t_end, "1m")
+    assert int(roll["count"].sum()) == len(check["ts"])
+    assert abs(roll["hr_sum"].sum() - check["heart_rate"].astype(np.float64).sum()) < 1e-6
+
+    store.close()
+    if not args.path:
+        shutil.rmtree(path)
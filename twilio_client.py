@@ -1,24 +1,195 @@
 
 
-import urequests
-import ubinascii
-import time
+try:
+    import ubinascii
+except ImportError:
+    import binascii as ubinascii
+
+try:
+    import micropython
+except ImportError:
+    class micropython:
+        """CPython stand-in: the decorator must be spelled @micropython.native for the compiler to see it"""
+
+        @staticmethod
+        def native(f):
+            return f
+
+
+def _wrap_tls(sock, host, cadata=None, insecure=False):
+    """TLS with the server verified against cadata (DER root certificate).
+
+    CPython verifies against the system store when cadata is None. A port
+    with no store needs cadata, or insecure=True to skip verification
+    explicitly; anything else is refused rather than sending the auth
+    header to an unverified peer.
+    """
+    import ssl
+    if hasattr(ssl, "create_default_context"):
+        ctx = ssl.create_default_context(cadata=cadata)
+        if insecure:
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+        return ctx.wrap_socket(sock, server_hostname=host)
+    if cadata is None and not insecure:
+        raise OSError("TLS: no CA certificate to verify the server (see TWILIO_CA_FILE)")
+    if hasattr(ssl, "SSLContext"):
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        if cadata is None:
+            ctx.verify_mode = ssl.CERT_NONE
+        else:
+            ctx.load_verify_locations(cadata=cadata)
+            ctx.verify_mode = ssl.CERT_REQUIRED
+        return ctx.wrap_socket(sock, server_hostname=host)
+    if cadata is None:
+        return ssl.wrap_socket(sock, server_hostname=host)
+    return ssl.wrap_socket(sock, server_hostname=host, cert_reqs=ssl.CERT_REQUIRED, cadata=cadata)
+
+
+def load_ca(path):
+    """Read a DER certificate for _wrap_tls; OSError if missing, ValueError if it is not DER"""
+    with open(path, "rb") as f:
+        data = f.read()
+    # a certificate is one SEQUENCE with a two-byte length covering the rest
+    if len(data) < 4 or data[0] != 0x30 or data[1] != 0x82 or ((data[2] << 8) | data[3]) + 4 != len(data):
+        raise ValueError(f"{path} is not a DER certificate (PEM? convert with openssl x509 -outform der)")
+    return data
+
+
+def _encode_table():
+    table = [None] * 256
+    for ch in " +:/?=&#":
+        table[ord(ch)] = ("%%%02X" % ord(ch)).encode()
+    return tuple(table)
+
+
+# byte -> its %XX escape, or None to copy it as is: the same eight characters
+# the original chain of str.replace calls escaped, UTF-8 passes through
+_ENCODE = _encode_table()
+_CALLBACK_EVENTS = b"&StatusCallbackEvent=initiated,ringing,answered,completed"
+
+
+@micropython.native
+def _encode_bytes(buf, pos, data, table):
+    for b in data:
+        esc = table[b]
+        if esc is None:
+            buf[pos] = b
+            pos += 1
+        else:
+            buf[pos] = esc[0]
+            buf[pos + 1] = esc[1]
+            buf[pos + 2] = esc[2]
+            pos += 3
+    return pos
+
+
+def encode_into(buf, pos, value):
+    """Form-encode value into buf at pos in one pass; returns the new end.
+
+    Nothing is allocated for bytes input; buf grows first if the worst case
+    (every byte escaped) would not fit.
+    """
+    data = value if isinstance(value, (bytes, bytearray)) else str(value).encode()
+    if pos + 3 * len(data) > len(buf):
+        buf.extend(bytes(pos + 3 * len(data) - len(buf)))
+    return _encode_bytes(buf, pos, data, _ENCODE)
+
+
+class _Template:
+    """A form POST to one URL: request line and headers pre-encoded, body built in a reused buffer"""
+
+    def __init__(self, url, auth_header, size=512, method="POST"):
+        scheme, _, rest = url.partition("://")
+        hostport, _, path = rest.partition("/")
+        host, _, port = hostport.partition(":")
+        self.host = host
+        self.tls = scheme == "https"
+        self.port = int(port) if port else (443 if self.tls else 80)
+        self.head = (f"{method} /{path} HTTP/1.0\r\nHost: {host}\r\nAuthorization: {auth_header}\r\n"
+                     f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: ").encode()
+        self.body = bytearray(size)
+        self.out = bytearray(len(self.head) + 8 + size)
+        self.n = 0
+
+    def reset(self):
+        self.n = 0
+
+    def raw(self, data):
+        """Append pre-encoded bytes (or a str sent unescaped, like the TwiML URL)"""
+        if isinstance(data, str):
+            data = data.encode()
+        end = self.n + len(data)
+        if end > len(self.body):
+            self.body.extend(bytes(end - len(self.body)))
+        self.body[self.n:end] = data
+        self.n = end
+
+    def field(self, value):
+        self.n = encode_into(self.body, self.n, value)
+
+    def request(self):
+        """The full request as a view of the output buffer"""
+        head = self.head
+        length = str(self.n).encode()
+        total = len(head) + len(length) + 4 + self.n
+        out = self.out
+        if total > len(out):
+            out.extend(bytes(total - len(out)))
+        pos = len(head)
+        out[0:pos] = head
+        out[pos:pos + len(length)] = length
+        pos += len(length)
+        out[pos:pos + 4] = b"\r\n\r\n"
+        pos += 4
+        out[pos:pos + self.n] = memoryview(self.body)[:self.n]
+        return memoryview(out)[:total]
+
+
+class _Response:
+    """The parts of a urequests response the client uses"""
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode()
+
+    def json(self):
+        import json
+        return json.loads(self.content)
+
+    def close(self):
+        pass
 
 
 class TwilioClient:
     
 
-    def __init__(self, account_sid, auth_token, from_number, api_url):
+    def __init__(self, account_sid, auth_token, from_number, api_url, sms_api_url=None, timeout=15,
+                 cadata=None, tls_insecure=False):
         self.account_sid = account_sid
         self.auth_token = auth_token
         self.from_number = from_number
         self.api_url = api_url
+        self.timeout = timeout
+        self.cadata = cadata
+        self.tls_insecure = tls_insecure
 
         
-        self.sms_api_url = f"https://studio.twilio.com/v2/Flows/FW35cf5ad3c9254a540a1023c364ec8f6c"
+        self.sms_api_url = sms_api_url or f"https://studio.twilio.com/v2/Flows/FW35cf5ad3c9254a540a1023c364ec8f6c"
 
         
         self.auth_header = self._create_auth_header()
+
+        # static fields encoded once; only To, the TwiML URL and the message vary
+        self._call_req = _Template(self.api_url, self.auth_header)
+        self._sms_req = _Template(self.sms_api_url, self.auth_header)
+        frm = self._url_encode(self.from_number).encode()
+        self._call_from = b"&From=" + frm + b"&Url="
+        self._sms_from = b"&From=" + frm + b"&Body="
     
     def _create_auth_header(self):
         credentials = f"{self.account_sid}:{self.auth_token}"
@@ -26,43 +197,74 @@ class TwilioClient:
         encoded = ubinascii.b2a_base64(credentials.encode()).decode().strip()
         return f"Basic {encoded}"
     
-    def make_call(self, to_number, twiml_url, status_callback=None):
-        
-        
-        payload = {
-            "To": to_number,
-            "From": self.from_number,
-            "Url": twiml_url,
-        }
+    def _post(self, req, trace=None, stage=""):
+        """Send a built _Template over a raw (TLS) socket so a trace can mark connect, send and response.
+
+        http:// URLs skip TLS, for local stand-ins. Marks are stage + "_connect",
+        "_send" and "_response" (the status line arrived).
+        """
+        import socket
+        addr = socket.getaddrinfo(req.host, req.port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(addr)
+            if req.tls:
+                sock = _wrap_tls(sock, req.host, self.cadata, self.tls_insecure)
+            if trace:
+                trace.mark(stage + "_connect")
+            stream = sock.makefile("rwb") if hasattr(sock, "makefile") else sock
+            stream.write(req.request())
+            if hasattr(stream, "flush"):
+                stream.flush()
+            if trace:
+                trace.mark(stage + "_send")
+            status = int(stream.readline().split(None, 2)[1])
+            if trace and status == 201:
+                trace.mark(stage + "_response")
+            length = None
+            while True:
+                line = stream.readline()
+                if not line or line == b"\r\n":
+                    break
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            content = stream.read(length) if length is not None else stream.read()
+            return _Response(status, content)
+        finally:
+            sock.close()
 
+    def build_call(self, to_number, twiml_url, status_callback=None):
+        # Url and StatusCallback go out unescaped, as Twilio has always received them
+        req = self._call_req
+        req.reset()
+        req.raw(b"To=")
+        req.field(to_number)
+        req.raw(self._call_from)
+        req.raw(twiml_url)
         if status_callback:
-            payload["StatusCallback"] = status_callback
-            payload["StatusCallbackEvent"] = "initiated,ringing,answered,completed"
+            req.raw(b"&StatusCallback=")
+            req.raw(status_callback)
+            req.raw(_CALLBACK_EVENTS)
+        return req
 
-        headers = {
-            "Authorization": self.auth_header,
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
+    def build_sms(self, to_number, message):
+        req = self._sms_req
+        req.reset()
+        req.raw(b"To=")
+        req.field(to_number)
+        req.raw(self._sms_from)
+        req.field(message)
+        return req
 
-        body_parts = []
-        for k, v in payload.items():
-            if k in ["Url", "StatusCallback"]:
-            
-                body_parts.append(f"{k}={v}")
-            else:
-            
-                body_parts.append(f"{k}={self._url_encode(v)}")
-        body = "&".join(body_parts)
-        
+    def make_call(self, to_number, twiml_url, status_callback=None, trace=None):
+        req = self.build_call(to_number, twiml_url, status_callback)
         try:
             print(f" Initiating call to {to_number}...")
             
          
-            response = urequests.post(
-                self.api_url,
-                data=body,
-                headers=headers
-            )
+            response = self._post(req, trace, "call")
             
             if response.status_code == 201:
                 
@@ -86,18 +288,9 @@ class TwilioClient:
             return None
     
     def _url_encode(self, value):
-
-        
-        value = str(value)
-        value = value.replace(" ", "%20")
-        value = value.replace("+", "%2B")
-        value = value.replace(":", "%3A")
-        value = value.replace("/", "%2F")
-        value = value.replace("?", "%3F")
-        value = value.replace("=", "%3D")
-        value = value.replace("&", "%26")
-        value = value.replace("#", "%23")
-        return value
+        data = str(value).encode()
+        buf = bytearray(3 * len(data))
+        return bytes(memoryview(buf)[:encode_into(buf, 0, data)]).decode()
     
     def test_connection(self):
        
@@ -105,9 +298,8 @@ class TwilioClient:
             print(" Testing Twilio connection...")
            
             test_url = f"https://api.twilio.com/2010-04-01/Accounts/{self.account_sid}.json"
-            headers = {"Authorization": self.auth_header}
-            
-            response = urequests.get(test_url, headers=headers)
+            # same verified TLS path as the alerts: this request carries the auth header too
+            response = self._post(_Template(test_url, self.auth_header, size=0, method="GET"))
             
             if response.status_code == 200:
                 print(" Twilio connection successful!")
@@ -122,33 +314,14 @@ class TwilioClient:
             print(f" Connection test failed: {e}")
             return False
 
-    def send_sms(self, to_number, message):
+    def send_sms(self, to_number, message, trace=None):
        
         print(f"\n Sending SMS to {to_number}...")
-
-        # Prepare request payload
-        payload = {
-            "To": to_number,
-            "From": self.from_number,
-            "Body": message
-        }
-
-        
-        body = "&".join([f"{k}={self._url_encode(v)}" for k, v in payload.items()])
-
-        
-        headers = {
-            "Authorization": self.auth_header,
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
+        req = self.build_sms(to_number, message)
 
         try:
             
-            response = urequests.post(
-                self.sms_api_url,
-                data=body,
-                headers=headers
-            )
+            response = self._post(req, trace, "sms")
 
             if response.status_code == 201:
               
@@ -188,3 +361,94 @@ class TwilioClient:
             print(f" Error sending SMS: {e}")
             return None
 
+
+
+if __name__ == '__main__':
+    # Build cost of one call and one SMS request, the old way (payload and
+    # header dicts, the str.replace chain, header concatenation) against the
+    # templates. Runs on CPython and on the MicroPython unix port; the
+    # allocation figure is tracemalloc's peak on CPython and gc.mem_alloc()
+    # growth with the collector off on MicroPython, where the encoder is
+    # compiled to machine code; on CPython it is an interpreted byte loop.
+    import gc
+    import random
+    from clock import ticks_us, ticks_diff
+
+    def replace_chain(value):
+        value = str(value)
+        for a, b in ((" ", "%20"), ("+", "%2B"), (":", "%3A"), ("/", "%2F"),
+                     ("?", "%3F"), ("=", "%3D"), ("&", "%26"), ("#", "%23")):
+            value = value.replace(a, b)
+        return value
+
+    def legacy_request(url, auth, payload, raw=()):
+        headers = {"Authorization": auth, "Content-Type": "application/x-www-form-urlencoded"}
+        body = "&".join([f"{k}={v if k in raw else replace_chain(v)}" for k, v in payload.items()]).encode()
+        scheme, _, rest = url.partition("://")
+        hostport, _, path = rest.partition("/")
+        host = hostport.partition(":")[0]
+        head = f"POST /{path} HTTP/1.0\r\nHost: {host}\r\nContent-Length: {len(body)}\r\n"
+        for k, v in headers.items():
+            head += f"{k}: {v}\r\n"
+        return head.encode() + b"\r\n" + body
+
+    client = TwilioClient("AC" + "0" * 32, "f" * 32, "+15550001111",
+                          "https://api.twilio.com/2010-04-01/Accounts/AC/Calls.json")
+    to = "+15552223333"
+    twiml = "http://twimlets.com/message?Message=Alert"
+    message = (" PET HEALTH ALERT!\n\nHealth Issues:\n• Low SpO2: 87%\n• High heart rate: 182 BPM (usual 96)\n"
+               "\n GPS Location:\nLatitude: 37.774929°\nLongitude: -122.419416°\nAltitude: 16.0m\n"
+               "Satellites: 8\n\n View Location:\nhttps://www.google.com/maps?q=37.774929,-122.419416"
+               "\n\n Last 30 min: SpO2 96-98%, HR 88-104, motion 0.4-1.9")
+
+    # same bytes on the wire as the replace chain, for any input
+    random.seed(5)
+    alphabet = " +:/?=&#%,.-_~aZ09•°\n"
+    for _ in range(2000):
+        s = "".join(alphabet[random.randrange(len(alphabet))] for _ in range(random.randrange(40)))
+        assert client._url_encode(s) == replace_chain(s), s
+    body = legacy_request(client.sms_api_url, client.auth_header,
+                          {"To": to, "From": client.from_number, "Body": message}).split(b"\r\n\r\n", 1)[1]
+    assert bytes(client.build_sms(to, message).request()).split(b"\r\n\r\n", 1)[1] == body
+    body = legacy_request(client.api_url, client.auth_header,
+                          {"To": to, "From": client.from_number, "Url": twiml}, ("Url",)).split(b"\r\n\r\n", 1)[1]
+    assert bytes(client.build_call(to, twiml).request()).split(b"\r\n\r\n", 1)[1] == body
+
+    cases = (
+        ("call, old", lambda: legacy_request(client.api_url, client.auth_header,
+                                             {"To": to, "From": client.from_number, "Url": twiml}, ("Url",))),
+        ("call, template", lambda: client.build_call(to, twiml).request()),
+        ("SMS, old", lambda: legacy_request(client.sms_api_url, client.auth_header,
+                                            {"To": to, "From": client.from_number, "Body": message})),
+        ("SMS, template", lambda: client.build_sms(to, message).request()),
+    )
+    try:
+        import tracemalloc
+    except ImportError:
+        tracemalloc = None
+
+    def allocated(fn):
+        if tracemalloc:
+            tracemalloc.start()
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return peak
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        fn()
+        used = gc.mem_alloc() - before
+        gc.enable()
+        return used
+
+    n = 2000
+    print(f"Request is {len(message)} chars of SMS text; {n} builds each")
+    print(f"{'':16} {'us/request':>11} {'bytes allocated':>16}")
+    for name, fn in cases:
+        fn()
+        start = ticks_us()
+        for _ in range(n):
+            fn()
+        us = ticks_diff(ticks_us(), start) / n
+        print(f"{name:16} {us:11.1f} {allocated(fn):16,}")
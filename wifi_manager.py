@@ -0,0 +1,310 @@
+#non-blocking WiFi connection manager: background connect, cached BSSID/channel, reconnect with backoff
+
+import json
+
+from clock import ticks_ms, ticks_diff
+
+try:
+    import network
+except ImportError:
+    network = None
+
+IDLE = 0
+CONNECTING = 1
+CONNECTED = 2
+BACKOFF = 3
+
+STATE_NAMES = ("idle", "connecting", "connected", "backoff")
+
+
+class WifiManager:
+    """Drives a station interface from poll() calls; never waits on the radio.
+
+    The first connection on a new network scans once to learn the strongest
+    BSSID and its channel; both are cached in a file so later boots and
+    reconnects go straight to that access point. A failed attempt is retried
+    after an exponentially growing delay. The (blocking) scan is repeated only
+    after the cached AP has failed several times in a row and the scan finds
+    the network elsewhere. `connected` is cheap and safe to check before any
+    network I/O.
+    """
+
+    RESCAN_AFTER = 3
+
+    def __init__(self, ssid, password, wlan=None, cache_file="wifi.json",
+                 connect_timeout_ms=10000, backoff_min_ms=1000, backoff_max_ms=30000,
+                 power_save=False, ticks=ticks_ms):
+        if wlan is None:
+            wlan = network.WLAN(network.STA_IF)
+        self.wlan = wlan
+        self.ssid = ssid
+        self.password = password
+        self.cache_file = cache_file
+        self.connect_timeout_ms = connect_timeout_ms
+        self.backoff_min_ms = backoff_min_ms
+        self.backoff_max_ms = backoff_max_ms
+        self.power_save = power_save
+        self.ticks = ticks
+
+        self.state = IDLE
+        self.cache = self._load_cache()
+        self.using_cache = False
+        self.failures = 0
+        self.attempt_start = 0
+        self.retry_at = 0
+        self.last_change = 0
+
+        self.connects = 0
+        self.drops = 0
+        self.attempts = 0
+        self.last_connect_ms = None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file) as f:
+                cache = json.load(f)
+            if cache.get("ssid") == self.ssid:
+                return cache
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def _save_cache(self):
+        try:
+            with open(self.cache_file, "w") as f:
+                json.dump(self.cache, f)
+        except OSError as e:
+            print(f" WiFi cache not saved: {e}")
+
+    def _scan(self):
+        """Strongest AP advertising our SSID, as a cache entry (or None)"""
+        best = None
+        try:
+            for ssid, bssid, channel, rssi, _, _ in self.wlan.scan():
+                if ssid.decode() == self.ssid and (best is None or rssi > best[2]):
+                    best = (bssid, channel, rssi)
+        except OSError as e:
+            print(f" WiFi scan failed: {e}")
+        if best is None:
+            return None
+        return {"ssid": self.ssid, "bssid": best[0].hex(), "channel": best[1]}
+
+    def start(self):
+        self.wlan.active(True)
+        if self.power_save:
+            try:
+                self.wlan.config(pm=self.wlan.PM_POWERSAVE)
+            except (AttributeError, OSError, ValueError, TypeError):
+                pass
+        if self.wlan.isconnected():
+            self._connected(self.ticks())
+        else:
+            self._begin(self.ticks())
+
+    def stop(self):
+        """Disconnect and power the radio down; start() brings it back"""
+        try:
+            self.wlan.disconnect()
+        except OSError:
+            pass
+        self.wlan.active(False)
+        self.state = IDLE
+        self.last_change = self.ticks()
+
+    def _begin(self, now):
+        self.attempts += 1
+        self.attempt_start = now
+        self.state = CONNECTING
+        if self.cache is None or self.failures >= self.RESCAN_AFTER:
+            found = self._scan()
+            if found and (self.cache is None or found["bssid"] != self.cache["bssid"]):
+                self.cache = found
+                self.using_cache = False
+            else:
+                self.using_cache = self.cache is not None
+        else:
+            self.using_cache = True
+        try:
+            if self.cache:
+                try:
+                    self.wlan.config(channel=self.cache["channel"])
+                except (OSError, ValueError, TypeError):
+                    pass
+                self.wlan.connect(self.ssid, self.password, bssid=bytes.fromhex(self.cache["bssid"]))
+            else:
+                self.wlan.connect(self.ssid, self.password)
+        except OSError as e:
+            print(f" WiFi connect error: {e}")
+            self._failed(now)
+
+    def _connected(self, now):
+        self.state = CONNECTED
+        self.last_change = now
+        self.last_connect_ms = ticks_diff(now, self.attempt_start)
+        self.failures = 0
+        self.connects += 1
+        if self.cache and not self.using_cache:
+            self._save_cache()
+            self.using_cache = True
+
+    def _failed(self, now):
+        try:
+            self.wlan.disconnect()
+        except OSError:
+            pass
+        self.failures += 1
+        delay = min(self.backoff_max_ms, self.backoff_min_ms << min(self.failures - 1, 16))
+        self.retry_at = now + delay
+        self.state = BACKOFF
+        self.last_change = now
+
+    def _status_failed(self):
+        status = self.wlan.status()
+        for name in ("STAT_WRONG_PASSWORD", "STAT_NO_AP_FOUND", "STAT_CONNECT_FAIL"):
+            code = getattr(network, name, None) if network else None
+            if code is not None and status == code:
+                return True
+        return False
+
+    def poll(self):
+        """Advance the state machine; returns True while connected"""
+        now = self.ticks()
+        state = self.state
+        if state == CONNECTED:
+            if not self.wlan.isconnected():
+                print(" WiFi connection lost, reconnecting...")
+                self.drops += 1
+                self.last_change = now
+                self._begin(now)
+        elif state == CONNECTING:
+            if self.wlan.isconnected():
+                cached = self.using_cache
+                self._connected(now)
+                print(f" WiFi connected in {self.last_connect_ms} ms"
+                      f"{' (cached AP)' if cached else ''}")
+            elif self._status_failed() or ticks_diff(now, self.attempt_start) >= self.connect_timeout_ms:
+                self._failed(now)
+                print(f" WiFi connect failed, retry in {ticks_diff(self.retry_at, now) // 1000}s")
+        elif state == BACKOFF:
+            if ticks_diff(now, self.retry_at) >= 0:
+                self._begin(now)
+        return self.state == CONNECTED
+
+    @property
+    def connected(self):
+        if self.state == CONNECTED and not self.wlan.isconnected():
+            self.poll()
+        return self.state == CONNECTED
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self.state]
+
+    def ifconfig(self):
+        return self.wlan.ifconfig()
+
+
+if __name__ == '__main__':
+    # Scripted outages against a fake station interface on a virtual clock.
+    import os
+    import tempfile
+    import time
+
+    now = [0]
+
+    class FakeWLAN:
+        """Connect latency: 3.5 s with a full scan, 0.6 s with a known BSSID"""
+
+        def __init__(self, outages, bssid=b"\x10\x20\x30\x40\x50\x60", channel=6):
+            self.outages = outages
+            self.bssid = bssid
+            self.channel = channel
+            self.ready_at = None
+            self.up = False
+
+        def ap_up(self):
+            return not any(a <= now[0] < b for a, b in self.outages)
+
+        def active(self, value=None):
+            return True
+
+        def scan(self):
+            now[0] += 2000     # blocking scan
+            if not self.ap_up():
+                return []
+            return [(b"neighbour", b"\x01" * 6, 1, -80, 3, 0),
+                    (b"home", self.bssid, self.channel, -55, 3, 0)]
+
+        def config(self, **kwargs):
+            pass
+
+        def connect(self, ssid, password, bssid=None):
+            latency = 600 if bssid == self.bssid else 3500
+            self.ready_at = now[0] + latency
+
+        def disconnect(self):
+            self.ready_at = None
+            self.up = False
+
+        def status(self):
+            return 0
+
+        def isconnected(self):
+            if not self.ap_up():
+                self.up = False
+                self.ready_at = None
+            elif self.ready_at is not None and now[0] >= self.ready_at:
+                self.up = True
+            return self.up
+
+        def ifconfig(self):
+            return ("192.168.1.50", "255.255.255.0", "192.168.1.1", "192.168.1.1")
+
+    # AP drops for 7 s, 15 s and 2 minutes during a 10 minute run
+    outages = [(60000, 67000), (200000, 215000), (300000, 420000)]
+    cache = os.path.join(tempfile.mkdtemp(), "wifi.json")
+
+    for boot in ("cold boot (no cache)", "warm boot (cached AP)"):
+        now[0] = 0
+        wlan = FakeWLAN(outages)
+        wm = WifiManager("home", "secret", wlan, cache_file=cache, ticks=lambda: now[0])
+        wm.start()
+        first = None
+        online_ms = 0
+        worst_stall = 0
+        reconnects = []
+        backoffs = []
+        down_since = None
+        while now[0] < 600000:
+            # a 100 ms sensing tick; the manager only ever gets a poll() call
+            t = time.perf_counter()
+            before = now[0]
+            state = wm.state
+            connected = wm.poll()
+            if wm.state == BACKOFF and state != BACKOFF:
+                backoffs.append(ticks_diff(wm.retry_at, now[0]))
+            worst_stall = max(worst_stall, now[0] - before, (time.perf_counter() - t) * 1000)
+            if connected:
+                online_ms += 100
+                if first is None:
+                    first = now[0]
+                if down_since is not None:
+                    reconnects.append(now[0] - down_since)
+                    down_since = None
+            elif wlan.ap_up() and down_since is None and first is not None:
+                down_since = now[0]
+            now[0] += 100
+        print(f"{boot}:")
+        print(f"   online {first / 1000:.1f}s after boot, {wm.connects} connects, "
+              f"{wm.drops} drops, {wm.attempts} attempts")
+        print(f"   back online after the AP returned: {', '.join(f'{r / 1000:.1f}s' for r in reconnects)}")
+        print(f"   online {online_ms / 6000:.0f}% of 10 min, longest stall in the sensing loop "
+              f"{worst_stall:.0f} ms (blocking connect_wifi: up to 20000 ms)")
+        # the cached BSSID skips the 2 s scan and the 3.5 s full connect
+        assert first == (600 if boot.startswith("warm") else 2600), first
+        assert (wm.connects, wm.drops, wm.attempts) == (4, 3, 13)
+        assert reconnects == [4600, 8600, 3600], reconnects
+        # backoff doubles from 1 s per outage, capped at 30 s, and resets on connect
+        assert backoffs == [1000, 1000, 2000, 1000, 2000, 4000, 8000, 16000, 30000], backoffs
+        assert worst_stall < 2500, worst_stall
+    os.remove(cache)